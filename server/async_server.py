@@ -0,0 +1,232 @@
+#! /usr/bin/env python3
+"""
+Asyncio entry point of the game server, with python-socketio's AsyncServer running on an ASGI server (uvicorn).
+
+It serves the same events with the same handlers as `server.py`, see `core/game_server.py`, but every connection is a
+coroutine rather than a thread, so idle lobby connections only cost their socket buffers.
+
+Concurrency model:
+- Every handler runs on the single thread of the event loop. Handlers change the lobby, rooms and games
+  synchronously, so they never observe each other's partial changes. The lobby and room locks are still taken, since
+  the handlers are shared with the threaded `server.py`, but they are never contended.
+- Emits and changes to socket io rooms are queued by `AsyncTransport` while the state is changed, and only sent once
+  the handler returned, so that no await happens in the middle of a change. Clients detect missed or out of order
+  game deltas through `base_version` and request a snapshot.
+- CPU bound work, i.e. the searches of bots, runs in a process pool whose futures are awaited, so it never blocks the
+  event loop.
+
+Run in development, with debug logs and auto reload:
+
+    python async_server.py
+
+Run in production, with debug and reload off:
+
+    python async_server.py --production --host 0.0.0.0 --port 3001
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from concurrent.futures import Future
+from functools import partial
+from typing import Awaitable, Callable, List
+import json_fix
+import socketio
+import uvicorn
+from core import metrics
+from core.game_server import (
+    BackgroundTask,
+    GameServer,
+    Transport,
+    handlers,
+    install_profiling_signal_handler,
+)
+from core.profiling import profiler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# TODO(Change this to only allow certain origins depending on development/production)
+accepted_origins = "*"
+
+# Workers, persistence, timeouts, bots and rate limits are configured as in `server.py`, see the README
+message_queue = os.environ.get("SOCKETIO_MESSAGE_QUEUE")
+sio = socketio.AsyncServer(
+    async_mode="asgi",
+    cors_allowed_origins=accepted_origins,
+    client_manager=(
+        socketio.AsyncRedisManager(message_queue) if message_queue else None
+    ),
+)
+
+
+class AsyncTransport(Transport):
+    """
+    Transport of the asyncio server, whose handlers and background tasks run on the event loop.
+
+    Emits and changes to socket io rooms are queued, and sent in order by `flush`, which must be awaited right after
+    every handler and step of a background task, before any other await.
+    """
+
+    def __init__(self, sio: socketio.AsyncServer):
+        super().__init__(sio)
+        self.pending: List[Callable[[], Awaitable]] = []
+
+    def emit(self, event: str, data, room: str) -> None:
+        self.pending.append(partial(self.send, event, data, room))
+
+    async def send(self, event: str, data, room: str) -> None:
+        """
+        Emits an event and records its metrics.
+        """
+        with metrics.emit_duration.time(event):
+            await self.server.emit(event, data, to=room)
+        metrics.record_emit(event, data, self.count_participants(room))
+
+    def enter_room(self, sid: str, room: str) -> None:
+        self.pending.append(partial(self.server.enter_room, sid, room))
+
+    def leave_room(self, sid: str, room: str) -> None:
+        self.pending.append(partial(self.server.leave_room, sid, room))
+
+    def close_room(self, room: str) -> None:
+        self.pending.append(partial(self.server.close_room, room))
+
+    async def flush(self) -> None:
+        """
+        Sends what the last handler or step of a background task queued.
+        """
+        pending, self.pending = self.pending, []
+        for send in pending:
+            try:
+                await send()
+            except Exception:
+                logger.exception("Sending to clients failed")
+
+    def start_background_task(self, task: BackgroundTask):
+        return self.server.start_background_task(self.run_background_task, task)
+
+    async def run_background_task(self, task: BackgroundTask) -> None:
+        for wait in task:
+            await self.flush()
+            if isinstance(wait, Future):
+                await asyncio.wait([asyncio.wrap_future(wait)])
+            else:
+                await self.server.sleep(wait)
+        await self.flush()
+
+
+transport = AsyncTransport(sio)
+game_server = GameServer(transport)
+game_server.register_metrics()
+
+# Profiling is toggled with the `profiling` event, authenticated by PROFILING_TOKEN, or with SIGUSR2
+install_profiling_signal_handler()
+
+
+def register_handler(event: str) -> None:
+    """
+    Listens for a socket event, which is handled by `GameServer.handle`, and sends what the handler queued before
+    acknowledging the event.
+
+    Only the handler itself is profiled, since it runs on the thread of the event loop until it returns, unlike the
+    sends that follow.
+    """
+
+    @profiler.profile(event)
+    def handle(*args, sid):
+        return game_server.handle(event, sid, *args)
+
+    @metrics.instrument(event)
+    async def handler(sid, *args):
+        result = handle(*args, sid=sid)
+        await transport.flush()
+        return result
+
+    sio.on(event, handler)
+
+
+for event in handlers:
+    register_handler(event)
+
+
+def recover_rooms() -> None:
+    """
+    Restores the rooms and games of this worker from its action log, and resumes the turns of their bots.
+
+    Runs on the startup of the ASGI server, in the process that serves the app, and not in the supervisor process of
+    the auto reloader.
+    """
+    if game_server.action_log:
+        game_server.recover_rooms()
+
+
+def close_action_log() -> None:
+    if game_server.action_log:
+        game_server.action_log.close()
+
+
+async def serve_metrics(scope, receive, send) -> None:
+    """
+    ASGI app that serves the metrics of this worker in the Prometheus text format on `/metrics`, for the requests that
+    are neither socket io nor static files. Gauges are only computed when scraped.
+    """
+    if scope["type"] == "http" and scope["path"] == "/metrics":
+        status, content_type = 200, b"text/plain; version=0.0.4"
+        body = metrics.registry.render().encode()
+    else:
+        status, content_type, body = 404, b"text/plain", b"Not Found"
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type)],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+app = socketio.ASGIApp(
+    sio,
+    other_asgi_app=serve_metrics,
+    static_files={"/": os.path.join(os.path.dirname(__file__), "dist/")},
+    on_startup=recover_rooms,
+    on_shutdown=close_action_log,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Asyncio game server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        help="Turn off debug logging and auto reload",
+    )
+    args = parser.parse_args()
+
+    if args.production:
+        uvicorn.run(
+            app,
+            host=args.host,
+            port=args.port,
+            log_level="warning",
+            access_log=False,
+            reload=False,
+        )
+    else:
+        # Auto reload needs the app as an import string
+        uvicorn.run(
+            "async_server:app",
+            host=args.host,
+            port=args.port,
+            log_level="debug",
+            reload=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+#! /usr/bin/env python3
+"""
+Micro-benchmarks of the hot paths of the game engine and of the JSON encoding of games and rooms.
+
+Every benchmark is run `--repeat` times and the fastest run is kept, as the time per operation. Results can be saved
+as a baseline, and later runs compared to it, failing when any benchmark is slower than the baseline by more than
+`--max-slowdown`. Baselines are only comparable on the same machine and Python version, so save one before changing
+the engine and compare against it after. For example:
+
+    python benchmark.py --save /tmp/before.json
+    python benchmark.py --compare /tmp/before.json
+
+`benchmark_baseline.json` holds reference numbers of the current engine, measured on a single core VM. Timings on
+shared or throttled machines vary by 20% or more between runs, so raise `--repeat` there, or `--max-slowdown` in CI.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+from typing import Callable, List
+from core.base_player import BasePlayer
+from core.room import Room
+from four_players_three_in_a_row.board import Board, PackedBoard
+from four_players_three_in_a_row.game import Game
+from four_players_three_in_a_row.simulation import get_legal_action_list, to_action
+from four_players_three_in_a_row.utils import (
+    COLORS_ARRAY,
+    MAX_STACK_HEIGHT,
+    Action,
+)
+
+# A benchmark takes the number of operations to time and returns the number of seconds they took
+type Benchmark = Callable[[int], float]
+
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(name: str, number: int):
+    """
+    Registers a benchmark, timed over `number` operations per run.
+    """
+
+    def register(function):
+        function.number = number
+        BENCHMARKS[name] = function
+        return function
+
+    return register
+
+
+def new_game(num_players: int = 4, board_class=Board) -> Game:
+    return Game(
+        [BasePlayer(str(i), f"Player {i}", 0) for i in range(num_players)],
+        board_class=board_class,
+        max_rounds=sys.maxsize,
+    )
+
+
+def mid_game(board_class=Board) -> Game:
+    """
+    Returns a game after 12 random actions of a fixed seed that did not end the round, placing a single piece at a time
+    so that every player has pieces left.
+    """
+    rng = random.Random(0)
+    while True:
+        game = new_game(board_class=board_class)
+        for _ in range(12):
+            player_id = game.player_ids[game.current_turn]
+            action = rng.choice(
+                [
+                    action
+                    for action in get_legal_action_list(game, player_id)
+                    if action[0] != Action.PLACE or action[3] == 1
+                ]
+            )
+            if game.execute_action_for_player(player_id, to_action(action)):
+                break
+        else:
+            return game
+
+
+def full_game(board_class=Board) -> Game:
+    """
+    Returns a game whose board is full, with the colors on top arranged in 2 by 2 blocks so that no line is complete.
+    """
+    game = new_game(board_class=board_class)
+    n = game.grid_dimension
+    for row in range(n):
+        for col in range(n):
+            top = COLORS_ARRAY[(row // 2 * 2 + col // 2) % len(COLORS_ARRAY)]
+            for _ in range(MAX_STACK_HEIGHT - 1):
+                game.board.push(row, col, COLORS_ARRAY[(row + col) % 2])
+            game.board.push(row, col, top)
+    return game
+
+
+def time_calls(function: Callable[[], object], number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        function()
+    return time.perf_counter() - start
+
+
+def mark_game_dirty(game: Game) -> None:
+    game.mark_dirty()
+    game.board.mark_dirty()
+    for player in game.players.values():
+        player.mark_dirty()
+
+
+@benchmark("maybe_players_won/empty/full_scan", 20_000)
+def bench_won_empty_full_scan(number: int) -> float:
+    game = new_game()
+    return time_calls(game.maybe_players_won, number)
+
+
+@benchmark("maybe_players_won/mid/full_scan", 20_000)
+def bench_won_mid_full_scan(number: int) -> float:
+    game = mid_game()
+    return time_calls(game.maybe_players_won, number)
+
+
+@benchmark("maybe_players_won/mid/changed_cells", 50_000)
+def bench_won_mid_changed_cells(number: int) -> float:
+    game = mid_game()
+    return time_calls(lambda: game.maybe_players_won([(1, 1), (1, 2)]), number)
+
+
+@benchmark("maybe_players_won/full/full_scan", 20_000)
+def bench_won_full_full_scan(number: int) -> float:
+    game = full_game()
+    return time_calls(game.maybe_players_won, number)
+
+
+@benchmark("maybe_players_won/full/changed_cells", 50_000)
+def bench_won_full_changed_cells(number: int) -> float:
+    game = full_game()
+    return time_calls(lambda: game.maybe_players_won([(1, 1), (1, 2)]), number)
+
+
+@benchmark("maybe_players_won/full/full_scan/packed_board", 20_000)
+def bench_won_full_full_scan_packed(number: int) -> float:
+    game = full_game(PackedBoard)
+    return time_calls(game.maybe_players_won, number)
+
+
+@benchmark("execute_action/move", 20_000)
+def bench_execute_move(number: int) -> float:
+    # Two players move a piece back and forth, which returns the game to the same position every 4 actions
+    game = new_game(num_players=2)
+    first, second = game.player_ids
+    game.board.push(0, 0, game.players[first].color)
+    game.board.push(3, 3, game.players[second].color)
+    cycle = [
+        (first, (0, 0, 0, 1)),
+        (second, (3, 3, 3, 2)),
+        (first, (0, 1, 0, 0)),
+        (second, (3, 2, 3, 3)),
+    ]
+    actions = [
+        (
+            player_id,
+            to_action((Action.MOVE, *coordinates)),
+        )
+        for player_id, coordinates in cycle
+    ]
+
+    start = time.perf_counter()
+    for i in range(number):
+        player_id, action = actions[i % 4]
+        game.execute_action_for_player(player_id, action)
+    return time.perf_counter() - start
+
+
+@benchmark("execute_action/place", 20_000)
+def bench_execute_place(number: int) -> float:
+    # Placing uses up pieces, so the placed piece is taken back after every operation, outside of the timed section
+    game = mid_game()
+    player_id = game.player_ids[game.current_turn]
+    player = game.players[player_id]
+    turn = game.current_turn
+    _, row, col, _ = next(
+        action
+        for action in get_legal_action_list(game, player_id)
+        if action[0] == Action.PLACE
+    )
+    action = to_action((Action.PLACE, row, col, 1))
+
+    elapsed = 0.0
+    for _ in range(number):
+        start = time.perf_counter()
+        game.execute_action_for_player(player_id, action)
+        elapsed += time.perf_counter() - start
+
+        game.board.pop(row, col)
+        player.num_pieces += 1
+        game.current_turn = turn
+    return elapsed
+
+
+@benchmark("board/reset_board", 100_000)
+def bench_reset_board(number: int) -> float:
+    board = full_game().board
+    return time_calls(board.reset_board, number)
+
+
+@benchmark("board/reset_board/packed_board", 100_000)
+def bench_reset_packed_board(number: int) -> float:
+    board = full_game(PackedBoard).board
+    return time_calls(board.reset_board, number)
+
+
+@benchmark("game/start_new_round", 20_000)
+def bench_start_new_round(number: int) -> float:
+    game = mid_game()
+    return time_calls(game.start_new_round, number)
+
+
+@benchmark("json/game/uncached", 5_000)
+def bench_json_game_uncached(number: int) -> float:
+    game = mid_game()
+
+    def encode():
+        mark_game_dirty(game)
+        json.dumps(game)
+
+    return time_calls(encode, number)
+
+
+@benchmark("json/game/cached", 5_000)
+def bench_json_game_cached(number: int) -> float:
+    game = mid_game()
+    return time_calls(lambda: json.dumps(game), number)
+
+
+@benchmark("json/game/encoded", 100_000)
+def bench_json_game_encoded(number: int) -> float:
+    game = mid_game()
+    return time_calls(game.encoded, number)
+
+
+@benchmark("json/room/uncached", 10_000)
+def bench_json_room_uncached(number: int) -> float:
+    players = [BasePlayer(str(i), f"Player {i}", 0) for i in range(4)]
+    room = Room("room", players[0], 4)
+    for player in players[1:]:
+        room.add_player(player)
+
+    def encode():
+        room.mark_dirty()
+        for player in players:
+            player.mark_dirty()
+        json.dumps(room)
+
+    return time_calls(encode, number)
+
+
+def run_benchmarks(names: List[str], repeat: int, scale: float) -> dict[str, float]:
+    """
+    Returns the fastest time per operation of each benchmark, in seconds.
+    """
+    results = {}
+    for name in names:
+        function = BENCHMARKS[name]
+        number = max(1, int(function.number * scale))
+        # Like timeit, keep the garbage collector from adding noise to the timings
+        gc.disable()
+        try:
+            results[name] = min(function(number) for _ in range(repeat)) / number
+        finally:
+            gc.enable()
+    return results
+
+
+def format_time(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:8.2f} ms"
+    return f"{seconds * 1e6:8.2f} us"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--filter", default="", help="Only run the benchmarks whose name contains this"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiplies the number of operations per run",
+    )
+    parser.add_argument("--save", help="Save the results to this file")
+    parser.add_argument("--compare", help="Compare the results to this baseline file")
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=1.25,
+        help="Fail the comparison if a benchmark is slower than its baseline by more than this factor",
+    )
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    results = run_benchmarks(names, args.repeat, args.scale)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+
+    regressions = []
+    for name, seconds in results.items():
+        line = f"{name:<50} {format_time(seconds)}"
+        if name in baseline:
+            ratio = seconds / baseline[name]
+            line += f"  {ratio:5.2f}x baseline"
+            if ratio > args.max_slowdown:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+    if regressions:
+        print(
+            f"{len(regressions)} benchmark(s) regressed by more than {args.max_slowdown}x"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
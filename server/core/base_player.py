@@ -1,23 +1,61 @@
 import json_fix
+from core.serialization import CachedSerializable
 
 
-class BasePlayer:
-    def __init__(self, id: str, name: str, created_at: float):
+class BasePlayer(CachedSerializable):
+    def __init__(
+        self,
+        id: str,
+        name: str,
+        created_at: float,
+        is_bot: bool = False,
+        token: str | None = None,
+    ):
         self.id = id
         self.name = name
         self.created_at = created_at
         self.room_id = None
+        # Whether the player is played by the server rather than by a connected client
+        self.is_bot = is_bot
+        # Secret given to the client of a human player, with which it rejoins as the player from a new connection, e.g.
+        # after the server restarted. Never sent to other clients.
+        self.token = token
 
     def join_room(self, room_id: str):
         self.room_id = room_id
+        self.mark_dirty()
 
     def leave_room(self):
         self.room_id = None
+        self.mark_dirty()
 
-    def __json__(self):
+    def to_snapshot(self):
+        """
+        Returns the data needed to restore the player, see `from_snapshot`.
+        """
+        return {
+            "id": self.id,
+            "name": self.name,
+            "created_at": self.created_at,
+            "is_bot": self.is_bot,
+            "token": self.token,
+        }
+
+    @classmethod
+    def from_snapshot(cls, data) -> "BasePlayer":
+        return BasePlayer(
+            data["id"],
+            data["name"],
+            data["created_at"],
+            data["is_bot"],
+            data.get("token"),
+        )
+
+    def to_json(self):
         return {
             "id": self.id,
             "name": self.name,
             "created_at": self.created_at,
             "room_id": self.room_id,
+            "is_bot": self.is_bot,
         }
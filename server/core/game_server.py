@@ -0,0 +1,1067 @@
+import hmac
+import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Generator, Iterator, List, Mapping
+from core import metrics
+from core.base_player import BasePlayer
+from core.lobby import GameLobby, PlayerNotFound, RoomOnAnotherShard
+from core.persistence import ActionLog
+from core.profiling import install_signal_handler, profiler
+from core.rate_limit import (
+    MAX_QUEUED_MESSAGES,
+    RATE_LIMITS,
+    FetchCoalescer,
+    RateLimited,
+    RateLimiter,
+    SlowConsumers,
+)
+from core.reaper import (
+    FINISHED_ROOM_TIMEOUT,
+    IDLE_ROOM_TIMEOUT,
+    MAX_MISSED_TURNS,
+    REJOIN_TIMEOUT,
+    TURN_TIMEOUT,
+    Reaper,
+)
+from core.room import Room
+from core.serialization import serialization_cache_stats
+from core.spectators import (
+    SPECTATOR_UPDATES_PER_SECOND,
+    SpectatorFeed,
+    get_spectator_update,
+    spectator_room,
+)
+from core.state_store import InMemoryStateStore, SQLiteStateStore
+from four_players_three_in_a_row.bot import (
+    SearchState,
+    find_bot_action,
+    init_bot_process,
+    to_action,
+)
+from four_players_three_in_a_row.game import Game, GameState
+from four_players_three_in_a_row.utils import Action, Move
+
+logger = logging.getLogger(__name__)
+
+# Socket io room that every player in the lobby is subscribed to for room updates
+LOBBY_ROOM = "lobby"
+
+# Number of seconds between two rounds of matchmaking
+MATCHMAKING_TICK = 1.0
+
+# Number of seconds between two checks of whether slow clients caught up
+SLOW_CONSUMER_CHECK_INTERVAL = 1.0
+
+# Pages of `fetch_rooms` hold ROOMS_PAGE_SIZE rooms by default, and at most MAX_ROOMS_PAGE_SIZE rooms
+ROOMS_PAGE_SIZE = 50
+MAX_ROOMS_PAGE_SIZE = 200
+
+# Replays are streamed in chunks of REPLAY_CHUNK_SIZE moves by default, and of at most MAX_REPLAY_CHUNK_SIZE moves
+REPLAY_CHUNK_SIZE = 50
+MAX_REPLAY_CHUNK_SIZE = 500
+
+# Background tasks are generators that yield what they wait for between two steps: a number of seconds to sleep, or
+# the future of a bot search running in another process. Steps never yield while holding a lock.
+BackgroundTask = Generator[float | Future, None, None]
+
+# Handlers of the socket events of clients by event, registered with `on`
+handlers: dict[str, Callable] = {}
+
+
+def on(event: str):
+    """
+    Registers a method of `GameServer` as the handler of a socket event, which every server listens for.
+    """
+
+    def register(handler: Callable) -> Callable:
+        handlers[event] = handler
+        return handler
+
+    return register
+
+
+def install_profiling_signal_handler(environ: Mapping[str, str] = os.environ) -> None:
+    """
+    Toggles profiling on SIGUSR2, which profiles the comma separated PROFILE_EVENTS and PROFILE_ROOMS (every event and
+    room by default) and writes the stacks to PROFILE_DIR.
+
+    Signal handlers can only be installed from the main thread, so this does nothing when the server is imported from
+    another thread.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+
+    install_signal_handler(
+        profiler,
+        environ.get("PROFILE_DIR", tempfile.gettempdir()),
+        events=[e for e in environ.get("PROFILE_EVENTS", "").split(",") if e],
+        room_ids=[r for r in environ.get("PROFILE_ROOMS", "").split(",") if r],
+    )
+
+
+class Transport:
+    """
+    Socket io server through which a `GameServer` reaches its clients, i.e. python-socketio's `Server` of the Flask
+    server or `AsyncServer` of the asyncio server.
+
+    Emits and changes to socket io rooms may be sent later than they are made, e.g. once the handler returns, but must
+    be sent in the order they were made.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def emit(self, event: str, data, room: str) -> None:
+        """
+        Emits an event to a socket io room, i.e. a single client or the subscribers of a room.
+        """
+        raise NotImplementedError
+
+    def enter_room(self, sid: str, room: str) -> None:
+        raise NotImplementedError
+
+    def leave_room(self, sid: str, room: str) -> None:
+        raise NotImplementedError
+
+    def close_room(self, room: str) -> None:
+        raise NotImplementedError
+
+    def start_background_task(self, task: BackgroundTask):
+        """
+        Runs a background task, waiting for whatever it yields without blocking the handlers.
+        """
+        raise NotImplementedError
+
+    def count_participants(self, room: str) -> int:
+        return sum(1 for _ in self.server.manager.get_participants("/", room))
+
+    def queued_messages(self, room: str) -> Iterator[tuple[str, int]]:
+        """
+        Yields the socket id and the number of queued messages of every client of a socket io room connected to this
+        worker.
+        """
+        for sid, eio_sid in list(self.server.manager.get_participants("/", room)):
+            socket = self.server.eio.sockets.get(eio_sid)
+            if socket:
+                yield sid, socket.queue.qsize()
+
+    def count_queued_messages(self, sid: str) -> int | None:
+        """
+        Returns the number of messages queued for a client connected to this worker, or None if it is not connected.
+        """
+        eio_sid = self.server.manager.eio_sid_from_sid(sid, "/")
+        socket = self.server.eio.sockets.get(eio_sid) if eio_sid else None
+        return socket.queue.qsize() if socket else None
+
+    def is_connected(self, sid: str) -> bool:
+        return self.server.manager.is_connected(sid, "/")
+
+
+class GameServer:
+    """
+    Socket event handlers and background tasks of a worker, shared by the Flask (`server.py`) and asyncio
+    (`async_server.py`) servers, which only listen for the events of `handlers` and provide their `Transport`.
+
+    Handlers and the steps of background tasks are synchronous, and change the lobby, rooms and games under the lobby
+    lock, then the lock of a room. Updates are emitted while holding the lock of the room they belong to, so that they
+    are sent in the order of the changes, whether the transport sends them right away or once the handler returned.
+    """
+
+    def __init__(self, transport: Transport, environ: Mapping[str, str] = os.environ):
+        self.transport = transport
+
+        # To run several worker processes, start each one with the same NUM_WORKERS, STATE_STORE and
+        # SOCKETIO_MESSAGE_QUEUE and its own WORKER_ID. Rooms are assigned to workers by the hash of their id,
+        # STATE_STORE is the SQLite file through which workers share the list of rooms, and the message queue (e.g.
+        # redis://localhost:6379) relays emits so that they reach clients connected to any worker.
+        self.worker_id = int(environ.get("WORKER_ID", 0))
+        state_store_path = environ.get("STATE_STORE")
+
+        # Every change to the rooms of a worker is logged to its own directory of PERSISTENCE_DIR, from which its rooms
+        # and games are recovered after a restart
+        persistence_dir = environ.get("PERSISTENCE_DIR")
+        self.action_log = (
+            ActionLog(os.path.join(persistence_dir, f"worker-{self.worker_id}"))
+            if persistence_dir
+            else None
+        )
+
+        # Turns of human players are passed after TURN_TIMEOUT seconds, and players forfeit after MAX_MISSED_TURNS
+        # missed turns in a row. Rooms whose game has not started are deleted after IDLE_ROOM_TIMEOUT seconds without
+        # anyone joining or leaving, and rooms whose game is over after FINISHED_ROOM_TIMEOUT seconds. Players restored
+        # after a restart are removed unless their client rejoins within REJOIN_TIMEOUT seconds.
+        self.reaper = Reaper(
+            turn_timeout=float(environ.get("TURN_TIMEOUT", TURN_TIMEOUT)),
+            max_missed_turns=int(environ.get("MAX_MISSED_TURNS", MAX_MISSED_TURNS)),
+            idle_room_timeout=float(
+                environ.get("IDLE_ROOM_TIMEOUT", IDLE_ROOM_TIMEOUT)
+            ),
+            finished_room_timeout=float(
+                environ.get("FINISHED_ROOM_TIMEOUT", FINISHED_ROOM_TIMEOUT)
+            ),
+            rejoin_timeout=float(environ.get("REJOIN_TIMEOUT", REJOIN_TIMEOUT)),
+        )
+        self.reaper_task = None
+
+        self.lobby = GameLobby(
+            "FourPlayerThreeInARow",
+            4,
+            matchmaking_max_wait=30.0,
+            store=(
+                SQLiteStateStore(state_store_path)
+                if state_store_path
+                else InMemoryStateStore()
+            ),
+            shard_id=self.worker_id,
+            num_shards=int(environ.get("NUM_WORKERS", 1)),
+            action_log=self.action_log,
+            reaper=self.reaper,
+        )
+        self.matchmaking_task = None
+
+        # Bots search for their moves in a pool of BOT_PROCESSES processes, for at most BOT_MOVE_TIME seconds per
+        # move, so that they never take the CPU of the server process away from human games.
+        self.bot_processes = int(environ.get("BOT_PROCESSES", 1))
+        self.bot_move_time = float(environ.get("BOT_MOVE_TIME", 0.5))
+        self.bot_executor = None
+        # Ids of the rooms with a background task playing the turns of their bots. Only accessed while holding the
+        # room lock.
+        self.rooms_playing_bots: set[str] = set()
+
+        # Spectators receive coalesced updates of the games they watch on every tick of a background task, separately
+        # from the players, at most SPECTATOR_UPDATES_PER_SECOND times per second
+        self.spectator_feed = SpectatorFeed(
+            float(
+                environ.get(
+                    "SPECTATOR_UPDATES_PER_SECOND", SPECTATOR_UPDATES_PER_SECOND
+                )
+            )
+        )
+        self.spectator_task = None
+
+        # Events of every client are rate limited per event, unless RATE_LIMITS is off, e.g. for load testing.
+        # Clients with more than MAX_QUEUED_MESSAGES queued messages stop receiving broadcasts until their queue
+        # drained, and then receive a snapshot.
+        self.rate_limiter = RateLimiter(
+            {} if environ.get("RATE_LIMITS", "on") == "off" else RATE_LIMITS
+        )
+        self.fetch_coalescer = FetchCoalescer()
+        self.slow_consumers = SlowConsumers(
+            int(environ.get("MAX_QUEUED_MESSAGES", MAX_QUEUED_MESSAGES))
+        )
+        self.slow_consumer_task = None
+
+        # The `profiling` event is only available when PROFILING_TOKEN is set, and must send it
+        self.profiling_token = environ.get("PROFILING_TOKEN")
+
+    def handle(self, event: str, sid: str, *args):
+        """
+        Handles a socket event of a client with the handler registered for it, and reports any error to the client.
+
+        Events of clients exceeding the rate limit of the event are rejected before doing any work for them.
+        """
+        try:
+            self.rate_limiter.check(sid, event)
+            return handlers[event](self, sid, *args)
+        except RoomOnAnotherShard as err:
+            # The client has to connect to the worker that owns the room
+            self.send_invalid_request(sid, event, err, worker_id=err.shard)
+        except RateLimited as err:
+            self.send_invalid_request(sid, event, err)
+        except Exception as err:
+            logger.warning("Invalid %s request: %s", event, err)
+            self.send_invalid_request(sid, event, err)
+
+    def send_invalid_request(self, sid: str, event: str, err: Exception, **data):
+        """
+        Records the error of an event and reports it to the requesting client.
+        """
+        metrics.record_error(event, err)
+        self.transport.emit(
+            "invalid_request",
+            {"message": str(err), **data},
+            room=sid,  # Send only to the requesting client
+        )
+
+    def register_metrics(self) -> None:
+        """
+        Registers the gauges of the lobby, which are only computed when scraped.
+        """
+        lobby = self.lobby
+        metrics.registry.gauge(
+            "lobby_rooms", "Rooms of this worker.", lambda: len(lobby.rooms)
+        )
+        metrics.registry.gauge(
+            "lobby_open_rooms",
+            "Rooms that can be joined.",
+            lambda: len(lobby.open_rooms),
+        )
+        metrics.registry.gauge(
+            "lobby_players", "Players in the lobby.", lambda: len(lobby.all_players)
+        )
+        metrics.registry.gauge(
+            "lobby_games_in_progress",
+            "Games in progress.",
+            self.count_games_in_progress,
+        )
+        metrics.registry.gauge(
+            "matchmaking_queue_length",
+            "Players waiting to be matched.",
+            lambda: len(lobby.matchmaking),
+        )
+        metrics.registry.callback_counter(
+            "serialization_cache_hits_total",
+            "Serializations reused from the cache.",
+            lambda: serialization_cache_stats.hits,
+        )
+        metrics.registry.callback_counter(
+            "serialization_cache_misses_total",
+            "Serializations rebuilt.",
+            lambda: serialization_cache_stats.misses,
+        )
+
+    def count_games_in_progress(self) -> int:
+        return sum(
+            1
+            for room in list(self.lobby.rooms.values())
+            if room.game and room.game.game_state == GameState.IN_PROGRESS
+        )
+
+    def broadcast(self, event: str, data, room: str) -> None:
+        """
+        Emits an event to the subscribers of a room, except for the clients too slow to receive it, see
+        `SlowConsumers`.
+
+        Only for the lobby, game and spectator rooms, whose snapshot is sent to slow clients once they caught up.
+        """
+        self.detach_slow_clients(room)
+        self.transport.emit(event, data, room)
+
+    def detach_slow_clients(self, room: str) -> None:
+        """
+        Unsubscribes the clients with too many queued messages from a room, until they catch up.
+        """
+        for sid, num_queued in self.transport.queued_messages(room):
+            if not self.slow_consumers.is_slow(num_queued):
+                continue
+
+            self.transport.leave_room(sid, room)
+            self.slow_consumers.detach(sid, room)
+            metrics.slow_clients.inc()
+            if self.slow_consumer_task is None:
+                self.slow_consumer_task = self.transport.start_background_task(
+                    self.run_slow_consumer_ticks()
+                )
+
+    def run_slow_consumer_ticks(self) -> BackgroundTask:
+        """
+        Background task that subscribes the slow clients that caught up to the rooms they were unsubscribed from
+        again, and sends them a snapshot of each room.
+        """
+        while True:
+            yield SLOW_CONSUMER_CHECK_INTERVAL
+            caught_up = self.slow_consumers.take_caught_up(
+                self.transport.count_queued_messages
+            )
+            for sid, rooms in caught_up:
+                for room in rooms:
+                    try:
+                        self.resubscribe(sid, room)
+                    except Exception:
+                        logger.exception("Resubscribing a slow client failed")
+
+    def resubscribe(self, sid: str, room: str) -> None:
+        """
+        Subscribes a client to a room again, along with a snapshot of the room, if the client still belongs to it.
+        """
+        if room == LOBBY_ROOM:
+            if sid in self.lobby.all_players:
+                self.transport.enter_room(sid, room)
+                rooms = {data["id"]: data for data in self.lobby.list_room_data()}
+                self.transport.emit("rooms_snapshot", {"rooms": rooms}, room=sid)
+            return
+
+        room_id = room.removesuffix(spectator_room(""))
+        game_room = self.lobby.rooms.get(room_id)
+        if game_room is None:
+            return
+
+        # Subscribed and sent the snapshot while holding the lock of the room, so that the next update follows it
+        with game_room.lock:
+            if room == room_id and sid in game_room.players:
+                self.transport.enter_room(sid, room)
+                if game_room.game:
+                    self.transport.emit(
+                        "send_game_data", {"game": game_room.game.__json__()}, room=sid
+                    )
+            elif room == spectator_room(room_id) and sid in game_room.spectators:
+                self.transport.enter_room(sid, room)
+                if game_room.game:
+                    self.transport.emit(
+                        "spectator_game_data",
+                        {"room_id": room_id, "game": game_room.game.__json__()},
+                        room=sid,
+                    )
+
+    def run_matchmaking_ticks(self) -> BackgroundTask:
+        """
+        Background task that batches the players waiting in the matchmaking queue into rooms on every tick.
+
+        The players of each new room are subscribed to the room and notified with `matched`, and the lobby receives a
+        single `rooms_updated` event per tick with every new room, rather than one event per join.
+        """
+        while True:
+            yield MATCHMAKING_TICK
+            with self.lobby.lock:
+                rooms = self.lobby.run_matchmaking()
+                matches = [(room.room_id, list(room.players)) for room in rooms]
+                rooms_data = [room.__json__() for room in rooms]
+
+            if not rooms:
+                continue
+
+            for room_id, user_ids in matches:
+                for user_id in user_ids:
+                    self.transport.enter_room(user_id, room_id)
+                    self.transport.emit("matched", {"room_id": room_id}, room=user_id)
+
+            self.broadcast("rooms_updated", {"rooms": rooms_data}, room=LOBBY_ROOM)
+
+    def send_room_update(self, room_id: str) -> None:
+        """
+        Broadcasts a change to a single room to the subscribers of the lobby.
+
+        Only the affected room is sent, as `room_updated`, or `room_removed` if the room no longer exists.
+        """
+        with self.lobby.lock:
+            room = self.lobby.rooms.get(room_id)
+            room_data = room.__json__() if room else None
+
+        if room_data:
+            self.broadcast("room_updated", {"room": room_data}, room=LOBBY_ROOM)
+        else:
+            self.broadcast("room_removed", {"room_id": room_id}, room=LOBBY_ROOM)
+
+    def send_game_update(self, game: Game, room_id: str) -> None:
+        """
+        Broadcasts the changes made by the last action to the subscribers of the room.
+
+        Must be called while holding the lock of the room, so that updates are sent in the order of the actions.
+
+        Only the changed cells, turn pointer and piece counts are sent, unless the action started a new round or ended
+        the game, in which case the full game is sent. Clients that fall out of sync request a snapshot via
+        `fetch_game_data`.
+        """
+        with metrics.phase_duration.time("serialize"):
+            delta = game.get_delta()
+            if delta is None:
+                event, data = "send_game_data", {"game": game.__json__()}
+            else:
+                event, data = "send_game_delta", {"delta": delta}
+
+        self.broadcast(event, data, room=room_id)  # Only broadcast to specific room
+
+        room = self.lobby.rooms.get(room_id)
+        if room and room.spectators:
+            self.spectator_feed.record(room_id, game)
+
+    def send_game_start_to_spectators(self, room: Room) -> None:
+        """
+        Sends the spectators of a room its game on the next tick, once started.
+        """
+        with room.lock:
+            if room.spectators:
+                self.spectator_feed.record(room.room_id, room.game)
+
+    def run_spectator_ticks(self) -> BackgroundTask:
+        """
+        Background task that sends the spectators of every game that changed since the last tick a single update.
+
+        Updates are serialized while holding the lock of the room, but sent after releasing it, so that however many
+        spectators watch a game, its players never wait on them.
+        """
+        while True:
+            yield self.spectator_feed.interval
+            for room_id in self.spectator_feed.pending_room_ids():
+                room = self.lobby.rooms.get(room_id)
+                if room is None:
+                    self.spectator_feed.take(room_id)
+                    continue
+
+                with room.lock:
+                    update = self.spectator_feed.take(room_id)
+                    if update is None:
+                        continue
+                    event, data = get_spectator_update(room.game, update)
+
+                self.broadcast(
+                    event, {"room_id": room_id, **data}, room=spectator_room(room_id)
+                )
+
+    def run_reaper_ticks(self) -> BackgroundTask:
+        """
+        Background task that passes the turns of absent players and deletes idle and finished rooms on every tick of
+        the timer wheel of the reaper.
+        """
+        while True:
+            yield self.reaper.wheel.tick
+            self.reaper.run(
+                self.lobby,
+                self.on_reaped_action,
+                self.on_reaped_room,
+                self.transport.is_connected,
+            )
+
+    def start_reaper(self) -> None:
+        """
+        Starts the reaper the first time it has anything to reap.
+        """
+        if self.reaper_task is None:
+            self.reaper_task = self.transport.start_background_task(
+                self.run_reaper_ticks()
+            )
+
+    def on_reaped_action(self, room: Room) -> None:
+        self.send_game_update(room.game, room.room_id)
+        self.schedule_bot_turns(room)
+
+    def on_reaped_room(self, room_id: str, user_ids: List[str]) -> None:
+        """
+        Unsubscribes the players removed from a room by the reaper, and closes the socket io rooms of deleted rooms.
+        """
+        for user_id in user_ids:
+            self.transport.leave_room(user_id, room_id)
+        if room_id not in self.lobby.rooms:
+            self.transport.close_room(room_id)
+            self.transport.close_room(spectator_room(room_id))
+        self.send_room_update(room_id)
+
+    def schedule_bot_turns(self, room: Room) -> None:
+        """
+        Starts the background task that plays the turns of the bots of a room, unless one is already running.
+
+        Must be called after every change to the game of a room that may give the turn to a bot.
+        """
+        with room.lock:
+            if room.room_id in self.rooms_playing_bots or not room.is_bot_turn():
+                return
+
+            if self.bot_executor is None:
+                self.bot_executor = ProcessPoolExecutor(
+                    max_workers=self.bot_processes, initializer=init_bot_process
+                )
+            self.rooms_playing_bots.add(room.room_id)
+            self.transport.start_background_task(self.play_bot_turns(room))
+
+    def play_bot_turns(self, room: Room) -> BackgroundTask:
+        """
+        Background task that plays the turns of the bots of a room until it is the turn of a human player, the game is
+        over, or the room is deleted.
+
+        The search runs in the bot process pool while the transport waits for it, so that it never blocks other rooms.
+        Moves found for a position that changed in the meantime are discarded.
+        """
+        try:
+            while True:
+                with room.lock:
+                    if (
+                        self.lobby.rooms.get(room.room_id) is not room
+                        or not room.is_bot_turn()
+                    ):
+                        self.rooms_playing_bots.discard(room.room_id)
+                        return
+
+                    game = room.game
+                    bot_id = game.player_ids[game.current_turn]
+                    version = game.version
+                    state = SearchState(game, bot_id)
+                    future = self.bot_executor.submit(
+                        find_bot_action, state, self.bot_move_time
+                    )
+
+                yield future
+
+                try:
+                    action = future.result()
+                except Exception:
+                    # Fall back to any legal action rather than stalling the game
+                    logger.exception("Bot search failed")
+                    state.prepare()
+                    action = to_action(state, state.legal_actions()[0])
+
+                with room.lock:
+                    if room.game is game and game.version == version:
+                        with metrics.phase_duration.time("execute_action"):
+                            self.execute_bot_action(room, bot_id, action)
+                        self.send_game_update(game, room.room_id)
+
+        except Exception:
+            # The reaper never passes the turns of bots, so the room must be discarded for its bots to be scheduled
+            # again
+            logger.exception("Playing bot turns failed")
+            with room.lock:
+                self.rooms_playing_bots.discard(room.room_id)
+
+    def execute_bot_action(self, room: Room, bot_id: str, action: dict) -> None:
+        """
+        Executes the action of a bot on the game of a room, or passes its turn if the action fails, so that the game
+        never waits on a bot. Must be called while holding the lock of the room.
+        """
+        version = room.game.version
+        try:
+            self.lobby.execute_action(room, bot_id, action)
+        except Exception as err:
+            logger.warning("Bot action failed, passing instead: %s", err)
+            # The action may have failed after changing the game, e.g. while logging it
+            if room.game.version == version:
+                self.lobby.execute_action(
+                    room, bot_id, {"type": Action.PASS}, validate=False
+                )
+
+    def recover_rooms(self) -> None:
+        """
+        Restores the rooms and games of this worker from its action log, and resumes the turns of their bots.
+        """
+        num_records = self.action_log.recover(self.lobby)
+        logger.info(
+            "Recovered %d rooms, replaying %d log records",
+            len(self.lobby.rooms),
+            num_records,
+        )
+        self.action_log.start(self.lobby)
+
+        for room in list(self.lobby.rooms.values()):
+            self.schedule_bot_turns(room)
+        # The players of recovered rooms are no longer connected, and are removed unless their client rejoins in time or
+        # their rooms are reaped first
+        self.reaper.expect_rejoin(list(self.lobby.all_players))
+        self.start_reaper()
+
+    @on("connect")
+    def connect(self, sid: str, *args) -> None:
+        """
+        Listens for when a client connects. Clients only become players once they join the lobby.
+        """
+
+    @on("disconnect")
+    def disconnect(self, sid: str, reason=None) -> None:
+        logger.info("User disconnected: %s", sid)
+        self.rate_limiter.forget(sid)
+        self.fetch_coalescer.forget(sid)
+        self.slow_consumers.forget(sid)
+        try:
+            room_id = self.lobby.leave_lobby(sid)
+        except PlayerNotFound:
+            # The client never joined the lobby, or already left it
+            return
+
+        if room_id:
+            self.send_room_update(room_id)
+
+    @on("join_lobby")
+    def join_lobby(self, sid: str, data):
+        """
+        Listens for when a player joins the multiplayer lobby and subscribes the player to room updates.
+
+        Returns the player along with the current rooms so that the player only has to apply updates afterwards, and
+        the token with which the client rejoins as the player from a new connection, see `rejoin`.
+        """
+        # Create the player object
+        player = BasePlayer(
+            sid, data["name"], time.time(), token=secrets.token_urlsafe()
+        )
+        self.lobby.join_lobby(player)
+        self.start_reaper()
+
+        self.transport.enter_room(sid, LOBBY_ROOM)
+
+        rooms = {room["id"]: room for room in self.lobby.list_room_data()}
+
+        return {
+            "player": player,
+            "rooms": rooms,
+            "token": player.token,
+        }
+
+    @on("rejoin")
+    def rejoin(self, sid: str, data):
+        """
+        Listens for when the client of a player restored after a restart reconnects, and binds the player to the new
+        connection given the token returned by `join_lobby`.
+
+        The player keeps their room and game under the id of the new connection, so every subscriber of the room is
+        sent the room and a full snapshot of the game. Returns the same data as `join_lobby`.
+        """
+        token = data["token"]
+        if not isinstance(token, str):
+            raise ValueError("Invalid token!")
+        player = self.lobby.rejoin_lobby(token, sid, self.transport.is_connected)
+        self.start_reaper()
+
+        self.transport.enter_room(sid, LOBBY_ROOM)
+        room = self.lobby.rooms.get(player.room_id)
+        if room:
+            self.transport.enter_room(sid, room.room_id)
+            with room.lock:
+                if room.game:
+                    self.send_game_update(room.game, room.room_id)
+            self.send_room_update(room.room_id)
+
+        rooms = {room["id"]: room for room in self.lobby.list_room_data()}
+
+        return {
+            "player": player,
+            "rooms": rooms,
+            "token": token,
+        }
+
+    @on("leave_lobby")
+    def leave_lobby(self, sid: str) -> None:
+        """
+        Listens for when a player leaves the multiplayer lobby and broadcasts to the other subscribers the room the player has left, if any.
+        """
+        spectated_room_id = self.lobby.stop_spectating(sid)
+        room_id = self.lobby.leave_lobby(sid)
+
+        self.transport.leave_room(sid, LOBBY_ROOM)
+        if spectated_room_id:
+            self.transport.leave_room(sid, spectator_room(spectated_room_id))
+
+        if room_id:
+            self.send_room_update(room_id)
+
+    @on("create_room")
+    def create_room(self, sid: str):
+        """
+        Listens for when a player creates a room and broadcasts to the other subscribers that a new room is created for joining.
+        """
+        with self.lobby.lock:
+            room = self.lobby.create_new_room(sid)
+            room_data = room.__json__()
+
+        self.transport.enter_room(sid, room.room_id)
+
+        self.broadcast("room_added", {"room": room_data}, room=LOBBY_ROOM)
+
+        return {"room_id": room.room_id}
+
+    @on("join_room")
+    def join_room(self, sid: str, data) -> None:
+        """
+        Listens for when a player joins a room and broadcasts to the other subscribers that a new player has joined the room.
+        """
+        room_id = data["room_id"]
+        with self.lobby.lock:
+            room = self.lobby.join_room(sid, room_id)
+
+            # Automatically start game if room is at capacity
+            if self.lobby.start_game_if_full(room_id):
+                self.send_game_start_to_spectators(room)
+
+        self.transport.enter_room(sid, room_id)
+
+        self.send_room_update(room_id)
+        self.schedule_bot_turns(room)
+
+    @on("quick_match")
+    def quick_match(self, sid: str):
+        """
+        Listens for when a player asks to be matched into any room. The player joins the oldest open room, or creates a
+        new room if every room is full or started, and the other subscribers are notified of the change.
+        """
+        with self.lobby.lock:
+            room = self.lobby.find_open_room()
+            if room:
+                self.lobby.join_room(sid, room.room_id)
+                if self.lobby.start_game_if_full(room.room_id):
+                    self.send_game_start_to_spectators(room)
+                room_added = False
+            else:
+                room = self.lobby.create_new_room(sid)
+                room_added = True
+                room_data = room.__json__()
+
+        if room_added:
+            self.broadcast("room_added", {"room": room_data}, room=LOBBY_ROOM)
+        else:
+            self.send_room_update(room.room_id)
+
+        self.transport.enter_room(sid, room.room_id)
+
+        return {"room_id": room.room_id}
+
+    @on("join_matchmaking")
+    def join_matchmaking(self, sid: str):
+        """
+        Listens for when a player asks to be matched into a room automatically and adds the player to the matchmaking queue.
+        """
+        self.lobby.enqueue_for_match(sid)
+
+        # Start matchmaking the first time a player asks for it
+        if self.matchmaking_task is None:
+            self.matchmaking_task = self.transport.start_background_task(
+                self.run_matchmaking_ticks()
+            )
+
+        return {"queue_length": len(self.lobby.matchmaking)}
+
+    @on("leave_matchmaking")
+    def leave_matchmaking(self, sid: str) -> None:
+        """
+        Listens for when a player no longer wants to be matched and removes the player from the matchmaking queue.
+        """
+        self.lobby.dequeue_from_match(sid)
+
+    @on("leave_room")
+    def leave_room(self, sid: str, data) -> None:
+        """
+        Listens for when a player leaves a room and broadcasts to the other subscribers that a player has left the room.
+        """
+        room_id = data["room_id"]
+        self.lobby.leave_room(sid, room_id)
+
+        self.transport.leave_room(sid, room_id)
+
+        self.send_room_update(room_id)
+
+    @on("start_game")
+    def start_game(self, sid: str, data) -> None:
+        """
+        Listens for when a game is started and broadcasts to the other subscribers.
+        """
+        room_id = data["room_id"]
+        self.lobby.start_game_for_room(sid, room_id)
+        self.send_game_start_to_spectators(self.lobby.get_room(room_id))
+
+        self.send_room_update(room_id)
+        self.schedule_bot_turns(self.lobby.get_room(room_id))
+
+    @on("add_bot")
+    def add_bot(self, sid: str, data) -> None:
+        """
+        Listens for when the admin of a room fills empty seats with bots and broadcasts the changes to the subscribers of the lobby.
+
+        Adds a single bot unless `count` is given, and starts the game once the room is at capacity.
+        """
+        room_id = data["room_id"]
+        with self.lobby.lock:
+            room = self.lobby.add_bots(sid, room_id, data.get("count", 1))
+
+            # Automatically start game if room is at capacity
+            if self.lobby.start_game_if_full(room_id):
+                self.send_game_start_to_spectators(room)
+
+        self.send_room_update(room_id)
+        self.schedule_bot_turns(room)
+
+    @on("spectate_game")
+    def spectate_game(self, sid: str, data):
+        """
+        Listens for when a player starts watching the game of a room, and subscribes the player to its spectator updates.
+
+        Returns the game, if started, which spectators then update with `spectator_game_delta` and `spectator_game_data`
+        events, sent at most SPECTATOR_UPDATES_PER_SECOND times per second.
+        """
+        room_id = data["room_id"]
+        previous_room_id = self.lobby.stop_spectating(sid)
+        if previous_room_id:
+            self.transport.leave_room(sid, spectator_room(previous_room_id))
+
+        room = self.lobby.spectate(sid, room_id)
+        self.transport.enter_room(sid, spectator_room(room_id))
+
+        # Start sending spectator updates the first time a player watches a game
+        if self.spectator_task is None:
+            self.spectator_task = self.transport.start_background_task(
+                self.run_spectator_ticks()
+            )
+
+        with room.lock:
+            return {"game": room.game.__json__() if room.game else None}
+
+    @on("stop_spectating")
+    def stop_spectating(self, sid: str) -> None:
+        """
+        Listens for when a player stops watching a game and unsubscribes the player from its spectator updates.
+        """
+        room_id = self.lobby.stop_spectating(sid)
+        if room_id:
+            self.transport.leave_room(sid, spectator_room(room_id))
+
+    @on("profiling")
+    def profiling(self, sid: str, data):
+        """
+        Listens for when an operator starts or stops profiling, and returns the stacks sampled so far in the collapsed
+        format of flame graphs.
+
+        Set `action` to "start" with the `events` and `room_ids` to profile (every one by default), "stop" or "dump".
+        Only available when the server is started with a PROFILING_TOKEN, which must be sent as `token`.
+        """
+        if not self.profiling_token or not hmac.compare_digest(
+            str(data.get("token", "")), self.profiling_token
+        ):
+            raise PermissionError("Profiling is not authorized.")
+
+        action = data["action"]
+        if action == "start":
+            profiler.start(
+                data.get("events", []), data.get("room_ids", []), data.get("interval")
+            )
+        elif action == "stop":
+            profiler.stop()
+        elif action != "dump":
+            raise ValueError(f"Unknown profiling action: {action}")
+
+        return {"enabled": profiler.enabled, "stacks": profiler.dump()}
+
+    @on("fetch_rooms")
+    def fetch_rooms(self, sid: str, data):
+        """
+        Listens for when a page of rooms is requested and returns the corresponding rooms.
+
+        Set `only_open` to only list rooms that are not full and whose game has not started, and `offset` and `limit`
+        to page through the results. Pages hold ROOMS_PAGE_SIZE rooms unless `limit` is given, and at most
+        MAX_ROOMS_PAGE_SIZE rooms.
+        """
+        offset = data.get("offset", 0)
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError("Invalid offset!")
+        limit = data.get("limit", ROOMS_PAGE_SIZE)
+        if not isinstance(limit, int) or limit < 1:
+            raise ValueError("Invalid limit!")
+        limit = min(limit, MAX_ROOMS_PAGE_SIZE)
+
+        rooms = self.lobby.list_room_data(
+            only_open=data.get("only_open", False), offset=offset, limit=limit
+        )
+        return {"rooms": {room["id"]: room for room in rooms}}
+
+    @on("fetch_game_data")
+    def fetch_game_data(self, sid: str, data):
+        """
+        Listens for when game data for a room is requested by one of its players or spectators and returns the corresponding game data.
+
+        Calls repeating a recent one for an unchanged game only return its version, see `FetchCoalescer`.
+        """
+        room_id = data["room_id"]
+        room = self.lobby.get_room(room_id)
+        with room.lock:
+            game = room.get_game(sid, allow_spectators=True)
+            if game is None:
+                return {"game": None}
+
+            # The client already received the snapshot of this version, i.e. the call repeats a recent one
+            if not self.fetch_coalescer.should_send(sid, room_id, game.version):
+                return {"version": game.version}
+            return {"game": game.__json__()}
+
+    @on("fetch_replay")
+    def fetch_replay(self, sid: str, data):
+        """
+        Listens for when the replay of the game of a room is requested, including games that are over or whose room
+        was deleted, and returns the game after its first `start` moves (0 by default) with the number of moves so far.
+
+        The moves after `start` are then streamed to the client in chunks of `chunk_size` moves, as `replay_moves`
+        events.
+
+        Until the game is over, only its players and the spectators of the room may fetch its replay.
+        """
+        room_id = data["room_id"]
+        start = data.get("start", 0)
+        size = data.get("chunk_size", REPLAY_CHUNK_SIZE)
+        if not isinstance(size, int) or size < 1:
+            raise ValueError("Invalid chunk size!")
+        size = min(size, MAX_REPLAY_CHUNK_SIZE)
+
+        replay = self.lobby.get_replay(room_id, sid)
+        with replay.lock:
+            game = replay.game_at(start).__json__()
+            moves = replay.moves[start:]
+
+        if moves:
+            self.transport.start_background_task(
+                self.stream_replay(sid, room_id, moves, start, size)
+            )
+        return {"game": game, "num_moves": start + len(moves)}
+
+    def stream_replay(
+        self, sid: str, room_id: str, moves: List[Move], start: int, size: int
+    ) -> BackgroundTask:
+        """
+        Background task that sends the moves of a replay to a client as `replay_moves` events of `size` moves each,
+        yielding to other tasks between chunks.
+        """
+        for i in range(0, len(moves), size):
+            chunk = [
+                {"player_id": player_id, "action": action}
+                for player_id, action in moves[i : i + size]
+            ]
+            self.transport.emit(
+                "replay_moves",
+                {
+                    "room_id": room_id,
+                    "start": start + i,
+                    "moves": chunk,
+                    "is_last": i + size >= len(moves),
+                },
+                room=sid,
+            )
+            yield 0
+
+    @on("handle_move_action")
+    def handle_move_action(self, sid: str, data) -> None:
+        """
+        Listens for the action when a player moves an existing piece on the board and broadcasts the changes to the subscribers of the room.
+        """
+        self.execute_action(
+            sid,
+            data["room_id"],
+            {
+                "type": "MOVE",
+                "from_row": data["from_row"],
+                "from_col": data["from_col"],
+                "to_row": data["to_row"],
+                "to_col": data["to_col"],
+            },
+        )
+
+    @on("handle_place_action")
+    def handle_place_action(self, sid: str, data) -> None:
+        """
+        Listens for the action when a player places an unplaced piece on the board and broadcasts the changes to the subscribers of the room.
+        """
+        self.execute_action(
+            sid,
+            data["room_id"],
+            {
+                "type": "PLACE",
+                "num_pieces": data["num_pieces"],
+                "row": data["row"],
+                "col": data["col"],
+            },
+        )
+
+    @on("handle_pass_action")
+    def handle_pass_action(self, sid: str, data) -> None:
+        """
+        Listens for the action when a player without any available moves passes their turn and broadcasts the changes to the subscribers of the room.
+        """
+        self.execute_action(sid, data["room_id"], {"type": "PASS"})
+
+    def execute_action(self, sid: str, room_id: str, action: dict) -> None:
+        """
+        Executes an action of a player on the game of a room and broadcasts the changes to the subscribers of the room.
+        """
+        room = self.lobby.get_room(room_id)
+        with room.lock:
+            game = room.get_game(sid)
+
+            with metrics.phase_duration.time("execute_action"):
+                self.lobby.execute_action(room, sid, action)
+            self.send_game_update(game, room_id)
+            self.schedule_bot_turns(room)
@@ -1,6 +1,26 @@
+import heapq
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, List
 from core.base_player import BasePlayer
-from core.room import Room
+from core.persistence import ActionLog
+from core.room import PlayerNotAuthorized, Room
+from core.state_store import InMemoryStateStore, StateStore, shard_for_room
+from four_players_three_in_a_row.game import GameNotInProgress
+from four_players_three_in_a_row.replay import Replay
+from four_players_three_in_a_row.utils import PossibleActions
+
+# The reaper removes players from the lobby, so it imports the lobby rather than the other way around
+if TYPE_CHECKING:
+    from core.reaper import Reaper
+
+# Ids of bot players start with this prefix, so that they never collide with the socket ids of human players
+BOT_ID_PREFIX = "bot-"
+
+# Number of replays kept in memory, including the games of deleted rooms
+MAX_REPLAYS = 1000
 
 
 class PlayerRoomMismatch(Exception):
@@ -19,43 +39,302 @@ class PlayerNotAdmin(Exception):
     pass
 
 
+class PlayerAlreadyInRoom(Exception):
+    pass
+
+
+class PlayerAlreadyInLobby(Exception):
+    pass
+
+
+class ReplayNotFound(Exception):
+    pass
+
+
+class RoomOnAnotherShard(Exception):
+    def __init__(self, message: str, shard: int):
+        super().__init__(message)
+        self.shard = shard
+
+
+class MatchmakingQueue:
+    """
+    Collects the players waiting to be matched, in the order they joined the queue, and batches them into groups of
+    players that should share a room.
+    """
+
+    def __init__(self, room_size: int, max_wait: float, min_players: int = 2):
+        self.room_size = room_size
+        # Once the longest waiting player has waited this many seconds, a smaller group of at least `min_players` is
+        # matched instead of waiting for a full room
+        self.max_wait = max_wait
+        self.min_players = min_players
+        self.waiting: dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.waiting)
+
+    def enqueue(self, user_id: str, now: float) -> None:
+        self.waiting.setdefault(user_id, now)
+
+    def dequeue(self, user_id: str) -> None:
+        self.waiting.pop(user_id, None)
+
+    def take_batches(self, now: float) -> List[List[str]]:
+        """
+        Removes and returns the groups of players that are ready to be matched.
+
+        Players are grouped into full rooms first. The remaining players are grouped together only if there are enough
+        of them and the longest waiting one has waited at least `max_wait` seconds.
+        """
+        user_ids = list(self.waiting)
+        num_full = len(user_ids) // self.room_size * self.room_size
+        batches = [
+            user_ids[i : i + self.room_size] for i in range(0, num_full, self.room_size)
+        ]
+
+        remaining = user_ids[num_full:]
+        if (
+            len(remaining) >= self.min_players
+            and now - self.waiting[remaining[0]] >= self.max_wait
+        ):
+            batches.append(remaining)
+
+        for batch in batches:
+            for user_id in batch:
+                del self.waiting[user_id]
+
+        return batches
+
+
 class GameLobby:
-    def __init__(self, name: str, capacity_of_room: int):
+    def __init__(
+        self,
+        name: str,
+        capacity_of_room: int,
+        matchmaking_max_wait: float = 30.0,
+        store: StateStore | None = None,
+        shard_id: int = 0,
+        num_shards: int = 1,
+        action_log: ActionLog | None = None,
+        reaper: "Reaper | None" = None,
+    ):
         self.name: str = name
         self.all_players: dict[uuid.UUID, BasePlayer] = {}
         self.rooms: dict[uuid.UUID, Room] = {}
         self.capacity_of_room = capacity_of_room
+        self.matchmaking = MatchmakingQueue(capacity_of_room, matchmaking_max_wait)
+
+        # Guards the players, rooms, indexes and matchmaking queue, i.e. creating, joining, leaving and deleting rooms.
+        # Always acquired before the lock of a room, and never needed for actions within a room, so that actions in
+        # different rooms never contend with each other.
+        self.lock = threading.RLock()
+
+        # Rooms are spread over `num_shards` worker processes by the hash of their id. This lobby only holds the rooms
+        # of shard `shard_id`, and publishes them to the store shared by every worker.
+        self.store = store or InMemoryStateStore()
+        self.shard_id = shard_id
+        self.num_shards = num_shards
+        # Rooms left in the store by a previous run of this worker, e.g. one that crashed, no longer exist. Rooms
+        # recovered from the action log are published again.
+        self.store.delete_shard(shard_id)
+
+        # Log of every change to the rooms and games of this lobby, from which they are recovered after a restart
+        self.action_log = action_log
+
+        # Expires idle rooms, finished games and the turns of absent players, if any
+        self.reaper = reaper
+
+        # Secondary indexes, kept in sync by every method that changes the membership or state of a room
+        self.open_rooms: dict[str, Room] = {}
+        # Min heap of (created_at, room_id) over the open rooms. Entries of rooms that are no longer open are discarded
+        # lazily once they reach the top.
+        self.open_rooms_by_creation: List[tuple[float, str]] = []
+        self.rooms_in_heap: set[str] = set()
+
+        # Room spectated by each player, if any
+        self.spectated_rooms: dict[str, str] = {}
+
+        # Ids of the human players of the lobby by their token, with which their client rejoins from a new connection
+        self.player_tokens: dict[str, str] = {}
+
+        # Replays of the games of rooms by room id, in the order they were last requested, created on the first request
+        # and kept once the room is deleted until evicted by newer replays
+        self.replays: OrderedDict[str, Replay] = OrderedDict()
+
+    def log(self, room: Room, type: str, **data) -> None:
+        """
+        Appends a change to a room to the action log, if any. Must be called while holding the lock of the room.
+        """
+        if self.action_log:
+            self.action_log.append(room, type, **data)
+
+    def update_room_indexes(self, room: Room) -> None:
+        """
+        Updates the secondary indexes after the membership or state of a room changed.
+        """
+        if room.is_open():
+            self.open_rooms[room.room_id] = room
+            if room.room_id not in self.rooms_in_heap:
+                heapq.heappush(
+                    self.open_rooms_by_creation, (room.created_at, room.room_id)
+                )
+                self.rooms_in_heap.add(room.room_id)
+        else:
+            self.open_rooms.pop(room.room_id, None)
+
+        self.store.save_room(
+            room.room_id,
+            self.shard_id,
+            room.created_at,
+            room.is_open(),
+            room.encoded(),
+        )
+        if self.reaper:
+            self.reaper.watch(room)
+
+    def remove_room_indexes(self, room: Room) -> None:
+        """
+        Removes a deleted room from the secondary indexes.
+        """
+        self.open_rooms.pop(room.room_id, None)
+        self.store.delete_room(room.room_id)
+        if self.reaper:
+            self.reaper.unwatch(room.room_id)
+
+    def find_open_room(self) -> Room | None:
+        """
+        Returns the oldest room that can still be joined, or None if every room is full or started.
+        """
+        with self.lock:
+            while self.open_rooms_by_creation:
+                _, room_id = self.open_rooms_by_creation[0]
+                if room_id in self.open_rooms:
+                    return self.open_rooms[room_id]
+
+                heapq.heappop(self.open_rooms_by_creation)
+                self.rooms_in_heap.discard(room_id)
+
+            return None
 
     def get_room(self, room_id: str) -> Room:
         """
         Retrieves the Room object given a room_id and raises an exception if the room is not found.
+
+        Rooms owned by another worker process raise RoomOnAnotherShard, telling the client which worker to use.
         """
         if room_id not in self.rooms:
+            shard = self.store.get_room_shard(room_id)
+            if shard is not None and shard != self.shard_id:
+                raise RoomOnAnotherShard("Room belongs to another server!", shard)
             raise RoomNotFound("Room not found!")
         else:
             return self.rooms[room_id]
 
+    def list_room_data(
+        self, only_open: bool = False, offset: int = 0, limit: int | None = None
+    ) -> List[dict]:
+        """
+        Lists the JSON of the rooms of every worker process in the order they were created, optionally only the rooms
+        that can still be joined.
+
+        `offset` and `limit` select a single page of the results.
+        """
+        return self.store.list_rooms(only_open, offset, limit)
+
     def join_lobby(self, player: BasePlayer) -> None:
         """
         Handler function for when a player joins a multiplayer lobby
         """
-        self.all_players[player.id] = player
+        with self.lock:
+            self.all_players[player.id] = player
+            if player.token:
+                self.player_tokens[player.token] = player.id
 
-    def leave_lobby(self, user_id: str) -> None:
+    def remove_player(self, user_id: str) -> BasePlayer | None:
         """
-        Handler function for when a player leaves a multiplayer lobby.
+        Removes a player from the lobby, without leaving their room. Returns the player, if found.
+        """
+        with self.lock:
+            player = self.all_players.pop(user_id, None)
+            if player and player.token:
+                self.player_tokens.pop(player.token, None)
+            return player
 
-        If the player has joined a room, we should remove the player from that room as well.
+    def rejoin_lobby(
+        self, token: str, user_id: str, is_connected: Callable[[str], bool]
+    ) -> BasePlayer:
         """
-        if user_id not in self.all_players:
-            raise PlayerNotFound("Player not found!")
-        else:
-            player = self.all_players[user_id]
+        Handler function for when the client of a player rejoins the lobby from a new connection, e.g. after the server
+        restarted, with the token it was given when it first joined.
+
+        The player takes the new user id, in the lobby as well as in their room and game. Players whose client is still
+        connected cannot be rejoined.
+        """
+        with self.lock:
+            old_id = self.player_tokens.get(token)
+            if old_id is None or is_connected(old_id):
+                raise PlayerNotFound("Player not found!")
+            if user_id in self.all_players:
+                raise PlayerAlreadyInLobby("Player already joined the lobby!")
 
-            if player.room_id:
-                self.leave_room(user_id, player.room_id)
+            self.matchmaking.dequeue(old_id)
+            self.stop_spectating(old_id)
 
-            del self.all_players[user_id]
+            room = self.rooms.get(self.all_players[old_id].room_id)
+            if room is None:
+                return self.rename_player(old_id, user_id)
+
+            # Renamed and logged at once, so that no action of the room is logged with the new id before the rename
+            with room.lock:
+                player = self.rename_player(old_id, user_id)
+                self.log(room, "rejoin", player_id=old_id, new_player_id=user_id)
+            self.update_room_indexes(room)
+            return player
+
+    def rename_player(self, old_id: str, new_id: str) -> BasePlayer:
+        """
+        Gives a player of the lobby a new id, in the lobby as well as in their room and game, if any.
+        """
+        with self.lock:
+            player = self.all_players.pop(old_id)
+            player.id = new_id
+            player.mark_dirty()
+            self.all_players[new_id] = player
+            if player.token:
+                self.player_tokens[player.token] = new_id
+
+            room = self.rooms.get(player.room_id)
+            if room:
+                room.rename_player(old_id, new_id)
+                # The replay of the game, if kept, still has the old id
+                self.replays.pop(room.room_id, None)
+            return player
+
+    def leave_lobby(self, user_id: str) -> str | None:
+        """
+        Handler function for when a player leaves a multiplayer lobby.
+
+        If the player has joined a room, we should remove the player from that room as well. The player is removed from
+        the lobby even if leaving the room fails, e.g. because the room was deleted in the meantime.
+
+        Returns the id of the room the player left, if any.
+        """
+        with self.lock:
+            if user_id not in self.all_players:
+                raise PlayerNotFound("Player not found!")
+            else:
+                player = self.all_players[user_id]
+                self.matchmaking.dequeue(user_id)
+                self.stop_spectating(user_id)
+
+                room_id = player.room_id
+                try:
+                    if room_id in self.rooms:
+                        self.leave_room(user_id, room_id)
+                finally:
+                    self.remove_player(user_id)
+                return room_id
 
     def create_new_room(self, user_id: str) -> Room:
         """
@@ -63,18 +342,32 @@ class GameLobby:
 
         Associate the player who created the room with the room.
         """
-        if user_id not in self.all_players:
-            raise PlayerNotFound("Player not found!")
+        with self.lock:
+            if user_id not in self.all_players:
+                raise PlayerNotFound("Player not found!")
 
-        else:
-            player = self.all_players[user_id]
-            room_id = str(uuid.uuid4())
-            room = Room(room_id, player, self.capacity_of_room)
-            self.rooms[room_id] = room
+            else:
+                player = self.all_players[user_id]
+                self.matchmaking.dequeue(user_id)
+                # Only create rooms owned by this worker process
+                room_id = str(uuid.uuid4())
+                while shard_for_room(room_id, self.num_shards) != self.shard_id:
+                    room_id = str(uuid.uuid4())
+                room = Room(room_id, player, self.capacity_of_room)
+                self.rooms[room_id] = room
 
-            player.join_room(room_id)
+                player.join_room(room_id)
+                with room.lock:
+                    self.log(
+                        room,
+                        "create_room",
+                        player=player.to_snapshot(),
+                        capacity=room.capacity,
+                        created_at=room.created_at,
+                    )
+                self.update_room_indexes(room)
 
-            return room
+                return room
 
     def join_room(self, user_id: BasePlayer, room_id: str) -> Room:
         """
@@ -82,35 +375,180 @@ class GameLobby:
 
         Associate the player with the room.
         """
-        if user_id not in self.all_players:
-            raise PlayerNotFound("Player not found!")
-        else:
-            player = self.all_players[user_id]
-            room = self.get_room(room_id)
-            room.add_player(player)
-            return room
+        with self.lock:
+            if user_id not in self.all_players:
+                raise PlayerNotFound("Player not found!")
+            else:
+                player = self.all_players[user_id]
+                room = self.get_room(room_id)
+                with room.lock:
+                    room.add_player(player)
+                    self.log(room, "join_room", player=player.to_snapshot())
+                self.matchmaking.dequeue(user_id)
+                self.update_room_indexes(room)
+                return room
 
-    def leave_room(self, user_id: str, room_id: str) -> None:
+    def leave_room(self, user_id: str, room_id: str) -> Room | None:
         """
         Handler function for when a player left a room.
 
         De-associate the player with the room.
 
         Also, delete the room if there are no more players.
+
+        Returns the room, or None if it was deleted.
         """
-        if user_id not in self.all_players:
-            raise PlayerNotFound("Player not found!")
-        else:
-            player = self.all_players[user_id]
-            if player.room_id != room_id:
-                raise PlayerRoomMismatch("Player does not belong to this room!")
+        with self.lock:
+            if user_id not in self.all_players:
+                raise PlayerNotFound("Player not found!")
+            else:
+                player = self.all_players[user_id]
+                if player.room_id != room_id:
+                    raise PlayerRoomMismatch("Player does not belong to this room!")
+
+                room = self.get_room(room_id)
+                with room.lock:
+                    room.remove_player(player)
+                    self.log(room, "leave_room", player_id=user_id)
+
+                # Delete the room if there are no more players, since bots only play along with humans
+                if not room.has_human_players():
+                    self.delete_room(room)
+                    return None
+
+                self.update_room_indexes(room)
+                return room
+
+    def delete_room(self, room: Room) -> None:
+        """
+        Deletes a room along with its remaining players, keeping the replay of its game.
+        """
+        with self.lock:
+            with room.lock:
+                self.log(room, "delete_room")
+                if room.game and room.room_id not in self.replays:
+                    self.keep_replay(room.room_id, Replay.from_game(room.game))
+                for player in list(room.players.values()):
+                    room.players.pop(player.id)
+                    player.leave_room()
+                room.mark_dirty()
+
+            del self.rooms[room.room_id]
+            self.remove_room_indexes(room)
+
+    def spectate(self, user_id: str, room_id: str) -> Room:
+        """
+        Handler function for when a player starts watching the game of a room, which stops watching any other room.
+        """
+        with self.lock:
+            if user_id not in self.all_players:
+                raise PlayerNotFound("Player not found!")
 
             room = self.get_room(room_id)
-            room.remove_player(player)
+            self.stop_spectating(user_id)
+            room.add_spectator(user_id)
+            self.spectated_rooms[user_id] = room_id
+            return room
+
+    def stop_spectating(self, user_id: str) -> str | None:
+        """
+        Handler function for when a player stops watching a game.
+
+        Returns the id of the room the player watched, if any.
+        """
+        with self.lock:
+            room_id = self.spectated_rooms.pop(user_id, None)
+            if room_id in self.rooms:
+                self.rooms[room_id].remove_spectator(user_id)
+            return room_id
+
+    def add_bots(self, user_id: str, room_id: str, count: int = 1) -> Room:
+        """
+        Handler function for when the admin of a room fills empty seats with bots.
+
+        At most `count` bots are added, without exceeding the capacity of the room.
+        """
+        with self.lock:
+            room = self.get_room(room_id)
+            if room.admin.id != user_id:
+                raise PlayerNotAdmin("Player does not have permission to add bots.")
+
+            for _ in range(min(count, room.capacity - len(room.players))):
+                bot = BasePlayer(
+                    f"{BOT_ID_PREFIX}{uuid.uuid4()}",
+                    f"Bot {len(room.players)}",
+                    time.time(),
+                    is_bot=True,
+                )
+                with room.lock:
+                    room.add_player(bot)
+                    self.log(room, "join_room", player=bot.to_snapshot())
+
+            self.update_room_indexes(room)
+            return room
 
-            # Delete the room if there are no more players
-            if len(room.players) == 0:
-                del self.rooms[room_id]
+    def start_game(self, room: Room) -> None:
+        with room.lock:
+            room.start_game()
+            self.log(room, "start_game")
+
+    def execute_action(
+        self,
+        room: Room,
+        player_id: str,
+        action: PossibleActions,
+        validate: bool = True,
+    ) -> bool:
+        """
+        Executes an action of a player on the game of a room, and appends it to the action log.
+
+        `validate` is false for actions forced on the player, such as passing the turn of an absent player.
+
+        Returns true if the player won the round and false otherwise.
+        """
+        with room.lock:
+            if room.game is None:
+                raise GameNotInProgress("The game has not started!")
+            won = room.game.execute_action_for_player(player_id, action, validate)
+            self.log(room, "action", player_id=player_id, action=action)
+            if self.reaper:
+                self.reaper.watch(room)
+            return won
+
+    def keep_replay(self, room_id: str, replay: Replay) -> None:
+        self.replays[room_id] = replay
+        self.replays.move_to_end(room_id)
+        while len(self.replays) > MAX_REPLAYS:
+            self.replays.popitem(last=False)
+
+    def get_replay(self, room_id: str, user_id: str) -> Replay:
+        """
+        Retrieves the replay of the game of a room, which may have been deleted since, and raises an exception if the
+        game is not found.
+
+        Until the game is over, only its players and the spectators of the room may watch its replay. Every room is
+        listed in the lobby, so anyone may watch the replay of a game that is over.
+        """
+        with self.lock:
+            room = self.rooms.get(room_id)
+            replay = self.replays.get(room_id)
+            if replay is None:
+                room = self.get_room(room_id)
+                if not room.game:
+                    raise ReplayNotFound("The game of this room has not started!")
+                replay = Replay.from_game(room.game)
+
+            if not (
+                replay.is_over()
+                or user_id in replay.player_ids()
+                or (room and user_id in room.spectators)
+            ):
+                raise PlayerNotAuthorized(
+                    "Player does not have authorization to access this data."
+                )
+
+            self.keep_replay(room_id, replay)
+            return replay
 
     def start_game_for_room(self, user_id: str, room_id: str) -> None:
         """
@@ -118,8 +556,66 @@ class GameLobby:
 
         The user id who is starting the game must be the admin for the room.
         """
-        room = self.get_room(room_id)
-        if room.admin.id == user_id:
-            room.start_game()
-        else:
-            raise PlayerNotAdmin("Player does not have permission to start the game.")
+        with self.lock:
+            room = self.get_room(room_id)
+            if room.admin.id == user_id:
+                self.start_game(room)
+                self.update_room_indexes(room)
+            else:
+                raise PlayerNotAdmin(
+                    "Player does not have permission to start the game."
+                )
+
+    def start_game_if_full(self, room_id: str) -> bool:
+        """
+        Starts the game for a room once it is at capacity.
+
+        Returns true if the game was started and false otherwise.
+        """
+        with self.lock:
+            room = self.get_room(room_id)
+            if room.game or len(room.players) < room.capacity:
+                return False
+
+            self.start_game(room)
+            self.update_room_indexes(room)
+            return True
+
+    def enqueue_for_match(self, user_id: str) -> None:
+        """
+        Handler function for when a player asks to be matched into a room automatically.
+        """
+        with self.lock:
+            if user_id not in self.all_players:
+                raise PlayerNotFound("Player not found!")
+            elif self.all_players[user_id].room_id:
+                raise PlayerAlreadyInRoom("Player already belongs to a room!")
+            else:
+                self.matchmaking.enqueue(user_id, time.time())
+
+    def dequeue_from_match(self, user_id: str) -> None:
+        """
+        Handler function for when a player no longer wants to be matched into a room.
+        """
+        with self.lock:
+            self.matchmaking.dequeue(user_id)
+
+    def run_matchmaking(self, now: float | None = None) -> List[Room]:
+        """
+        Creates a room and starts its game for every group of waiting players that is ready to be matched.
+
+        Returns the rooms that were created.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            rooms = []
+            for batch in self.matchmaking.take_batches(now):
+                room = self.create_new_room(batch[0])
+                for user_id in batch[1:]:
+                    self.join_room(user_id, room.room_id)
+
+                self.start_game(room)
+                self.update_room_indexes(room)
+                rooms.append(room)
+
+            return rooms
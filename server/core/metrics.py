@@ -0,0 +1,296 @@
+import inspect
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Iterator, List
+
+# Buckets of the histograms, in seconds, bytes and number of recipients
+LATENCY_BUCKETS = [
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+]
+PAYLOAD_BUCKETS = [64, 256, 1024, 4096, 16384, 65536, 262144, 1048576]
+FAN_OUT_BUCKETS = [1, 2, 4, 8, 16, 64, 256, 1024, 4096, 16384]
+
+# Only every n-th payload is encoded to measure its size, since encoding is as expensive as the emit itself
+PAYLOAD_SAMPLE_EVERY = 10
+
+
+def format_labels(label_names: tuple[str, ...], label_values: tuple) -> str:
+    if not label_names:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in label_values
+    )
+    return (
+        "{"
+        + ",".join(f'{name}="{value}"' for name, value in zip(label_names, escaped))
+        + "}"
+    )
+
+
+class Metric:
+    """
+    Base class of the metrics of a registry, which render themselves in the Prometheus text format.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.lock = threading.Lock()
+
+    def render_samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.render_samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count, by label values.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()):
+        super().__init__(name, help, label_names)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render_samples(self) -> Iterator[str]:
+        with self.lock:
+            values = list(self.values.items())
+        for label_values, value in values:
+            yield f"{self.name}{format_labels(self.label_names, label_values)} {value}"
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values over fixed buckets, by label values.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        buckets: List[float],
+        label_names: tuple[str, ...] = (),
+    ):
+        super().__init__(name, help, label_names)
+        self.buckets = buckets
+        # Count of observations in each bucket, plus the +Inf bucket, followed by the sum of the observations
+        self.values: dict[tuple, List[float]] = {}
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                counts = self.values[label_values] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        """
+        Observes the number of seconds spent in the block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def render_samples(self) -> Iterator[str]:
+        with self.lock:
+            values = [(labels, list(counts)) for labels, counts in self.values.items()]
+
+        label_names = self.label_names + ("le",)
+        for label_values, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ["+Inf"], counts):
+                cumulative += count
+                labels = format_labels(label_names, label_values + (bound,))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.label_names, label_values)
+            yield f"{self.name}_sum{labels} {counts[-1]}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class CallbackMetric(Metric):
+    """
+    Gauge or counter whose value is only computed when the metrics are scraped.
+    """
+
+    def __init__(self, name: str, help: str, function: Callable[[], float], type: str):
+        super().__init__(name, help)
+        self.function = function
+        self.type = type
+
+    def render_samples(self) -> Iterator[str]:
+        yield f"{self.name} {self.function()}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(
+        self, name: str, help: str, label_names: tuple[str, ...] = ()
+    ) -> Counter:
+        return self.register(Counter(name, help, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        buckets: List[float],
+        label_names: tuple[str, ...] = (),
+    ) -> Histogram:
+        return self.register(Histogram(name, help, buckets, label_names))
+
+    def gauge(self, name: str, help: str, function: Callable[[], float]) -> None:
+        self.register(CallbackMetric(name, help, function, "gauge"))
+
+    def callback_counter(
+        self, name: str, help: str, function: Callable[[], float]
+    ) -> None:
+        self.register(CallbackMetric(name, help, function, "counter"))
+
+    def render(self) -> str:
+        """
+        Renders every metric in the Prometheus text exposition format.
+        """
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+event_duration = registry.histogram(
+    "socket_event_duration_seconds",
+    "Time spent handling a socket event.",
+    LATENCY_BUCKETS,
+    ("event",),
+)
+event_errors = registry.counter(
+    "socket_event_errors_total",
+    "Socket events that failed, by the class of the exception.",
+    ("event", "exception"),
+)
+phase_duration = registry.histogram(
+    "game_phase_duration_seconds",
+    "Time spent executing game actions and serializing the resulting updates.",
+    LATENCY_BUCKETS,
+    ("phase",),
+)
+emits = registry.counter(
+    "socket_emits_total", "Events emitted by the server.", ("event",)
+)
+emit_recipients = registry.counter(
+    "socket_emit_recipients_total",
+    "Clients that events were emitted to, i.e. the sum of the fan-out of every emit.",
+    ("event",),
+)
+emit_fan_out = registry.histogram(
+    "socket_emit_fan_out",
+    "Number of clients each event was emitted to.",
+    FAN_OUT_BUCKETS,
+    ("event",),
+)
+emit_duration = registry.histogram(
+    "socket_emit_duration_seconds",
+    "Time spent emitting an event to every recipient.",
+    LATENCY_BUCKETS,
+    ("event",),
+)
+emit_payload_bytes = registry.histogram(
+    "socket_emit_payload_bytes",
+    f"Size of the JSON payload of one in {PAYLOAD_SAMPLE_EVERY} emitted events.",
+    PAYLOAD_BUCKETS,
+    ("event",),
+)
+slow_clients = registry.counter(
+    "socket_slow_clients_total",
+    "Clients unsubscribed from a room because too many messages were queued for them.",
+)
+
+num_emits = 0
+
+
+def instrument(event: str):
+    """
+    Decorator of socket handlers, either functions or coroutines, that records the time spent handling each event.
+    """
+
+    def decorator(handler):
+        if inspect.iscoroutinefunction(handler):
+
+            @wraps(handler)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await handler(*args, **kwargs)
+                finally:
+                    event_duration.observe(time.perf_counter() - start, event)
+
+            return async_wrapper
+
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                event_duration.observe(time.perf_counter() - start, event)
+
+        return wrapper
+
+    return decorator
+
+
+def record_error(event: str, err: Exception) -> None:
+    event_errors.inc(event, type(err).__name__)
+
+
+def record_emit(event: str, data, fan_out: int) -> None:
+    """
+    Records an emitted event and the number of clients it was sent to, and samples the size of its payload.
+    """
+    global num_emits
+    emits.inc(event)
+    emit_recipients.inc(event, amount=fan_out)
+    emit_fan_out.observe(fan_out, event)
+
+    num_emits += 1
+    if num_emits % PAYLOAD_SAMPLE_EVERY == 0:
+        emit_payload_bytes.observe(len(json.dumps(data)), event)
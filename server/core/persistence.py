@@ -0,0 +1,312 @@
+import json
+import json_fix
+import os
+import queue
+import re
+import threading
+import time
+from typing import List
+from core.base_player import BasePlayer
+from core.room import Room
+
+# Log segments are named after their sequence number, which orders them
+SEGMENT_PATTERN = re.compile(r"^actions-(\d+)\.log$")
+SNAPSHOT_FILE = "snapshot.json"
+
+
+def segment_name(segment: int) -> str:
+    return f"actions-{segment:06d}.log"
+
+
+class Rotation:
+    """
+    Marker put in the queue of the writer, after which records are written to a new segment.
+    """
+
+    def __init__(self, segment: int):
+        self.segment = segment
+        self.done = threading.Event()
+
+
+class ActionLog:
+    """
+    Append-only log of the changes to the rooms of a lobby, with periodic snapshots, from which the rooms and games are
+    recovered after a restart.
+
+    Every record is a JSON line with a global sequence number `seq`, the `room_id` and `type` of the change, i.e.
+    `create_room`, `join_room`, `leave_room`, `delete_room`, `start_game`, `action` or `rejoin`, and its arguments.
+    Appending only puts the record in a queue, so that handlers never wait on the disk. A writer thread encodes and
+    writes the queued records in batches, with a single fsync per batch and at most one fsync every `flush_interval`
+    seconds, so a crash loses at most the records of the last `flush_interval` seconds.
+
+    Every `snapshot_every` records, a snapshot thread switches the writer to a new log segment, saves every room
+    atomically to `snapshot.json` and deletes the segments it covers. Recovery loads the snapshot and replays the
+    segments written since, which hold at most about `snapshot_every` records whatever the uptime of the server.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        flush_interval: float = 0.05,
+        snapshot_every: int = 10_000,
+        snapshot_check_interval: float = 1.0,
+    ):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.snapshot_check_interval = snapshot_check_interval
+        os.makedirs(directory, exist_ok=True)
+
+        # Guards the sequence number, so that records are queued in the order of their sequence numbers
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.records_since_snapshot = 0
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.segment = 0
+        self.file = None
+        self.writer: threading.Thread | None = None
+        self.snapshotter: threading.Thread | None = None
+        self.stopped = threading.Event()
+
+    def append(self, room: Room, type: str, **data) -> None:
+        """
+        Queues a record of a change to a room.
+
+        Must be called while holding the lock of the room, right after the change, so that the records of a room are
+        in the order of its changes and snapshots know which records of the room they include.
+        """
+        with self.lock:
+            self.seq += 1
+            self.records_since_snapshot += 1
+            room.log_seq = self.seq
+            self.queue.put(
+                {"seq": self.seq, "room_id": room.room_id, "type": type, **data}
+            )
+
+    def start(self, lobby) -> None:
+        """
+        Starts writing the queued records to a new segment, and taking snapshots of the rooms of the lobby.
+        """
+        self.segment = max(self.list_segments(), default=0) + 1
+        self.file = open(os.path.join(self.directory, segment_name(self.segment)), "a")
+        self.sync_directory()
+
+        self.writer = threading.Thread(target=self.run_writer, daemon=True)
+        self.writer.start()
+        self.snapshotter = threading.Thread(
+            target=self.run_snapshots, args=(lobby,), daemon=True
+        )
+        self.snapshotter.start()
+
+    def close(self) -> None:
+        """
+        Writes every queued record and stops the writer and snapshot threads.
+        """
+        self.stopped.set()
+        if self.snapshotter:
+            self.snapshotter.join()
+        if self.writer:
+            self.queue.put(None)
+            self.writer.join()
+            self.writer = None
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def run_writer(self) -> None:
+        while True:
+            items = [self.queue.get()]
+            # Write every record queued while the previous batch was synced
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            start = time.monotonic()
+            lines = []
+            for item in items:
+                if item is None or isinstance(item, Rotation):
+                    self.write(lines)
+                    lines = []
+                    if item is None:
+                        return
+                    self.rotate(item)
+                else:
+                    lines.append(json.dumps(item))
+            self.write(lines)
+
+            # Coalesce the records of the next `flush_interval` seconds into a single fsync
+            time.sleep(max(0.0, self.flush_interval - (time.monotonic() - start)))
+
+    def write(self, lines: List[str]) -> None:
+        if not lines:
+            return
+        self.file.write("\n".join(lines) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def rotate(self, rotation: Rotation) -> None:
+        self.file.close()
+        self.file = open(
+            os.path.join(self.directory, segment_name(rotation.segment)), "a"
+        )
+        self.sync_directory()
+        rotation.done.set()
+
+    def run_snapshots(self, lobby) -> None:
+        while not self.stopped.wait(self.snapshot_check_interval):
+            if self.records_since_snapshot >= self.snapshot_every:
+                self.snapshot(lobby)
+
+    def snapshot(self, lobby) -> None:
+        """
+        Saves every room of the lobby to the snapshot and deletes the log segments it covers.
+
+        Records queued before the switch to the new segment are all included in the snapshot, since each room is saved
+        after. Records queued after may be included too, which recovery detects through the `log_seq` of the room.
+        """
+        rotation = Rotation(self.segment + 1)
+        with self.lock:
+            self.records_since_snapshot = 0
+            self.queue.put(rotation)
+        self.segment = rotation.segment
+
+        with lobby.lock:
+            rooms = list(lobby.rooms.values())
+        snapshots = []
+        for room in rooms:
+            with room.lock:
+                snapshots.append(room.to_snapshot())
+
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        with open(path + ".tmp", "w") as file:
+            json.dump({"segment": rotation.segment, "rooms": snapshots}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+        self.sync_directory()
+
+        rotation.done.wait()
+        self.delete_segments_before(rotation.segment)
+
+    def list_segments(self) -> List[int]:
+        return sorted(
+            int(match.group(1))
+            for match in map(SEGMENT_PATTERN.match, os.listdir(self.directory))
+            if match
+        )
+
+    def delete_segments_before(self, segment: int) -> None:
+        for old_segment in self.list_segments():
+            if old_segment < segment:
+                os.remove(os.path.join(self.directory, segment_name(old_segment)))
+
+    def sync_directory(self) -> None:
+        """
+        Makes the creation, renaming and deletion of files in the directory durable.
+        """
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def read_segment(self, segment: int) -> List[dict]:
+        records = []
+        with open(os.path.join(self.directory, segment_name(segment))) as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # The last line may have been cut off by a crash
+                    break
+        return records
+
+    def recover(self, lobby) -> int:
+        """
+        Restores the rooms of the lobby from the snapshot and the log segments written since. Must be called before
+        `start`, and before the lobby serves any player.
+
+        Returns the number of replayed records.
+        """
+        first_segment = 0
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(path):
+            with open(path) as file:
+                snapshot = json.load(file)
+            first_segment = snapshot["segment"]
+            for data in snapshot["rooms"]:
+                restore_room(lobby, Room.from_snapshot(data))
+            self.seq = max((data["log_seq"] for data in snapshot["rooms"]), default=0)
+
+        num_records = 0
+        for segment in self.list_segments():
+            if segment < first_segment:
+                continue
+            for record in self.read_segment(segment):
+                replay(lobby, record)
+                self.seq = max(self.seq, record["seq"])
+                num_records += 1
+
+        self.records_since_snapshot = num_records
+        return num_records
+
+
+def restore_room(lobby, room: Room) -> None:
+    lobby.rooms[room.room_id] = room
+    for player in room.players.values():
+        if not player.is_bot:
+            lobby.join_lobby(player)
+    lobby.update_room_indexes(room)
+
+
+def replay(lobby, record: dict) -> None:
+    """
+    Applies a record of the log to the rooms of the lobby, unless the room already includes it.
+    """
+    room_id = record["room_id"]
+    room = lobby.rooms.get(room_id)
+
+    if record["type"] == "create_room":
+        if room is None:
+            player = BasePlayer.from_snapshot(record["player"])
+            room = Room(room_id, player, record["capacity"])
+            room.created_at = record["created_at"]
+            player.join_room(room_id)
+            room.log_seq = record["seq"]
+            restore_room(lobby, room)
+        return
+
+    # Records of rooms deleted before the snapshot, or already included in it
+    if room is None or record["seq"] <= room.log_seq:
+        return
+
+    if record["type"] == "join_room":
+        player = BasePlayer.from_snapshot(record["player"])
+        if not player.is_bot:
+            lobby.join_lobby(player)
+        room.add_player(player)
+    elif record["type"] == "leave_room":
+        room.remove_player(room.get_player(record["player_id"]))
+        lobby.remove_player(record["player_id"])
+    elif record["type"] == "rejoin":
+        lobby.rename_player(record["player_id"], record["new_player_id"])
+    elif record["type"] == "start_game":
+        room.start_game()
+    elif record["type"] == "action":
+        # Actions were validated before they were logged, and passes forced by the reaper may not be valid
+        room.game.execute_action_for_player(
+            record["player_id"], record["action"], validate=False
+        )
+    elif record["type"] == "delete_room":
+        del lobby.rooms[room_id]
+        for player in room.players.values():
+            player.leave_room()
+        lobby.remove_room_indexes(room)
+        return
+
+    room.log_seq = record["seq"]
+    lobby.update_room_indexes(room)
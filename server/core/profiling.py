@@ -0,0 +1,184 @@
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from types import FrameType
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    """
+    Sampling profiler of socket handlers, scoped to chosen events and rooms, that can be toggled at runtime.
+
+    While enabled, every handler of a targeted event and room registers its thread for the duration of the call, and a
+    background thread samples the stacks of the registered threads every `interval` seconds. Stacks are counted in the
+    collapsed format of flamegraph.pl and speedscope, rooted at the event and room, i.e. `event;room;file:function;...`.
+
+    While disabled, a profiled handler only checks a boolean, so profiling can stay compiled in production.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.enabled = False
+        self.interval = interval
+        # Events and rooms to profile. Empty sets profile every event or room.
+        self.events: set[str] = set()
+        self.room_ids: set[str] = set()
+
+        # Registered threads, with the root of their stacks and the frame of the profiled handler call
+        self.active: dict[int, tuple[str, FrameType]] = {}
+        self.stacks: Counter[str] = Counter()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.sampler: threading.Thread | None = None
+
+    def start(
+        self,
+        events: Iterable[str] = (),
+        room_ids: Iterable[str] = (),
+        interval: float | None = None,
+    ) -> None:
+        """
+        Starts profiling the given events and rooms, discarding the stacks of any previous profile.
+        """
+        self.stop()
+        self.events = set(events)
+        self.room_ids = set(room_ids)
+        self.interval = interval or self.interval
+        with self.lock:
+            self.stacks.clear()
+
+        self.stopped.clear()
+        self.sampler = threading.Thread(target=self.run_sampler, daemon=True)
+        self.sampler.start()
+        self.enabled = True
+
+    def stop(self) -> None:
+        """
+        Stops profiling, keeping the stacks sampled so far.
+        """
+        self.enabled = False
+        if self.sampler:
+            self.stopped.set()
+            self.sampler.join()
+            self.sampler = None
+        self.active.clear()
+
+    def dump(self) -> str:
+        """
+        Returns the sampled stacks in the collapsed format, one `stack count` line per distinct stack.
+        """
+        with self.lock:
+            stacks = list(self.stacks.items())
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def is_targeted(self, event: str, room_id: str | None) -> bool:
+        return (not self.events or event in self.events) and (
+            not self.room_ids or room_id in self.room_ids
+        )
+
+    def profile(self, event: str):
+        """
+        Decorator of socket handlers that registers the calls of targeted events and rooms for sampling. The room is
+        read from the `room_id` of the data of the event, if any.
+        """
+
+        def decorator(handler):
+            @wraps(handler)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return handler(*args, **kwargs)
+
+                data = args[0] if args else None
+                room_id = data.get("room_id") if isinstance(data, dict) else None
+                if not self.is_targeted(event, room_id):
+                    return handler(*args, **kwargs)
+
+                ident = threading.get_ident()
+                root = f"{event};room {room_id}" if room_id else event
+                self.active[ident] = (root, sys._getframe())
+                try:
+                    return handler(*args, **kwargs)
+                finally:
+                    self.active.pop(ident, None)
+
+            return wrapper
+
+        return decorator
+
+    def run_sampler(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.take_sample()
+
+    def take_sample(self) -> None:
+        frames = sys._current_frames()
+        for ident, (root, anchor) in list(self.active.items()):
+            frame = frames.get(ident)
+            names = []
+            # Only keep the frames below the profiled handler call
+            while frame is not None and frame is not anchor:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+
+            # The thread left the handler since it was registered
+            if frame is None:
+                continue
+
+            stack = ";".join([root] + names[::-1])
+            with self.lock:
+                self.stacks[stack] += 1
+
+
+profiler = Profiler()
+
+
+def install_signal_handler(
+    profiler: Profiler,
+    directory: str,
+    events: Iterable[str] = (),
+    room_ids: Iterable[str] = (),
+    signal_number: int = getattr(signal, "SIGUSR2", 0),
+) -> None:
+    """
+    Toggles the profiler on `signal_number`: the first signal starts profiling the given events and rooms, and the
+    next one stops it and writes the collapsed stacks to `directory`.
+
+    Must be called from the main thread. Does nothing on platforms without the signal.
+    """
+    if not signal_number:
+        return
+
+    # Signals toggle the profiler in order, one at a time
+    lock = threading.Lock()
+
+    def toggle():
+        with lock:
+            if not profiler.enabled:
+                profiler.start(events, room_ids)
+                logger.info("Profiling started")
+                return
+
+            profiler.stop()
+            path = os.path.join(
+                directory, f"profile-{os.getpid()}-{int(time.time())}.collapsed"
+            )
+            try:
+                with open(path, "w") as file:
+                    file.write(profiler.dump())
+            except OSError:
+                logger.exception("Writing the profile failed")
+            else:
+                logger.info("Profile written to %s", path)
+
+    def handle_signal(signum, frame):
+        # The signal interrupts the main thread wherever it is, possibly while it holds a lock, so joining the sampler
+        # and writing the file are left to another thread
+        threading.Thread(target=toggle).start()
+
+    signal.signal(signal_number, handle_signal)
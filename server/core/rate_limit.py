@@ -0,0 +1,175 @@
+import threading
+import time
+from typing import Callable, List
+
+# Rate, in events per second, and burst of the events of a single client, by event. Other events are not limited.
+RATE_LIMITS: dict[str, tuple[float, int]] = {
+    "join_lobby": (1, 5),
+    "rejoin": (1, 5),
+    "create_room": (1, 5),
+    "join_room": (2, 10),
+    "leave_room": (2, 10),
+    "quick_match": (1, 5),
+    "join_matchmaking": (1, 5),
+    "start_game": (1, 5),
+    "add_bot": (2, 10),
+    "spectate_game": (2, 10),
+    "fetch_rooms": (5, 20),
+    "fetch_game_data": (5, 20),
+    "fetch_replay": (1, 5),
+    "handle_move_action": (10, 30),
+    "handle_place_action": (10, 30),
+    "handle_pass_action": (10, 30),
+}
+
+# Number of messages queued for a client beyond which the client is too slow to follow the rooms it subscribed to
+MAX_QUEUED_MESSAGES = 256
+
+# Number of seconds during which repeated `fetch_game_data` calls of a client for an unchanged game are coalesced
+FETCH_COALESCE_INTERVAL = 0.25
+
+
+class RateLimited(Exception):
+    pass
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, burst: int, now: float):
+        self.tokens = float(burst)
+        self.updated_at = now
+
+
+class RateLimiter:
+    """
+    Limits the events of every client with a token bucket per client and event, which holds up to `burst` tokens and
+    refills at `rate` tokens per second. Every event takes a token, and is rejected if there are none left, so that a
+    client flooding an event only ever costs the server a bucket update per event.
+    """
+
+    def __init__(self, limits: dict[str, tuple[float, int]] = RATE_LIMITS):
+        self.limits = limits
+        self.buckets: dict[str, dict[str, TokenBucket]] = {}
+        self.lock = threading.Lock()
+
+    def allow(self, sid: str, event: str, now: float | None = None) -> bool:
+        """
+        Takes a token from the bucket of a client for an event, and returns whether there was one.
+        """
+        limit = self.limits.get(event)
+        if limit is None:
+            return True
+
+        rate, burst = limit
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            buckets = self.buckets.setdefault(sid, {})
+            bucket = buckets.get(event)
+            if bucket is None:
+                bucket = buckets[event] = TokenBucket(burst, now)
+            else:
+                bucket.tokens = min(
+                    burst, bucket.tokens + (now - bucket.updated_at) * rate
+                )
+                bucket.updated_at = now
+
+            if bucket.tokens < 1:
+                return False
+            bucket.tokens -= 1
+            return True
+
+    def check(self, sid: str, event: str) -> None:
+        """
+        Raises an exception if a client exceeded the rate limit of an event.
+        """
+        if not self.allow(sid, event):
+            raise RateLimited("Too many requests, please slow down!")
+
+    def forget(self, sid: str) -> None:
+        """
+        Removes the buckets of a disconnected client.
+        """
+        with self.lock:
+            self.buckets.pop(sid, None)
+
+
+class FetchCoalescer:
+    """
+    Coalesces the `fetch_game_data` calls of a client, e.g. one per delta received while out of sync, into a single
+    snapshot per version of the game and per `interval` seconds. Repeated calls only return the version of the game,
+    whose snapshot the client already received.
+    """
+
+    def __init__(self, interval: float = FETCH_COALESCE_INTERVAL):
+        self.interval = interval
+        # Room, version and time of the last snapshot sent to each client
+        self.last_fetches: dict[str, tuple[str, int, float]] = {}
+        self.lock = threading.Lock()
+
+    def should_send(
+        self, sid: str, room_id: str, version: int, now: float | None = None
+    ) -> bool:
+        """
+        Returns whether the snapshot of a game must be sent to a client, and records it as sent if so.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            last_fetch = self.last_fetches.get(sid)
+            if (
+                last_fetch
+                and last_fetch[:2] == (room_id, version)
+                and now - last_fetch[2] < self.interval
+            ):
+                return False
+
+            self.last_fetches[sid] = (room_id, version, now)
+            return True
+
+    def forget(self, sid: str) -> None:
+        with self.lock:
+            self.last_fetches.pop(sid, None)
+
+
+class SlowConsumers:
+    """
+    Bounds the messages queued for clients that receive them slower than they are broadcast, e.g. over a slow network.
+
+    Before a broadcast, clients of the socket io room with more than `max_queued` queued messages are unsubscribed from
+    the room rather than queueing more. Once their queue drained to half of `max_queued`, they are subscribed again and
+    sent a snapshot of the room, which replaces the updates they missed.
+    """
+
+    def __init__(self, max_queued: int = MAX_QUEUED_MESSAGES):
+        self.max_queued = max_queued
+        # Socket io rooms each slow client was unsubscribed from, by socket id
+        self.detached: dict[str, set[str]] = {}
+        self.lock = threading.Lock()
+
+    def is_slow(self, num_queued: int | None) -> bool:
+        return num_queued is not None and num_queued > self.max_queued
+
+    def detach(self, sid: str, room: str) -> None:
+        with self.lock:
+            self.detached.setdefault(sid, set()).add(room)
+
+    def take_caught_up(
+        self, count_queued: Callable[[str], int | None]
+    ) -> List[tuple[str, set[str]]]:
+        """
+        Removes and returns the slow clients whose queue drained, along with the rooms they were unsubscribed from.
+        Disconnected clients, for which `count_queued` returns None, are removed without being returned.
+        """
+        with self.lock:
+            caught_up = []
+            for sid in list(self.detached):
+                num_queued = count_queued(sid)
+                if num_queued is None:
+                    del self.detached[sid]
+                elif num_queued <= self.max_queued // 2:
+                    caught_up.append((sid, self.detached.pop(sid)))
+            return caught_up
+
+    def forget(self, sid: str) -> None:
+        with self.lock:
+            self.detached.pop(sid, None)
@@ -0,0 +1,240 @@
+import logging
+import time
+from typing import Callable, Iterable, List
+from core.lobby import PlayerNotFound
+from core.room import Room
+from core.timer_wheel import Timer, TimerWheel
+from four_players_three_in_a_row.game import GameState
+from four_players_three_in_a_row.utils import Action
+
+logger = logging.getLogger(__name__)
+
+# Number of seconds a human player has to take their turn before it is passed for them
+TURN_TIMEOUT = 60.0
+# Number of turns in a row a player may miss before forfeiting, i.e. being removed from the room
+MAX_MISSED_TURNS = 2
+# Number of seconds after which a room whose game has not started is deleted, unless a player joins or leaves
+IDLE_ROOM_TIMEOUT = 600.0
+# Number of seconds a room stays open after its game is over
+FINISHED_ROOM_TIMEOUT = 120.0
+# Number of seconds between two sweeps of the players whose client is no longer connected
+PLAYER_SWEEP_INTERVAL = 60.0
+# Number of seconds the client of a player restored after a restart has to rejoin before the player is swept
+REJOIN_TIMEOUT = 120.0
+
+TURN = "turn"
+IDLE = "idle"
+FINISHED = "finished"
+SWEEP = "sweep"
+
+
+class Reaper:
+    """
+    Expires what the players of a lobby leave behind, so that the memory of the server does not grow with its uptime:
+    - A human player who does not take their turn within `turn_timeout` seconds passes, and forfeits after missing
+      `max_missed_turns` turns in a row. Turns of players who left the room are passed right away.
+    - Rooms whose game has not started are deleted after `idle_room_timeout` seconds without anyone joining or leaving,
+      and rooms whose game is over are deleted after `finished_room_timeout` seconds.
+    - Players whose client is no longer connected are removed from the lobby, along with their rooms. Players restored
+      after a restart are only removed if their client did not rejoin within `rejoin_timeout` seconds.
+
+    Every room has at most one timer, in a hashed timer wheel, which is rescheduled by `watch` after every change to the
+    room, so that scheduling and cancelling timeouts is O(1) however many rooms there are.
+    """
+
+    def __init__(
+        self,
+        turn_timeout: float = TURN_TIMEOUT,
+        max_missed_turns: int = MAX_MISSED_TURNS,
+        idle_room_timeout: float = IDLE_ROOM_TIMEOUT,
+        finished_room_timeout: float = FINISHED_ROOM_TIMEOUT,
+        player_sweep_interval: float = PLAYER_SWEEP_INTERVAL,
+        rejoin_timeout: float = REJOIN_TIMEOUT,
+        wheel: TimerWheel | None = None,
+    ):
+        self.turn_timeout = turn_timeout
+        self.max_missed_turns = max_missed_turns
+        self.idle_room_timeout = idle_room_timeout
+        self.finished_room_timeout = finished_room_timeout
+        self.player_sweep_interval = player_sweep_interval
+        self.rejoin_timeout = rejoin_timeout
+        self.wheel = wheel if wheel is not None else TimerWheel()
+
+        self.timers: dict[str, Timer] = {}
+        # Turns missed in a row by the players of each room, and the version of the game after the last missed turn
+        self.missed_turns: dict[str, dict[str, int]] = {}
+        self.passed_versions: dict[str, int] = {}
+        # Time until which each player restored after a restart is not swept, in the clock of the wheel
+        self.rejoin_deadlines: dict[str, float] = {}
+        self.wheel.schedule(self.player_sweep_interval, (SWEEP, None, None))
+
+    def watch(self, room: Room) -> None:
+        """
+        Reschedules the timeout of a room given its current state. Must be called after every change to the room.
+        """
+        with room.lock:
+            room_id = room.room_id
+            game = room.game
+            if game is None:
+                payload, delay = (IDLE, room_id, None), self.idle_room_timeout
+            elif game.game_state == GameState.GAME_OVER:
+                payload, delay = (FINISHED, room_id, None), self.finished_room_timeout
+            else:
+                # A player who took their turn no longer misses turns
+                if game.history and self.passed_versions.get(room_id) != game.version:
+                    self.missed_turns.get(room_id, {}).pop(game.history[-1][0], None)
+
+                player_id = game.player_ids[game.current_turn]
+                if player_id not in room.players:
+                    payload, delay = (TURN, room_id, game.version), 0
+                elif room.players[player_id].is_bot:
+                    payload = None
+                else:
+                    payload, delay = (TURN, room_id, game.version), self.turn_timeout
+
+            timer = self.timers.pop(room_id, None)
+            if timer:
+                self.wheel.cancel(timer)
+            if payload:
+                self.timers[room_id] = self.wheel.schedule(delay, payload)
+
+    def expect_rejoin(self, user_ids: Iterable[str], now: float | None = None) -> None:
+        """
+        Gives the clients of players restored after a restart `rejoin_timeout` seconds to rejoin before the players
+        are swept.
+        """
+        now = time.monotonic() if now is None else now
+        for user_id in user_ids:
+            self.rejoin_deadlines[user_id] = now + self.rejoin_timeout
+
+    def unwatch(self, room_id: str) -> None:
+        """
+        Cancels the timeout of a deleted room.
+        """
+        timer = self.timers.pop(room_id, None)
+        if timer:
+            self.wheel.cancel(timer)
+        self.missed_turns.pop(room_id, None)
+        self.passed_versions.pop(room_id, None)
+
+    def run(
+        self,
+        lobby,
+        on_action: Callable[[Room], None],
+        on_room_changed: Callable[[str, List[str]], None],
+        is_connected: Callable[[str], bool],
+        now: float | None = None,
+    ) -> None:
+        """
+        Handles the timeouts that expired up to `now`.
+
+        `on_action` is called with every room whose game changed, while holding the lock of the room, and
+        `on_room_changed` with the id of every room whose players changed or that was deleted, along with the ids of
+        the players removed from the room.
+        """
+        for kind, room_id, version in self.wheel.advance(now):
+            try:
+                if kind == SWEEP:
+                    self.sweep_players(lobby, on_room_changed, is_connected, now)
+                elif kind == TURN:
+                    self.pass_turn(lobby, room_id, version, on_action, on_room_changed)
+                else:
+                    self.expire_room(lobby, room_id, kind, on_room_changed)
+            except Exception:
+                logger.exception("Reaper failed")
+
+    def pass_turn(
+        self,
+        lobby,
+        room_id: str,
+        version: int,
+        on_action: Callable[[Room], None],
+        on_room_changed: Callable[[str, List[str]], None],
+    ) -> None:
+        room = lobby.rooms.get(room_id)
+        if room is None:
+            # The room was deleted while its timeout was rescheduled
+            self.unwatch(room_id)
+            return
+
+        # Only the lock of the room is held while passing, like any other action
+        with room.lock:
+            game = room.game
+            if game.game_state != GameState.IN_PROGRESS or game.version != version:
+                return
+
+            player_id = game.player_ids[game.current_turn]
+            missed_turns = self.missed_turns.setdefault(room_id, {})
+            if player_id in room.players:
+                missed_turns[player_id] = missed_turns.get(player_id, 0) + 1
+
+            # The player may still have legal actions, which a pass skips
+            self.passed_versions[room_id] = version + 1
+            lobby.execute_action(room, player_id, {"type": Action.PASS}, validate=False)
+            on_action(room)
+
+            if missed_turns.get(player_id, 0) < self.max_missed_turns:
+                return
+            missed_turns.pop(player_id)
+
+        with lobby.lock:
+            # The player may have left in the meantime
+            if lobby.rooms.get(room_id) is not room or player_id not in room.players:
+                return
+            lobby.leave_room(player_id, room_id)
+        on_room_changed(room_id, [player_id])
+
+    def expire_room(
+        self,
+        lobby,
+        room_id: str,
+        kind: str,
+        on_room_changed: Callable[[str, List[str]], None],
+    ) -> None:
+        with lobby.lock:
+            room = lobby.rooms.get(room_id)
+            if room is None:
+                # The room was deleted while its timeout was rescheduled
+                self.unwatch(room_id)
+                return
+
+            is_over = room.game and room.game.game_state == GameState.GAME_OVER
+            if (kind == IDLE and room.game) or (kind == FINISHED and not is_over):
+                return
+
+            user_ids = list(room.players)
+            lobby.delete_room(room)
+        on_room_changed(room_id, user_ids)
+
+    def sweep_players(
+        self,
+        lobby,
+        on_room_changed: Callable[[str, List[str]], None],
+        is_connected: Callable[[str], bool],
+        now: float | None = None,
+    ) -> None:
+        """
+        Removes the players whose client disconnected without leaving the lobby, e.g. because of an error, or that
+        were restored from the action log after a restart and whose client did not rejoin in time.
+        """
+        self.wheel.schedule(self.player_sweep_interval, (SWEEP, None, None))
+        now = time.monotonic() if now is None else now
+        self.rejoin_deadlines = {
+            user_id: deadline
+            for user_id, deadline in self.rejoin_deadlines.items()
+            if deadline > now
+        }
+        with lobby.lock:
+            user_ids = [
+                user_id
+                for user_id in lobby.all_players
+                if user_id not in self.rejoin_deadlines and not is_connected(user_id)
+            ]
+        for user_id in user_ids:
+            try:
+                room_id = lobby.leave_lobby(user_id)
+            except PlayerNotFound:
+                # The player left the lobby in the meantime
+                continue
+            if room_id:
+                on_room_changed(room_id, [])
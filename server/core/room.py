@@ -1,6 +1,9 @@
 import json_fix
+import threading
+import time
 from core.base_player import BasePlayer
-from four_players_three_in_a_row.game import Game
+from core.serialization import CachedSerializable
+from four_players_three_in_a_row.game import Game, GameState
 
 
 class RoomClosedException(Exception):
@@ -27,39 +30,112 @@ class PlayerNotAuthorized(Exception):
     pass
 
 
-class Room:
+class Room(CachedSerializable):
     def __init__(self, room_id: str, player: BasePlayer, capacity: int):
         self.room_id = room_id
-        self.players: set[BasePlayer] = set([player])
+        # Players of the room indexed by their id, in the order they joined
+        self.players: dict[str, BasePlayer] = {player.id: player}
         self.admin: BasePlayer = player
         self.capacity: int = capacity
         self.game: Game | None = None
+        # Ids of the players watching the game without playing it
+        self.spectators: set[str] = set()
+        self.created_at: float = time.time()
+        # Sequence number of the last record of the room in the action log, if any
+        self.log_seq = 0
+
+        # Guards the players and the game of the room. Must be held while executing actions on the game.
+        self.lock = threading.RLock()
 
     def add_player(self, player: BasePlayer) -> None:
-        if self.game:
-            raise RoomClosedException("You cannot join an ongoing game.")
+        with self.lock:
+            if self.game:
+                raise RoomClosedException("You cannot join an ongoing game.")
 
-        if len(self.players) == self.capacity:
-            raise RoomMaxCapacityException("The room is at capacity")
+            if len(self.players) == self.capacity:
+                raise RoomMaxCapacityException("The room is at capacity")
 
-        self.players.add(player)
-        player.join_room(self.room_id)
+            self.players[player.id] = player
+            player.join_room(self.room_id)
+            self.mark_dirty()
 
     def remove_player(self, player: BasePlayer) -> None:
-        if player not in self.players:
-            raise PlayerNotInRoom("Player is not in this room.")
+        with self.lock:
+            if self.players.get(player.id) is not player:
+                raise PlayerNotInRoom("Player is not in this room.")
+
+            del self.players[player.id]
+            player.leave_room()
+
+            # Hand the room over to the longest standing human player if the admin left
+            if self.admin is player and self.has_human_players():
+                self.admin = next(p for p in self.players.values() if not p.is_bot)
 
-        self.players.remove(player)
-        player.leave_room()
+            self.mark_dirty()
+
+    def is_open(self) -> bool:
+        """
+        Returns whether the room can still be joined, i.e. it is not at capacity and its game has not started.
+        """
+        return len(self.players) < self.capacity and not self.game
+
+    def has_human_players(self) -> bool:
+        """
+        Returns whether any player of the room is played by a connected client rather than by a bot.
+        """
+        return any(not player.is_bot for player in self.players.values())
+
+    def is_bot_turn(self) -> bool:
+        """
+        Returns whether the game of the room is in progress and waiting on a bot to play.
+        """
+        game = self.game
+        return (
+            game is not None
+            and game.game_state == GameState.IN_PROGRESS
+            and game.players[game.player_ids[game.current_turn]].is_bot
+        )
+
+    def get_player(self, user_id: str) -> BasePlayer:
+        """
+        Retrieves the player of the room given a user_id and raises an exception if the player is not in the room.
+        """
+        if user_id not in self.players:
+            raise PlayerNotInRoom("Player is not in this room.")
+        else:
+            return self.players[user_id]
 
-    def get_game(self, user_id: str) -> Game | None:
+    def rename_player(self, old_id: str, new_id: str) -> None:
+        """
+        Gives a player of the room, and of its game if any, a new id, keeping the order in which players joined.
+        """
+        with self.lock:
+            rename = {old_id: new_id}
+            self.players = {rename.get(id, id): p for id, p in self.players.items()}
+            player = self.players[new_id]
+            player.id = new_id
+            player.mark_dirty()
+            if self.game:
+                self.game.rename_player(old_id, new_id)
+            self.mark_dirty()
+
+    def add_spectator(self, user_id: str) -> None:
+        with self.lock:
+            self.spectators.add(user_id)
+
+    def remove_spectator(self, user_id: str) -> None:
+        with self.lock:
+            self.spectators.discard(user_id)
+
+    def get_game(self, user_id: str, allow_spectators: bool = False) -> Game | None:
         """
         Retrieves the Game object given for the room.
 
-        Validates that the user belongs to the current room.
+        Validates that the user belongs to the current room, or spectates it if `allow_spectators` is true.
         """
-        valid_user = any([p.id == user_id for p in self.players])
-        if not valid_user:
+        if user_id not in self.players and not (
+            allow_spectators and user_id in self.spectators
+        ):
             raise PlayerNotAuthorized(
                 "Player does not have authorization to access this data."
             )
@@ -70,20 +146,50 @@ class Room:
         """
         Starts the game for the current room
         """
-        if len(self.players) < 2:
-            raise NotEnoughPlayers("Not enough players to start the game!")
+        with self.lock:
+            if len(self.players) < 2:
+                raise NotEnoughPlayers("Not enough players to start the game!")
 
-        if self.game:
-            raise GameAlreadyStarted("Game is already started!")
+            if self.game:
+                raise GameAlreadyStarted("Game is already started!")
 
-        self.game = Game(list(self.players))
-        return self.game
+            self.game = Game(list(self.players.values()))
+            self.mark_dirty()
+            return self.game
+
+    def to_snapshot(self):
+        """
+        Returns the data needed to restore the room and its game, see `from_snapshot`.
+        """
+        return {
+            "room_id": self.room_id,
+            "capacity": self.capacity,
+            "created_at": self.created_at,
+            "log_seq": self.log_seq,
+            "admin": self.admin.id,
+            "players": [p.to_snapshot() for p in self.players.values()],
+            "game": self.game.to_snapshot() if self.game else None,
+        }
 
-    def __json__(self):
+    @classmethod
+    def from_snapshot(cls, data) -> "Room":
+        players = [BasePlayer.from_snapshot(p) for p in data["players"]]
+        room = Room(data["room_id"], players[0], data["capacity"])
+        room.players = {p.id: p for p in players}
+        for player in players:
+            player.join_room(room.room_id)
+        room.admin = room.players[data["admin"]]
+        room.created_at = data["created_at"]
+        room.log_seq = data["log_seq"]
+        if data["game"]:
+            room.game = Game.from_snapshot(data["game"])
+        return room
+
+    def to_json(self):
         return {
             "id": self.room_id,
             "admin": self.admin.id,
-            "players": list(self.players),
+            "players": [p.__json__() for p in self.players.values()],
             "can_start_game": len(self.players) >= 2,
             "is_full_capacity": len(self.players) == self.capacity,
             "is_game_started": bool(self.game),
@@ -0,0 +1,58 @@
+import json
+import json_fix
+
+
+class SerializationCacheStats:
+    """
+    Counts how often cached serializations were reused (hits) and rebuilt (misses).
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def __json__(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+serialization_cache_stats = SerializationCacheStats()
+
+
+class CachedSerializable:
+    """
+    Mixin that caches the JSON form of an object until the object is marked dirty.
+
+    Subclasses implement `to_json`, which returns plain JSON data and calls `__json__` on any nested serializable
+    objects so that their caches are reused too. Every method that changes what `to_json` returns must call
+    `mark_dirty`. The cached data is shared between callers and must not be mutated.
+    """
+
+    _json_cache = None
+    _encoded_cache: bytes | None = None
+
+    def to_json(self):
+        raise NotImplementedError
+
+    def mark_dirty(self) -> None:
+        self._json_cache = None
+        self._encoded_cache = None
+
+    def __json__(self):
+        if self._json_cache is None:
+            serialization_cache_stats.misses += 1
+            self._json_cache = self.to_json()
+        else:
+            serialization_cache_stats.hits += 1
+        return self._json_cache
+
+    def encoded(self) -> bytes:
+        """
+        Returns the JSON encoded bytes of the object, encoding it only if it changed since the last call.
+        """
+        if self._encoded_cache is None:
+            self._encoded_cache = json.dumps(self.__json__()).encode()
+        return self._encoded_cache
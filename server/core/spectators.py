@@ -0,0 +1,82 @@
+import json_fix
+import threading
+from typing import List
+from four_players_three_in_a_row.game import Game
+from four_players_three_in_a_row.utils import Coordinate
+
+# Number of updates per second sent to the spectators of a game, whatever the number of actions in between
+SPECTATOR_UPDATES_PER_SECOND = 4
+
+
+def spectator_room(room_id: str) -> str:
+    """
+    Returns the socket io room of the spectators of a room, which is separate from the room of its players.
+    """
+    return f"{room_id}/spectators"
+
+
+class PendingUpdate:
+    """
+    Changes made to a game since its spectators were last updated.
+    """
+
+    def __init__(self, base_version: int):
+        self.base_version = base_version
+        # Cells changed since `base_version`, in the order they changed, or None if a snapshot must be sent instead
+        self.cells: dict[Coordinate, None] | None = {}
+
+
+class SpectatorFeed:
+    """
+    Coalesces the actions of the games with spectators into at most `updates_per_second` updates per game.
+
+    Every action is recorded while holding the lock of its room, which only merges its changed cells into the pending
+    update of the game. A background task takes the pending update of each game on every tick and sends a single delta
+    from the version its spectators last received, in the same format as the deltas sent to players, or the full game
+    if a round started or the game ended in between. Spectators that fall out of sync request a snapshot via
+    `fetch_game_data`, like players.
+    """
+
+    def __init__(self, updates_per_second: float = SPECTATOR_UPDATES_PER_SECOND):
+        self.interval = 1 / updates_per_second
+        self.pending: dict[str, PendingUpdate] = {}
+        self.lock = threading.Lock()
+
+    def record(self, room_id: str, game: Game) -> None:
+        """
+        Records the last action of a game. Must be called while holding the lock of the room, after every action.
+        """
+        with self.lock:
+            update = self.pending.get(room_id)
+            if update is None:
+                update = self.pending[room_id] = PendingUpdate(game.version - 1)
+
+            if game.changed_cells is None:
+                update.cells = None
+            elif update.cells is not None:
+                update.cells.update(dict.fromkeys(game.changed_cells))
+
+    def pending_room_ids(self) -> List[str]:
+        with self.lock:
+            return list(self.pending)
+
+    def take(self, room_id: str) -> PendingUpdate | None:
+        """
+        Removes and returns the pending update of a game, if any. Must be called while holding the lock of the room,
+        so that no action is recorded between taking the update and reading the game.
+        """
+        with self.lock:
+            return self.pending.pop(room_id, None)
+
+
+def get_spectator_update(game: Game, update: PendingUpdate) -> tuple[str, dict]:
+    """
+    Returns the event and data that bring spectators from the base version of a pending update to the current version
+    of the game. Must be called while holding the lock of the room.
+    """
+    if update.cells is None:
+        return "spectator_game_data", {"game": game.__json__()}
+
+    return "spectator_game_delta", {
+        "delta": game.build_delta(update.base_version, list(update.cells))
+    }
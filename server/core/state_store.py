@@ -0,0 +1,166 @@
+import json
+import sqlite3
+import threading
+import zlib
+from itertools import islice
+from typing import List
+
+
+def shard_for_room(room_id: str, num_shards: int) -> int:
+    """
+    Returns the worker process that owns a room. Stable across processes and restarts, unlike the built-in hash.
+    """
+    return zlib.crc32(room_id.encode()) % num_shards
+
+
+class StateStore:
+    """
+    Shared directory of the rooms of every worker process.
+
+    Each worker keeps its own rooms and games in memory and publishes the encoded JSON of a room every time it
+    changes, so that any worker can list every room and knows which worker owns it.
+    """
+
+    def save_room(
+        self, room_id: str, shard: int, created_at: float, is_open: bool, data: bytes
+    ):
+        raise NotImplementedError
+
+    def delete_room(self, room_id: str) -> None:
+        raise NotImplementedError
+
+    def delete_shard(self, shard: int) -> None:
+        """
+        Deletes every room of a worker, e.g. the rooms left behind by a worker that crashed before it restarted.
+        """
+        raise NotImplementedError
+
+    def get_room_shard(self, room_id: str) -> int | None:
+        """
+        Returns the worker that owns a room, or None if the room does not exist.
+        """
+        raise NotImplementedError
+
+    def list_rooms(
+        self, only_open: bool = False, offset: int = 0, limit: int | None = None
+    ) -> List[dict]:
+        """
+        Returns the JSON of the rooms in the order they were created, optionally only the rooms that can still be
+        joined.
+
+        `offset` and `limit` select a single page of the results, and only the rooms of that page are decoded.
+        """
+        raise NotImplementedError
+
+
+class InMemoryStateStore(StateStore):
+    """
+    StateStore for a single worker process, whose rooms are saved for the first time in the order they were created.
+    """
+
+    def __init__(self):
+        # Rooms keep the position of their first save when saved again
+        self.rooms: dict[str, tuple[int, bool, bytes]] = {}
+        self.lock = threading.Lock()
+
+    def save_room(
+        self, room_id: str, shard: int, created_at: float, is_open: bool, data: bytes
+    ):
+        with self.lock:
+            self.rooms[room_id] = (shard, is_open, data)
+
+    def delete_room(self, room_id: str) -> None:
+        with self.lock:
+            self.rooms.pop(room_id, None)
+
+    def delete_shard(self, shard: int) -> None:
+        with self.lock:
+            self.rooms = {
+                room_id: room
+                for room_id, room in self.rooms.items()
+                if room[0] != shard
+            }
+
+    def get_room_shard(self, room_id: str) -> int | None:
+        room = self.rooms.get(room_id)
+        return room[0] if room else None
+
+    def list_rooms(
+        self, only_open: bool = False, offset: int = 0, limit: int | None = None
+    ) -> List[dict]:
+        with self.lock:
+            rooms = (
+                data
+                for _, is_open, data in self.rooms.values()
+                if is_open or not only_open
+            )
+            end = None if limit is None else offset + limit
+            page = list(islice(rooms, offset, end))
+        return [json.loads(data) for data in page]
+
+
+class SQLiteStateStore(StateStore):
+    """
+    StateStore shared by the worker processes of a host through a SQLite database file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # sqlite3 connections cannot be shared between threads
+        self.local = threading.local()
+        connection = self.connection()
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS rooms (
+                room_id TEXT PRIMARY KEY,
+                shard INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                is_open INTEGER NOT NULL,
+                data BLOB NOT NULL
+            )
+            """)
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS rooms_by_creation ON rooms (created_at)"
+        )
+
+    def connection(self) -> sqlite3.Connection:
+        if not hasattr(self.local, "connection"):
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return self.local.connection
+
+    def save_room(
+        self, room_id: str, shard: int, created_at: float, is_open: bool, data: bytes
+    ):
+        self.connection().execute(
+            "INSERT OR REPLACE INTO rooms VALUES (?, ?, ?, ?, ?)",
+            (room_id, shard, created_at, is_open, data),
+        )
+
+    def delete_room(self, room_id: str) -> None:
+        self.connection().execute("DELETE FROM rooms WHERE room_id = ?", (room_id,))
+
+    def delete_shard(self, shard: int) -> None:
+        self.connection().execute("DELETE FROM rooms WHERE shard = ?", (shard,))
+
+    def get_room_shard(self, room_id: str) -> int | None:
+        row = (
+            self.connection()
+            .execute("SELECT shard FROM rooms WHERE room_id = ?", (room_id,))
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def list_rooms(
+        self, only_open: bool = False, offset: int = 0, limit: int | None = None
+    ) -> List[dict]:
+        # A negative limit means no limit in SQLite
+        rows = self.connection().execute(
+            f"""
+            SELECT data FROM rooms {"WHERE is_open" if only_open else ""}
+            ORDER BY created_at LIMIT ? OFFSET ?
+            """,
+            (-1 if limit is None else limit, offset),
+        )
+        return [json.loads(data) for (data,) in rows]
@@ -0,0 +1,74 @@
+import math
+import threading
+import time
+from typing import Any, List
+
+
+class Timer:
+    __slots__ = ("deadline", "payload", "slot")
+
+    def __init__(self, deadline: int, payload: Any, slot: int):
+        # Tick at which the timer expires
+        self.deadline = deadline
+        self.payload = payload
+        self.slot = slot
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel, i.e. a ring of `num_slots` buckets of timers, each covering one `tick` of time.
+
+    A timer is put in the bucket of its deadline modulo the number of buckets, so scheduling and cancelling a timer are
+    O(1) whatever the number of timers. Every tick only visits the timers of one bucket, and expires those whose
+    deadline has passed, while timers due in later rotations of the wheel stay in their bucket. Timers expire up to one
+    tick late, so the tick should be small compared to the timeouts, and the number of buckets large enough that a
+    bucket holds few timers of later rotations.
+    """
+
+    def __init__(self, tick: float = 1.0, num_slots: int = 512):
+        self.tick = tick
+        self.slots: List[set[Timer]] = [set() for _ in range(num_slots)]
+        # Last tick whose timers were expired
+        self.current = self.to_tick(time.monotonic())
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(slot) for slot in self.slots)
+
+    def to_tick(self, now: float) -> int:
+        return math.floor(now / self.tick)
+
+    def schedule(self, delay: float, payload: Any, now: float | None = None) -> Timer:
+        """
+        Schedules `payload` to be returned by `advance` once `delay` seconds have passed.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            deadline = max(self.current + 1, math.ceil((now + delay) / self.tick))
+            timer = Timer(deadline, payload, deadline % len(self.slots))
+            self.slots[timer.slot].add(timer)
+            return timer
+
+    def cancel(self, timer: Timer) -> None:
+        with self.lock:
+            self.slots[timer.slot].discard(timer)
+
+    def advance(self, now: float | None = None) -> List[Any]:
+        """
+        Removes and returns the payloads of the timers that expired up to `now`.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            target = self.to_tick(now)
+            # Past a full rotation, every bucket is visited once
+            num_ticks = min(target - self.current, len(self.slots))
+            expired = []
+            for tick in range(self.current + 1, self.current + num_ticks + 1):
+                slot = self.slots[tick % len(self.slots)]
+                timers = [timer for timer in slot if timer.deadline <= target]
+                for timer in timers:
+                    slot.remove(timer)
+                expired.extend(timer.payload for timer in timers)
+
+            self.current = max(self.current, target)
+            return expired
@@ -0,0 +1,285 @@
+"""
+Vectorized batch engine that plays many games of Four Players Three in a Row at once with NumPy.
+
+The K boards are held as one (K, cells, MAX_STACK_HEIGHT) array of color indices, along with (K, cells) planes of
+stack heights and top colors, so that one action per game is applied and every winning line of every game is checked
+in a handful of array operations. Colors are indices into COLORS_ARRAY, which is also the position of the player in
+the turn order of the round, and -1 marks an empty slot.
+
+For example, to measure the throughput of random play over 10000 concurrent games:
+
+    python -m four_players_three_in_a_row.batch --games 10000 --steps 500
+"""
+
+import argparse
+import time
+import numpy as np
+from four_players_three_in_a_row.utils import (
+    COLORS_ARRAY,
+    GRID_DIMENSION,
+    MAX_STACK_HEIGHT,
+    WINNING_LINE_LENGTH,
+    get_neighbor_index,
+    get_winning_line_index,
+)
+
+# Action types of `BatchGame.step`
+PLACE = 0
+MOVE = 1
+PASS = 2
+
+EMPTY = -1
+NUM_DIRECTIONS = 8
+
+
+class BatchGame:
+    """
+    K independent games with the rules of `Game`, advanced one action per game by `step`.
+
+    Like `Game.start_new_round`, a round that is won resets the board and the pieces of its game, and rotates the
+    players so that the one who moved last in the previous round goes first. Games that played `max_rounds` rounds are finished and
+    ignore further actions.
+    """
+
+    def __init__(
+        self,
+        num_games: int,
+        num_players: int,
+        grid_dimension: int = GRID_DIMENSION,
+        line_length: int = WINNING_LINE_LENGTH,
+        num_pieces: int = 5,
+        max_rounds: int = 5,
+    ):
+        self.num_games = num_games
+        self.num_players = num_players
+        self.grid_dimension = grid_dimension
+        self.num_cells = grid_dimension * grid_dimension
+        self.num_pieces = num_pieces
+        self.max_rounds = max_rounds
+
+        # (L, line_length) flat cell indices of every winning line
+        self.lines = np.array(
+            [
+                [row * grid_dimension + col for row, col in line]
+                for line in get_winning_line_index(grid_dimension, line_length).lines
+            ],
+            dtype=np.intp,
+        )
+        # (cells, 8) flat cell indices of the neighbors of each cell, padded with -1
+        self.neighbors = np.full((self.num_cells, NUM_DIRECTIONS), -1, dtype=np.intp)
+        for (row, col), cells in get_neighbor_index(grid_dimension).items():
+            for i, (x, y) in enumerate(cells):
+                self.neighbors[row * grid_dimension + col, i] = x * grid_dimension + y
+        self.has_neighbor = self.neighbors >= 0
+
+        self.stacks = np.full(
+            (num_games, self.num_cells, MAX_STACK_HEIGHT), EMPTY, dtype=np.int8
+        )
+        self.heights = np.zeros((num_games, self.num_cells), dtype=np.int8)
+        self.tops = np.full((num_games, self.num_cells), EMPTY, dtype=np.int8)
+        # Pieces left by turn position, i.e. by color
+        self.pieces = np.full((num_games, num_players), num_pieces, dtype=np.int16)
+        self.current_turn = np.zeros(num_games, dtype=np.int8)
+        self.current_round = np.ones(num_games, dtype=np.int16)
+        self.finished = np.zeros(num_games, dtype=bool)
+
+        # Round wins by seat, where seat i is the i-th of the players passed to `Game`
+        self.wins_by_seat = np.zeros((num_games, num_players), dtype=np.int32)
+        self.rounds_won = 0
+        self.draws = 0
+
+    def reset_rounds(self, games: np.ndarray) -> None:
+        """
+        Starts a new round for the games in the boolean mask `games`, finishing those that played every round.
+        """
+        self.stacks[games] = EMPTY
+        self.heights[games] = 0
+        self.tops[games] = EMPTY
+        self.pieces[games] = self.num_pieces
+        self.current_turn[games] = 0
+        self.current_round[games] += 1
+        self.finished |= games & (self.current_round > self.max_rounds)
+
+    def winning_colors(self) -> np.ndarray:
+        """
+        Returns a (K, 4) boolean array of the colors that have a complete line in each game.
+
+        More than one color can win at once when a moved piece uncovers another line, which is a draw, just like in
+        `Game.maybe_players_won`.
+        """
+        line_tops = self.tops[:, self.lines]
+        first = line_tops[:, :, 0]
+        complete = (first != EMPTY) & (line_tops == first[:, :, None]).all(axis=2)
+        return np.stack(
+            [
+                (complete & (first == color)).any(axis=1)
+                for color in range(len(COLORS_ARRAY))
+            ],
+            axis=1,
+        )
+
+    def legal_place_mask(self) -> np.ndarray:
+        """
+        Returns a (K, cells, MAX_STACK_HEIGHT) boolean array of whether the current player of each game can place
+        1, 2 or 3 pieces on each cell.
+        """
+        pieces = self.pieces[np.arange(self.num_games), self.current_turn]
+        counts = np.arange(1, MAX_STACK_HEIGHT + 1)
+        return (
+            (self.heights[:, :, None] + counts <= MAX_STACK_HEIGHT)
+            & (counts <= pieces[:, None, None])
+            & ~self.finished[:, None, None]
+        )
+
+    def legal_move_mask(self) -> np.ndarray:
+        """
+        Returns a (K, cells, 8) boolean array of whether the current player of each game can move the piece on top
+        of each cell to each of its neighbors.
+        """
+        own_top = self.tops == self.current_turn[:, None]
+        neighbor_heights = self.heights[:, self.neighbors]
+        return (
+            own_top[:, :, None]
+            & self.has_neighbor
+            & (neighbor_heights < MAX_STACK_HEIGHT)
+            & ~self.finished[:, None, None]
+        )
+
+    def step(
+        self,
+        action_types: np.ndarray,
+        cells: np.ndarray,
+        targets: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Applies one action for the current player of every game, without validation.
+
+        For a PLACE, `cells` is the flat cell index and `targets` the number of pieces. For a MOVE, `cells` is the
+        flat cell index of the moved piece and `targets` the flat cell index it moves to. Actions of finished games
+        are ignored.
+
+        Returns a (K, 4) boolean array of the colors that won the round in each game.
+        """
+        games = np.arange(self.num_games)
+        active = ~self.finished
+        colors = self.current_turn
+
+        moves = active & (action_types == MOVE)
+        idx = games[moves]
+        from_cells = cells[moves]
+        self.heights[idx, from_cells] -= 1
+        self.stacks[idx, from_cells, self.heights[idx, from_cells]] = EMPTY
+        self.push(idx, targets[moves], colors[moves])
+        self.update_tops(idx, from_cells)
+
+        places = active & (action_types == PLACE)
+        for count in range(1, MAX_STACK_HEIGHT + 1):
+            idx = games[places & (targets >= count)]
+            self.push(idx, cells[idx], colors[idx])
+        idx = games[places]
+        self.pieces[idx, colors[idx]] -= targets[idx]
+
+        winners = self.winning_colors() & active[:, None]
+        won = winners.any(axis=1)
+
+        # Credit the seat of each winning color. Like `Game`, the players are rotated by one seat before every round,
+        # including the first one.
+        for color in range(self.num_players):
+            seats = (color - self.current_round) % self.num_players
+            self.wins_by_seat[games, seats] += winners[:, color]
+        self.rounds_won += int(won.sum())
+        self.draws += int((winners.sum(axis=1) > 1).sum())
+
+        self.current_turn[active & ~won] = (
+            self.current_turn[active & ~won] + 1
+        ) % self.num_players
+        self.reset_rounds(won)
+        return winners
+
+    def push(self, idx: np.ndarray, cells: np.ndarray, colors: np.ndarray) -> None:
+        self.stacks[idx, cells, self.heights[idx, cells]] = colors
+        self.heights[idx, cells] += 1
+        self.tops[idx, cells] = colors
+
+    def update_tops(self, idx: np.ndarray, cells: np.ndarray) -> None:
+        heights = self.heights[idx, cells]
+        self.tops[idx, cells] = np.where(
+            heights > 0,
+            self.stacks[idx, cells, np.maximum(heights - 1, 0)],
+            EMPTY,
+        )
+
+
+def random_actions(
+    batch: BatchGame, rng: np.random.Generator
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Picks a uniformly random legal action for every game, or a pass if there are none.
+
+    Returns the `action_types`, `cells` and `targets` arrays expected by `BatchGame.step`.
+    """
+    place_mask = batch.legal_place_mask().reshape(batch.num_games, -1)
+    move_mask = batch.legal_move_mask().reshape(batch.num_games, -1)
+    legal = np.concatenate([place_mask, move_mask], axis=1)
+
+    # The legal action with the highest random score is a uniformly random legal action
+    scores = np.where(legal, rng.random(legal.shape), -1.0)
+    choice = scores.argmax(axis=1)
+
+    num_place = place_mask.shape[1]
+    is_place = choice < num_place
+    place_cells, place_counts = np.divmod(choice, MAX_STACK_HEIGHT)
+    move_cells, directions = np.divmod(choice - num_place, NUM_DIRECTIONS)
+    move_cells = np.where(is_place, 0, move_cells)
+    directions = np.where(is_place, 0, directions)
+
+    action_types = np.where(is_place, PLACE, MOVE)
+    action_types[~legal.any(axis=1)] = PASS
+    cells = np.where(is_place, place_cells, move_cells)
+    targets = np.where(
+        is_place, place_counts + 1, batch.neighbors[move_cells, directions]
+    )
+    return action_types, cells, targets
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--grid-dimension", type=int, default=GRID_DIMENSION)
+    parser.add_argument("--line-length", type=int, default=WINNING_LINE_LENGTH)
+    parser.add_argument("--num-pieces", type=int, default=5)
+    parser.add_argument("--max-rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    batch = BatchGame(
+        args.games,
+        args.players,
+        grid_dimension=args.grid_dimension,
+        line_length=args.line_length,
+        num_pieces=args.num_pieces,
+        max_rounds=args.max_rounds,
+    )
+
+    start = time.perf_counter()
+    positions = 0
+    for _ in range(args.steps):
+        positions += int((~batch.finished).sum())
+        batch.step(*random_actions(batch, rng))
+        if batch.finished.all():
+            break
+    elapsed = time.perf_counter() - start
+
+    print(f"Positions: {positions} in {elapsed:.1f}s ({positions / elapsed:.0f}/sec)")
+    print(f"Finished games: {int(batch.finished.sum())} of {args.games}")
+    print(f"Rounds won: {batch.rounds_won} ({batch.draws} draws)")
+    seat_wins = batch.wins_by_seat.sum(axis=0)
+    for seat, wins in enumerate(seat_wins):
+        print(f"  seat {seat}: {wins / max(seat_wins.sum(), 1):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,127 @@
 import json_fix
+from array import array
+from core.serialization import CachedSerializable
 from typing import List
 from four_players_three_in_a_row.utils import (
     GRID_DIMENSION,
+    MAX_STACK_HEIGHT,
     Color,
+    COLORS_ARRAY,
     get_default_color_grid,
 )
 
 
-class Board:
-    def __init__(self):
-        self.grid = get_default_color_grid(GRID_DIMENSION)
+class Board(CachedSerializable):
+    def __init__(self, grid_dimension: int = GRID_DIMENSION):
+        self.grid_dimension = grid_dimension
+        self.grid = get_default_color_grid(grid_dimension)
 
     def reset_board(self):
         """
         Resets the board to the default state
         """
-        self.grid = get_default_color_grid((GRID_DIMENSION))
+        self.grid = get_default_color_grid(self.grid_dimension)
+        self.mark_dirty()
 
     def value_at(self, row: int, col: int) -> List[Color]:
         return self.grid[row][col]
 
-    def __json__(self):
-        return self.grid
+    def height(self, row: int, col: int) -> int:
+        return len(self.grid[row][col])
+
+    def top_color(self, row: int, col: int) -> Color | None:
+        cell = self.grid[row][col]
+        return cell[-1] if cell else None
+
+    def push(self, row: int, col: int, color: Color) -> None:
+        self.grid[row][col].append(color)
+        self.mark_dirty()
+
+    def pop(self, row: int, col: int) -> Color:
+        color = self.grid[row][col].pop()
+        self.mark_dirty()
+        return color
+
+    def to_json(self):
+        return [[list(cell) for cell in row] for row in self.grid]
+
+
+# Each cell of a PackedBoard is one byte: the lowest 2 bits hold the stack height and every following pair of bits
+# holds the index into COLORS_ARRAY of one piece, from the bottom of the stack upwards.
+HEIGHT_MASK = 0b11
+COLOR_BITS = 2
+COLOR_INDEX: dict[Color, int] = {color: i for i, color in enumerate(COLORS_ARRAY)}
+
+
+class PackedBoard(CachedSerializable):
+    """
+    A Board backend that packs each cell stack into a single byte of an array('B').
+
+    It exposes the same methods and wire format as Board, but holds one small buffer per game instead of a list of
+    lists of lists, and answers height and top color queries without allocating. `value_at` builds a new list on every
+    call, so hot paths should use `height` and `top_color` instead.
+    """
+
+    def __init__(self, grid_dimension: int = GRID_DIMENSION):
+        self.grid_dimension = grid_dimension
+        self.cells = array("B", bytes(grid_dimension * grid_dimension))
+
+    def reset_board(self):
+        """
+        Resets the board to the default state
+        """
+        self.cells = array("B", bytes(self.grid_dimension * self.grid_dimension))
+        self.mark_dirty()
+
+    def value_at(self, row: int, col: int) -> List[Color]:
+        cell = self.cells[row * self.grid_dimension + col]
+        return [
+            COLORS_ARRAY[(cell >> (COLOR_BITS * (i + 1))) & HEIGHT_MASK]
+            for i in range(cell & HEIGHT_MASK)
+        ]
+
+    def height(self, row: int, col: int) -> int:
+        return self.cells[row * self.grid_dimension + col] & HEIGHT_MASK
+
+    def top_color(self, row: int, col: int) -> Color | None:
+        cell = self.cells[row * self.grid_dimension + col]
+        height = cell & HEIGHT_MASK
+        if height == 0:
+            return None
+        return COLORS_ARRAY[(cell >> (COLOR_BITS * height)) & HEIGHT_MASK]
+
+    def push(self, row: int, col: int, color: Color) -> None:
+        index = row * self.grid_dimension + col
+        cell = self.cells[index]
+        height = cell & HEIGHT_MASK
+        if height == MAX_STACK_HEIGHT:
+            raise IndexError("push onto a full stack")
+
+        # Clear the old height, store the new piece above the current top and bump the height
+        self.cells[index] = (
+            (cell & ~HEIGHT_MASK)
+            | (COLOR_INDEX[color] << (COLOR_BITS * (height + 1)))
+            | (height + 1)
+        )
+        self.mark_dirty()
+
+    def pop(self, row: int, col: int) -> Color:
+        index = row * self.grid_dimension + col
+        cell = self.cells[index]
+        height = cell & HEIGHT_MASK
+        if height == 0:
+            raise IndexError("pop from an empty stack")
+
+        shift = COLOR_BITS * height
+        color = COLORS_ARRAY[(cell >> shift) & HEIGHT_MASK]
+        self.cells[index] = (cell & ~(HEIGHT_MASK << shift) & ~HEIGHT_MASK) | (
+            height - 1
+        )
+        self.mark_dirty()
+        return color
+
+    def to_json(self):
+        return [
+            [self.value_at(row, col) for col in range(self.grid_dimension)]
+            for row in range(self.grid_dimension)
+        ]
@@ -0,0 +1,429 @@
+"""
+Computer players for Four Players Three in a Row, used to fill the empty seats of a room.
+
+Bots search the game tree with iterative deepening alpha-beta under a time budget per move. With more than two players,
+the search is "paranoid": the bot maximizes its score while every other player is assumed to minimize it. Positions are
+hashed with Zobrist keys over the stacks of the board, the player to move and the pieces left of every player, and the
+results of previous searches are kept in a transposition table.
+
+The search is CPU bound, so the server runs `find_bot_action` in a separate pool of processes with a lower priority,
+which never blocks the rooms of human players. Each process keeps its own transposition table across moves.
+"""
+
+import os
+import random
+import time
+from functools import cache
+from typing import List
+from four_players_three_in_a_row.game import Game
+from four_players_three_in_a_row.utils import (
+    COLORS_ARRAY,
+    MAX_STACK_HEIGHT,
+    Action,
+    PossibleActions,
+    get_neighbor_index,
+    get_winning_line_index,
+)
+
+# Niceness added to the bot processes, so that the OS schedules the server processes of human games first
+BOT_NICENESS = 10
+
+# Number of entries after which the transposition table of a process is cleared
+MAX_TRANSPOSITION_ENTRIES = 1_000_000
+
+# Deepest search, in plies, which is only reached on nearly empty boards
+MAX_SEARCH_DEPTH = 32
+
+# Number of nodes searched between two checks of the deadline
+NODES_PER_DEADLINE_CHECK = 256
+
+WIN_SCORE = 1_000_000
+
+# Actions of the search are tuples of flat cell indices, which are converted with `to_action` once chosen:
+# (Action.PLACE, cell, num_pieces), (Action.MOVE, from_cell, to_cell) or (Action.PASS,)
+type SearchAction = tuple
+
+# Flags of the transposition table entries, i.e. whether the stored score is exact or a bound
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+transposition_table: dict[int, tuple[int, int, int, SearchAction | None]] = {}
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class ZobristKeys:
+    """
+    Random 64 bit keys of every (cell, stack slot, color), player to move and (color, pieces left), such that the hash
+    of a position is the xor of the keys of its features and can be updated incrementally on every action.
+
+    Keys are drawn from a fixed seed so that hashes are the same in every process.
+    """
+
+    def __init__(self, num_cells: int, max_pieces: int):
+        rng = random.Random(0)
+        num_colors = len(COLORS_ARRAY)
+        self.stacks = [
+            [
+                [rng.getrandbits(64) for _ in range(num_colors)]
+                for _ in range(MAX_STACK_HEIGHT)
+            ]
+            for _ in range(num_cells)
+        ]
+        self.turns = [rng.getrandbits(64) for _ in range(num_colors)]
+        self.pieces = [
+            [rng.getrandbits(64) for _ in range(max_pieces + 1)]
+            for _ in range(num_colors)
+        ]
+        # Distinguishes the searches of different bots, since the score of a position depends on who is searching
+        self.searchers = [rng.getrandbits(64) for _ in range(num_colors)]
+
+
+@cache
+def get_zobrist_keys(num_cells: int, max_pieces: int) -> ZobristKeys:
+    return ZobristKeys(num_cells, max_pieces)
+
+
+@cache
+def get_flat_indexes(
+    grid_dimension: int, line_length: int
+) -> tuple[List[tuple[int, ...]], List[List[tuple[int, ...]]], List[List[int]]]:
+    """
+    Returns the winning lines, the winning lines of each cell and the neighbors of each cell in flat cell indices.
+    """
+    winning_lines = get_winning_line_index(grid_dimension, line_length)
+    neighbors = get_neighbor_index(grid_dimension)
+
+    def flat(coordinate):
+        return coordinate[0] * grid_dimension + coordinate[1]
+
+    lines = [tuple(flat(c) for c in line) for line in winning_lines.lines]
+    lines_by_cell = [[] for _ in range(grid_dimension * grid_dimension)]
+    neighbors_by_cell = [[] for _ in range(grid_dimension * grid_dimension)]
+    for coordinate, cell_lines in winning_lines.lines_by_cell.items():
+        lines_by_cell[flat(coordinate)] = [
+            tuple(flat(c) for c in line) for line in cell_lines
+        ]
+        neighbors_by_cell[flat(coordinate)] = [flat(c) for c in neighbors[coordinate]]
+
+    return lines, lines_by_cell, neighbors_by_cell
+
+
+class SearchState:
+    """
+    Compact copy of the round in progress of a `Game`, with colors as indices of COLORS_ARRAY, that can be sent to a bot
+    process and on which actions are applied and undone in place during the search.
+    """
+
+    def __init__(self, game: Game, player_id: str):
+        self.grid_dimension = game.grid_dimension
+        self.line_length = game.line_length
+        self.num_players = len(game.player_ids)
+        self.max_pieces = game.num_pieces
+        self.searcher = game.player_ids.index(player_id)
+        self.turn = game.current_turn
+
+        n = game.grid_dimension
+        self.stacks: List[List[int]] = [
+            [COLORS_ARRAY.index(color) for color in game.board.value_at(row, col)]
+            for row in range(n)
+            for col in range(n)
+        ]
+        self.pieces: List[int] = [game.players[id].num_pieces for id in game.player_ids]
+
+    def __getstate__(self):
+        return {
+            key: value
+            for key, value in self.__dict__.items()
+            if key not in ("lines", "lines_by_cell", "neighbors", "keys", "hash")
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def prepare(self) -> None:
+        """
+        Builds the indexes and the hash used by the search, which are not sent between processes.
+        """
+        self.lines, self.lines_by_cell, self.neighbors = get_flat_indexes(
+            self.grid_dimension, self.line_length
+        )
+        self.keys = get_zobrist_keys(len(self.stacks), self.max_pieces)
+
+        self.hash = self.keys.turns[self.turn] ^ self.keys.searchers[self.searcher]
+        for cell, stack in enumerate(self.stacks):
+            for slot, color in enumerate(stack):
+                self.hash ^= self.keys.stacks[cell][slot][color]
+        for color, pieces in enumerate(self.pieces):
+            self.hash ^= self.keys.pieces[color][pieces]
+
+    def legal_actions(self) -> List[SearchAction]:
+        """
+        Lists every legal action of the player to move, following the same rules as `Game.legal_actions`, or a single
+        pass if there are none.
+        """
+        stacks = self.stacks
+        color = self.turn
+        max_place = min(self.pieces[color], MAX_STACK_HEIGHT)
+
+        actions: List[SearchAction] = []
+        for cell, stack in enumerate(stacks):
+            for num_pieces in range(
+                1, min(max_place, MAX_STACK_HEIGHT - len(stack)) + 1
+            ):
+                actions.append((Action.PLACE, cell, num_pieces))
+
+            if stack and stack[-1] == color:
+                for to_cell in self.neighbors[cell]:
+                    if len(stacks[to_cell]) < MAX_STACK_HEIGHT:
+                        actions.append((Action.MOVE, cell, to_cell))
+
+        return actions or [(Action.PASS,)]
+
+    def push(self, cell: int, color: int) -> None:
+        stack = self.stacks[cell]
+        self.hash ^= self.keys.stacks[cell][len(stack)][color]
+        stack.append(color)
+
+    def pop(self, cell: int) -> int:
+        stack = self.stacks[cell]
+        color = stack.pop()
+        self.hash ^= self.keys.stacks[cell][len(stack)][color]
+        return color
+
+    def set_pieces(self, color: int, pieces: int) -> None:
+        self.hash ^= self.keys.pieces[color][self.pieces[color]]
+        self.pieces[color] = pieces
+        self.hash ^= self.keys.pieces[color][pieces]
+
+    def set_turn(self, turn: int) -> None:
+        self.hash ^= self.keys.turns[self.turn] ^ self.keys.turns[turn]
+        self.turn = turn
+
+    def apply(self, action: SearchAction) -> int:
+        """
+        Applies an action of the player to move and passes the turn.
+
+        Returns a bitmask of the colors that completed a line, following the same rules as `Game.maybe_players_won`.
+        """
+        color = self.turn
+        if action[0] == Action.PLACE:
+            _, cell, num_pieces = action
+            for _ in range(num_pieces):
+                self.push(cell, color)
+            self.set_pieces(color, self.pieces[color] - num_pieces)
+            changed_cells = (cell,)
+        elif action[0] == Action.MOVE:
+            _, from_cell, to_cell = action
+            self.push(to_cell, self.pop(from_cell))
+            changed_cells = (from_cell, to_cell)
+        else:
+            changed_cells = ()
+
+        self.set_turn((color + 1) % self.num_players)
+        return self.winning_colors(changed_cells)
+
+    def undo(self, action: SearchAction) -> None:
+        """
+        Undoes the last action, which was played by the player before the one to move.
+        """
+        color = (self.turn - 1) % self.num_players
+        self.set_turn(color)
+        if action[0] == Action.PLACE:
+            _, cell, num_pieces = action
+            for _ in range(num_pieces):
+                self.pop(cell)
+            self.set_pieces(color, self.pieces[color] + num_pieces)
+        elif action[0] == Action.MOVE:
+            _, from_cell, to_cell = action
+            self.push(from_cell, self.pop(to_cell))
+
+    def winning_colors(self, changed_cells: tuple[int, ...]) -> int:
+        stacks = self.stacks
+        winners = 0
+        for cell in changed_cells:
+            for line in self.lines_by_cell[cell]:
+                first = stacks[line[0]]
+                if not first:
+                    continue
+                color = first[-1]
+                if all(stacks[c] and stacks[c][-1] == color for c in line):
+                    winners |= 1 << color
+        return winners
+
+    def evaluate(self) -> int:
+        """
+        Scores a position in which no line is complete from the point of view of the searching bot.
+
+        Every line whose top pieces all belong to a single player is worth exponentially more the more of its cells
+        are covered, which counts the threats of the searching bot against those of its opponents.
+        """
+        stacks = self.stacks
+        score = 0
+        for line in self.lines:
+            owner = -1
+            count = 0
+            for cell in line:
+                stack = stacks[cell]
+                if not stack:
+                    continue
+                if owner == -1:
+                    owner = stack[-1]
+                elif stack[-1] != owner:
+                    owner = -2
+                    break
+                count += 1
+
+            if owner >= 0:
+                value = 4**count
+                score += value if owner == self.searcher else -value
+
+        return score
+
+
+class Search:
+    """
+    Iterative deepening alpha-beta search of a `SearchState` until a deadline.
+    """
+
+    def __init__(self, state: SearchState, deadline: float):
+        self.state = state
+        self.deadline = deadline
+        self.nodes = 0
+
+    def terminal_score(self, winners: int, ply: int) -> int:
+        # Quicker wins and slower losses score higher. A draw is still a round won by every player in it.
+        if winners & (1 << self.state.searcher):
+            return WIN_SCORE - ply
+        return -WIN_SCORE + ply
+
+    def order_actions(self, actions: List[SearchAction], best: SearchAction | None):
+        if best in actions:
+            actions.remove(best)
+            actions.insert(0, best)
+        return actions
+
+    def alpha_beta(self, depth: int, ply: int, alpha: int, beta: int) -> int:
+        self.nodes += 1
+        if (
+            self.nodes % NODES_PER_DEADLINE_CHECK == 0
+            and time.perf_counter() > self.deadline
+        ):
+            raise SearchTimeout()
+
+        state = self.state
+        original_alpha, original_beta = alpha, beta
+        entry = transposition_table.get(state.hash)
+        best_action = None
+        if entry is not None:
+            entry_depth, entry_score, flag, best_action = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return entry_score
+                elif flag == LOWER_BOUND:
+                    alpha = max(alpha, entry_score)
+                else:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return entry_score
+
+        maximizing = state.turn == state.searcher
+        best_score = -WIN_SCORE - 1 if maximizing else WIN_SCORE + 1
+        for action in self.order_actions(state.legal_actions(), best_action):
+            winners = state.apply(action)
+            try:
+                if winners:
+                    score = self.terminal_score(winners, ply + 1)
+                elif depth <= 1:
+                    score = state.evaluate()
+                else:
+                    score = self.alpha_beta(depth - 1, ply + 1, alpha, beta)
+            finally:
+                state.undo(action)
+
+            if maximizing:
+                if score > best_score:
+                    best_score, best_action = score, action
+                alpha = max(alpha, score)
+            else:
+                if score < best_score:
+                    best_score, best_action = score, action
+                beta = min(beta, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= original_beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        transposition_table[state.hash] = (depth, best_score, flag, best_action)
+        return best_score
+
+    def run(self) -> SearchAction:
+        """
+        Searches one ply deeper at a time until the deadline, and returns the best action of the deepest search that
+        completed.
+        """
+        actions = self.state.legal_actions()
+        best_action = actions[0]
+        for depth in range(1, MAX_SEARCH_DEPTH + 1):
+            try:
+                score = self.alpha_beta(depth, 0, -WIN_SCORE - 1, WIN_SCORE + 1)
+            except SearchTimeout:
+                break
+
+            best_action = transposition_table[self.state.hash][3] or best_action
+            # Stop once the outcome of the round is known
+            if abs(score) > WIN_SCORE - MAX_SEARCH_DEPTH:
+                break
+
+        return best_action
+
+
+def to_action(state: SearchState, action: SearchAction) -> PossibleActions:
+    n = state.grid_dimension
+    if action[0] == Action.PLACE:
+        _, cell, num_pieces = action
+        return {
+            "type": Action.PLACE,
+            "num_pieces": num_pieces,
+            "row": cell // n,
+            "col": cell % n,
+        }
+    elif action[0] == Action.MOVE:
+        _, from_cell, to_cell = action
+        return {
+            "type": Action.MOVE,
+            "from_row": from_cell // n,
+            "from_col": from_cell % n,
+            "to_row": to_cell // n,
+            "to_col": to_cell % n,
+        }
+    else:
+        return {"type": Action.PASS}
+
+
+def find_bot_action(state: SearchState, time_budget: float) -> PossibleActions:
+    """
+    Returns the action a bot plays in the given position, searched for at most `time_budget` seconds.
+
+    Runs in a bot process, where the transposition table is kept across calls and cleared once it grows too large.
+    """
+    deadline = time.perf_counter() + time_budget
+    if len(transposition_table) > MAX_TRANSPOSITION_ENTRIES:
+        transposition_table.clear()
+
+    state.prepare()
+    return to_action(state, Search(state, deadline).run())
+
+
+def init_bot_process() -> None:
+    """
+    Initializer of the bot processes, which lowers their priority below the server processes.
+    """
+    os.nice(BOT_NICENESS)
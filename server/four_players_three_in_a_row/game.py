@@ -1,16 +1,38 @@
 import json_fix
 from enum import Enum
-from typing import List
+from typing import List, TypedDict
 from core.base_player import BasePlayer
+from core.serialization import CachedSerializable
 from four_players_three_in_a_row.utils import (
     GRID_DIMENSION,
+    WINNING_LINE_LENGTH,
+    MAX_STACK_HEIGHT,
     Color,
+    Coordinate,
+    WinningLine,
     COLORS_ARRAY,
     Action,
+    ActionGrid,
+    Move,
     PossibleActions,
+    get_default_action_grid,
+    get_neighbor_index,
+    get_winning_line_index,
 )
 from four_players_three_in_a_row.player import Player
-from four_players_three_in_a_row.board import Board
+from four_players_three_in_a_row.board import Board, PackedBoard
+
+
+class GameNotInProgress(Exception):
+    pass
+
+
+class NotPlayersTurn(Exception):
+    pass
+
+
+class InvalidAction(Exception):
+    pass
 
 
 class GameState(str, Enum):
@@ -18,21 +40,69 @@ class GameState(str, Enum):
     GAME_OVER = "GAME_OVER"
 
 
-class Game:
-    def __init__(self, base_players: List[BasePlayer]):
+class CellDelta(TypedDict):
+    """
+    Represents the new stack of a single cell that changed since the previous version of the game
+    """
+
+    row: int
+    col: int
+    stack: List[Color]
+
+
+class GameDelta(TypedDict):
+    """
+    Represents the changes made to a game by a single action.
+
+    Clients apply a delta only if their copy of the game is at `base_version`, and otherwise request a full snapshot.
+    """
+
+    base_version: int
+    version: int
+    cells: List[CellDelta]
+    current_turn: int
+    num_pieces: dict[str, int]
+    action_grid: ActionGrid
+
+
+class Game(CachedSerializable):
+    def __init__(
+        self,
+        base_players: List[BasePlayer],
+        grid_dimension: int = GRID_DIMENSION,
+        line_length: int = WINNING_LINE_LENGTH,
+        board_class: type[Board] | type[PackedBoard] = Board,
+        max_rounds: int = 5,
+        num_pieces: int = 5,
+    ):
         # TODO(Edge case): check numPlayers>=2 and numPlayers<=4
 
         self.game_state = GameState.IN_PROGRESS
         self.current_turn = 0
         self.current_round = 0
-        self.max_rounds = 5
+        self.max_rounds = max_rounds
+        # Number of pieces each player receives at the start of every round
+        self.num_pieces = num_pieces
         self.max_players = 4  # TODO: Validate max players
         self.winners: List[List[str]] = []
 
-        self.board = Board()
+        # Monotonically increasing sequence number of the game state, bumped by every action
+        self.version = 0
+        # Cells changed by the last action, or None if the last action requires a full snapshot to be sent
+        self.changed_cells: List[Coordinate] | None = None
+
+        self.grid_dimension = grid_dimension
+        self.line_length = line_length
+        self.winning_lines = get_winning_line_index(grid_dimension, line_length)
+        self.neighbors = get_neighbor_index(grid_dimension)
+        self.board = board_class(grid_dimension)
 
         self.player_ids: List[str] = []
         self.players: dict[str, Player] = {}
+        # Order of the players before the rotation of the first round, which together with the history of the
+        # actions determines every state of the game, see `Replay`
+        self.initial_player_ids = [bp.id for bp in base_players]
+        self.history: List[Move] = []
         for bp in base_players:
             p = Player(Color.RED, bp)
             self.player_ids.append(bp.id)
@@ -40,15 +110,103 @@ class Game:
 
         self.start_new_round()
 
-    def __json__(self):
+    def to_json(self):
+        return {
+            "game_state": self.game_state,
+            "winners": [list(round_winners) for round_winners in self.winners],
+            "board": self.board.__json__(),
+            "player_ids": list(self.player_ids),
+            "players": {id: p.__json__() for id, p in self.players.items()},
+            "current_turn": self.current_turn,
+            "current_round": self.current_round,
+            "version": self.version,
+            "action_grid": self.legal_actions(self.player_ids[self.current_turn]),
+        }
+
+    def to_snapshot(self):
+        """
+        Returns the data needed to restore the game, see `from_snapshot`. Unlike `to_json`, it includes the settings
+        of the game and the players who left the room, and leaves out what is derived from the rest.
+        """
         return {
             "game_state": self.game_state,
-            "winners": self.winners,
-            "board": self.board,
-            "player_ids": self.player_ids,
-            "players": self.players,
             "current_turn": self.current_turn,
             "current_round": self.current_round,
+            "max_rounds": self.max_rounds,
+            "num_pieces": self.num_pieces,
+            "winners": [list(round_winners) for round_winners in self.winners],
+            "version": self.version,
+            "grid_dimension": self.grid_dimension,
+            "line_length": self.line_length,
+            "board_class": type(self.board).__name__,
+            "board": self.board.__json__(),
+            "player_ids": list(self.player_ids),
+            "players": [
+                {**p.to_snapshot(), "color": p.color, "num_pieces": p.num_pieces}
+                for p in self.players.values()
+            ],
+            "initial_player_ids": list(self.initial_player_ids),
+            "history": [list(move) for move in self.history],
+        }
+
+    @classmethod
+    def from_snapshot(cls, data) -> "Game":
+        board_classes = {"Board": Board, "PackedBoard": PackedBoard}
+        game = Game(
+            [BasePlayer.from_snapshot(p) for p in data["players"]],
+            grid_dimension=data["grid_dimension"],
+            line_length=data["line_length"],
+            board_class=board_classes[data["board_class"]],
+            max_rounds=data["max_rounds"],
+            num_pieces=data["num_pieces"],
+        )
+        game.game_state = GameState(data["game_state"])
+        game.current_turn = data["current_turn"]
+        game.current_round = data["current_round"]
+        game.winners = data["winners"]
+        game.version = data["version"]
+        game.player_ids = data["player_ids"]
+        game.initial_player_ids = data["initial_player_ids"]
+        game.history = [(player_id, action) for player_id, action in data["history"]]
+        for p in data["players"]:
+            player = game.players[p["id"]]
+            player.color = Color(p["color"])
+            player.num_pieces = p["num_pieces"]
+            player.mark_dirty()
+
+        for row, cells in enumerate(data["board"]):
+            for col, stack in enumerate(cells):
+                for color in stack:
+                    game.board.push(row, col, Color(color))
+        game.mark_dirty()
+        return game
+
+    def get_delta(self) -> GameDelta | None:
+        """
+        Returns the changes made by the last action, or None if the last action started a new round or ended the game
+        and a full snapshot must be sent instead.
+        """
+        if self.changed_cells is None:
+            return None
+
+        return self.build_delta(self.version - 1, self.changed_cells)
+
+    def build_delta(self, base_version: int, cells: List[Coordinate]) -> GameDelta:
+        """
+        Returns the delta from `base_version` to the current version, given the cells changed in between.
+
+        The stacks are copied, so that the delta can be sent after releasing the lock of the room.
+        """
+        return {
+            "base_version": base_version,
+            "version": self.version,
+            "cells": [
+                {"row": row, "col": col, "stack": list(self.board.value_at(row, col))}
+                for row, col in dict.fromkeys(cells)
+            ],
+            "current_turn": self.current_turn,
+            "num_pieces": {id: p.num_pieces for id, p in self.players.items()},
+            "action_grid": self.legal_actions(self.player_ids[self.current_turn]),
         }
 
     def start_new_round(self):
@@ -61,6 +219,8 @@ class Game:
         If the number of rounds has hit the maximum number of rounds, the game ends and returns the winner of the game
         """
         self.current_round += 1
+        self.changed_cells = None
+        self.mark_dirty()
 
         if self.current_round > self.max_rounds:
             self.game_state = GameState.GAME_OVER
@@ -70,43 +230,38 @@ class Game:
         self.player_ids.insert(0, last_player)
         for i in range(len(self.player_ids)):
             player = self.players[self.player_ids[i]]
-            player.num_pieces = 5
+            player.num_pieces = self.num_pieces
             player.color = COLORS_ARRAY[i]
+            player.mark_dirty()
 
         self.board.reset_board()
         self.current_turn = 0
 
     def is_in_bounds(self, row: int, col: int) -> bool:
-        return 0 <= row < GRID_DIMENSION and 0 <= col < GRID_DIMENSION
+        return 0 <= row < self.grid_dimension and 0 <= col < self.grid_dimension
 
-    def get_coordinates_to_check(self, row, col) -> List[List[tuple[int, int]]]:
+    def get_line_color(self, coordinates: WinningLine) -> Color | None:
         """
-        Returns a list of coordinates to check for given a coordinate on the board.
-        This checks the row, column, left diagonal, and right diagonal.
+        Returns the color shared by the top pieces of every coordinate in a line, or None if the line is not a win.
         """
-        row_coordinates = [(row, col), (row, col + 1), (row, col + 2)]
-        col_coordinates = [(row, col), (row + 1, col), (row + 2, col)]
-        left_to_right_diagonal = [
-            (row, col),
-            (row + 1, col + 1),
-            (row + 2, col + 2),
-        ]
-        right_to_left_diagonal = [
-            (row, col),
-            (row + 1, col - 1),
-            (row + 2, col - 2),
-        ]
-        return [
-            row_coordinates,
-            col_coordinates,
-            left_to_right_diagonal,
-            right_to_left_diagonal,
-        ]
+        color = None
+        for x, y in coordinates:
+            top_color = self.board.top_color(x, y)
+            if top_color is None or (color and top_color != color):
+                return None
+            color = top_color
+        return color
 
-    def maybe_players_won(self) -> List[str]:
+    def maybe_players_won(
+        self, changed_coordinates: List[Coordinate] | None = None
+    ) -> List[str]:
         """
         Returns a list of players who may have won given a particular move.
 
+        If `changed_coordinates` is given, only the lines passing through those cells are checked. A move can only
+        complete a line through a cell whose top piece changed, so passing the source and destination of a MOVE or
+        the target of a PLACE gives the same result as scanning the whole board.
+
         If a player moved an existing piece, we need to account for the possibilities of a draw, i.e.
         [1, 1, 1, 0], -> player 2 moved from (0,1) to (1,1) -> both players 1 and 2 won.
         [3, 2, 2, 3],
@@ -114,70 +269,202 @@ class Game:
         [3, 3, 4, 2],
         """
         winning_colors = set()
-        for row in range(GRID_DIMENSION):
-            for col in range(GRID_DIMENSION):
-                cell = self.board.value_at(row, col)
-                # Proceed only if cell has a value and that value is not already a winning color
-                if len(cell) == 0 or cell[-1] in winning_colors:
-                    continue
-
-                # Check row, col, left diagonal, and right diagonal
-                list_of_coordinates = self.get_coordinates_to_check(row, col)
-                for coordinates in list_of_coordinates:
-                    # Validate that the last coordinate is in bounds since that's the most extreme
-                    if not self.is_in_bounds(coordinates[-1][0], coordinates[-1][1]):
-                        continue
-
-                    colors = [
-                        (
-                            self.board.value_at(x, y)[-1]
-                            if len(self.board.value_at(x, y)) > 0
-                            else None
-                        )
-                        for x, y in coordinates
-                    ]
-                    all_equal = all(i == colors[0] for i in colors)
-                    if colors[0] and all_equal:
-                        winning_colors.add(colors[0])
+        if changed_coordinates is not None:
+            lines = [
+                line
+                for coordinate in changed_coordinates
+                for line in self.winning_lines.lines_by_cell[coordinate]
+            ]
+        else:
+            lines = self.winning_lines.lines
+
+        for line in lines:
+            color = self.get_line_color(line)
+            if color:
+                winning_colors.add(color)
 
         return list(
             filter(lambda id: self.players[id].color in winning_colors, self.player_ids)
         )
 
+    def can_move_from(self, player: Player, row: int, col: int) -> bool:
+        """
+        Returns whether the player's piece is on top of a cell and can be moved to at least one neighboring cell.
+        """
+        return self.board.top_color(row, col) == player.color and any(
+            self.board.height(x, y) < MAX_STACK_HEIGHT
+            for x, y in self.neighbors[(row, col)]
+        )
+
+    def legal_actions(self, player_id: str) -> ActionGrid:
+        """
+        Returns the action grid of a player, i.e. whether the player can place new pieces on each cell, move the piece
+        on top of it, both, or neither.
+
+        Every cell is IMPOSSIBLE if the game is over or it is not the player's turn.
+        """
+        action_grid = get_default_action_grid(self.grid_dimension)
+        if (
+            self.game_state != GameState.IN_PROGRESS
+            or self.player_ids[self.current_turn] != player_id
+        ):
+            return action_grid
+
+        player = self.players[player_id]
+        for row in range(self.grid_dimension):
+            for col in range(self.grid_dimension):
+                can_place = (
+                    player.num_pieces > 0
+                    and self.board.height(row, col) < MAX_STACK_HEIGHT
+                )
+                can_move = self.can_move_from(player, row, col)
+
+                if can_place and can_move:
+                    action_grid[row][col] = Action.PLACE_OR_MOVE
+                elif can_place:
+                    action_grid[row][col] = Action.PLACE
+                elif can_move:
+                    action_grid[row][col] = Action.MOVE
+
+        return action_grid
+
+    def validate_action(self, player_id: str, action: PossibleActions) -> None:
+        """
+        Raises an exception if the action is not legal for the player, with the same rules as `legal_actions`.
+
+        A player may only pass if there are no available moves.
+        """
+        if self.game_state != GameState.IN_PROGRESS:
+            raise GameNotInProgress("The game is over!")
+
+        if self.player_ids[self.current_turn] != player_id:
+            raise NotPlayersTurn("It is not your turn!")
+
+        player = self.players[player_id]
+        if action["type"] == Action.MOVE:
+            from_cell = (action["from_row"], action["from_col"])
+            to_cell = (action["to_row"], action["to_col"])
+            if not (
+                self.is_valid_coordinate(*from_cell)
+                and self.is_valid_coordinate(*to_cell)
+            ):
+                raise InvalidAction("Cell is not on the board!")
+            if self.board.top_color(*from_cell) != player.color:
+                raise InvalidAction("You can only move your own pieces!")
+            if to_cell not in self.neighbors[from_cell]:
+                raise InvalidAction("Pieces can only be moved one space at a time!")
+            if self.board.height(*to_cell) >= MAX_STACK_HEIGHT:
+                raise InvalidAction("Pieces cannot be moved onto a full stack!")
+
+        elif action["type"] == Action.PLACE:
+            num_pieces = action["num_pieces"]
+            if not self.is_valid_coordinate(action["row"], action["col"]):
+                raise InvalidAction("Cell is not on the board!")
+            if (
+                not isinstance(num_pieces, int)
+                or isinstance(num_pieces, bool)
+                or not 1 <= num_pieces <= player.num_pieces
+            ):
+                raise InvalidAction("Invalid number of pieces!")
+            if (
+                self.board.height(action["row"], action["col"]) + num_pieces
+                > MAX_STACK_HEIGHT
+            ):
+                raise InvalidAction("Stacks may only go up to three pieces high!")
+
+        elif action["type"] == Action.PASS:
+            legal_actions = self.legal_actions(player_id)
+            if any(a != Action.IMPOSSIBLE for row in legal_actions for a in row):
+                raise InvalidAction(
+                    "You can only pass if there are no available moves!"
+                )
+
+        else:
+            raise InvalidAction("Unknown action!")
+
+    def is_valid_coordinate(self, row: int, col: int) -> bool:
+        return (
+            isinstance(row, int)
+            and isinstance(col, int)
+            and not isinstance(row, bool)
+            and not isinstance(col, bool)
+            and self.is_in_bounds(row, col)
+        )
+
     def advance_player_turn(self):
         self.current_turn = (self.current_turn + 1) % len(self.player_ids)
 
-    def execute_action_for_player(self, player_id: str, action: PossibleActions):
+    def rename_player(self, old_id: str, new_id: str) -> None:
         """
-        Executes an action for a player. This could either be moving an existing piece on the board or placing a new piece on the board
+        Gives a player a new id, e.g. the socket id of the client that rejoined as the player.
+
+        Every id of the player changes, so the version is bumped and a full snapshot must be sent, like after a new
+        round.
+        """
+        rename = {old_id: new_id}
+        self.player_ids = [rename.get(id, id) for id in self.player_ids]
+        self.initial_player_ids = [rename.get(id, id) for id in self.initial_player_ids]
+        self.players = {rename.get(id, id): p for id, p in self.players.items()}
+        self.history = [(rename.get(id, id), action) for id, action in self.history]
+        self.winners = [
+            [rename.get(id, id) for id in round_winners]
+            for round_winners in self.winners
+        ]
+        if new_id in self.players:
+            self.players[new_id].id = new_id
+            self.players[new_id].mark_dirty()
+
+        self.version += 1
+        self.changed_cells = None
+        self.mark_dirty()
+
+    def execute_action_for_player(
+        self, player_id: str, action: PossibleActions, validate: bool = True
+    ):
+        """
+        Executes an action for a player. This could either be moving an existing piece on the board, placing a new piece on the board or passing the turn
+
+        Raises an exception if the action is not legal, unless `validate` is false because the caller already
+        generated the action from `legal_actions`. Actions on a game that is over are ignored in that case.
 
         Returns true if the player won the game and false otherwise.
         """
-        if self.game_state == GameState.IN_PROGRESS:
-            round_winners = []
-            player = self.players[player_id]
+        if validate:
+            self.validate_action(player_id, action)
+        elif self.game_state != GameState.IN_PROGRESS:
+            return False
 
-            if action["type"] == Action.MOVE:
-                self.board.value_at(action["from_row"], action["from_col"]).pop()
-                self.board.value_at(action["to_row"], action["to_col"]).append(
-                    player.color
-                )
-                round_winners = self.maybe_players_won()
-
-            elif action["type"] == Action.PLACE:
-                num_pieces = action["num_pieces"]
-                cell = self.board.value_at(action["row"], action["col"])
-                if 3 - len(cell) >= num_pieces:
-                    for _ in range(num_pieces):
-                        cell.append(player.color)
-                    player.num_pieces -= num_pieces
-                    round_winners = self.maybe_players_won()
-
-            # Handle the case if the player won
-            if round_winners:
-                self.winners.append(round_winners)
-                self.start_new_round()
-                return True
-            else:
-                self.advance_player_turn()
-                return False
+        round_winners = []
+        player = self.players[player_id]
+        self.history.append((player_id, action))
+        self.version += 1
+        self.changed_cells = []
+        self.mark_dirty()
+
+        if action["type"] == Action.MOVE:
+            self.board.pop(action["from_row"], action["from_col"])
+            self.board.push(action["to_row"], action["to_col"], player.color)
+            self.changed_cells = [
+                (action["from_row"], action["from_col"]),
+                (action["to_row"], action["to_col"]),
+            ]
+            round_winners = self.maybe_players_won(self.changed_cells)
+
+        elif action["type"] == Action.PLACE:
+            num_pieces = action["num_pieces"]
+            row, col = action["row"], action["col"]
+            for _ in range(num_pieces):
+                self.board.push(row, col, player.color)
+            player.num_pieces -= num_pieces
+            player.mark_dirty()
+            self.changed_cells = [(row, col)]
+            round_winners = self.maybe_players_won(self.changed_cells)
+
+        # Handle the case if the player won
+        if round_winners:
+            self.winners.append(round_winners)
+            self.start_new_round()
+            return True
+        else:
+            self.advance_player_turn()
+            return False
@@ -9,16 +9,18 @@ class Player(BasePlayer):
             base_player.id,
             base_player.name,
             base_player.created_at,
+            base_player.is_bot,
         )
         self.color = color
 
         self.num_pieces = 5
 
-    def __json__(self):
+    def to_json(self):
         return {
             "id": self.id,
             "name": self.name,
             "created_at": self.created_at,
+            "is_bot": self.is_bot,
             "color": self.color,
             "num_pieces": self.num_pieces,
         }
@@ -0,0 +1,145 @@
+import json_fix
+import threading
+from bisect import bisect_right
+from typing import List
+from core.base_player import BasePlayer
+from four_players_three_in_a_row.board import Board, PackedBoard
+from four_players_three_in_a_row.game import Game, GameState
+from four_players_three_in_a_row.utils import Move
+
+
+class ReplayIndexOutOfRange(Exception):
+    pass
+
+
+class Replay:
+    """
+    Rebuilds the states of a game from the initial order of its players and the history of its moves.
+
+    Games are deterministic, so the state after the first `index` moves is the result of replaying them, without
+    validating or serializing any intermediate state. The replayed game is kept as a cursor, so that seeking forward
+    only replays the moves in between. Seeking backward restarts from the start of the round of the target index, since
+    the state at the start of a round only depends on the winners of the previous rounds. Round starts are recorded as
+    the cursor passes them.
+
+    `moves` may be the history of a game in progress, which the replay follows as it grows.
+    """
+
+    def __init__(
+        self,
+        players: List[BasePlayer],
+        moves: List[Move],
+        grid_dimension: int,
+        line_length: int,
+        max_rounds: int,
+        num_pieces: int,
+        board_class: type[Board] | type[PackedBoard] = Board,
+    ):
+        self.players = players
+        self.moves = moves
+        self.grid_dimension = grid_dimension
+        self.line_length = line_length
+        self.max_rounds = max_rounds
+        self.num_pieces = num_pieces
+        self.board_class = board_class
+
+        # Index of the first move of every round after the first one, and the winners of every round before it
+        self.round_starts: List[int] = []
+        self.round_winners: List[List[str]] = []
+
+        # Game whose history the replay follows, if any
+        self.live_game: Game | None = None
+
+        self.game: Game | None = None
+        self.position = 0
+        # Guards the cursor, which is shared by every client watching the replay
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_game(cls, game: Game) -> "Replay":
+        """
+        Returns the replay of a game, which shares the history of the game rather than copying it.
+        """
+        replay = Replay(
+            [
+                BasePlayer.from_snapshot(game.players[id].to_snapshot())
+                for id in game.initial_player_ids
+            ],
+            game.history,
+            game.grid_dimension,
+            game.line_length,
+            game.max_rounds,
+            game.num_pieces,
+            type(game.board),
+        )
+        replay.live_game = game
+        return replay
+
+    def __len__(self) -> int:
+        return len(self.moves)
+
+    def player_ids(self) -> List[str]:
+        return [player.id for player in self.players]
+
+    def is_over(self) -> bool:
+        """
+        Returns whether the replayed game is over, i.e. no more moves will be added to it.
+        """
+        return (
+            self.live_game is None or self.live_game.game_state == GameState.GAME_OVER
+        )
+
+    def new_game(self) -> Game:
+        return Game(
+            self.players,
+            grid_dimension=self.grid_dimension,
+            line_length=self.line_length,
+            board_class=self.board_class,
+            max_rounds=self.max_rounds,
+            num_pieces=self.num_pieces,
+        )
+
+    def game_at(self, index: int) -> Game:
+        """
+        Returns the game after its first `index` moves.
+
+        The game is the cursor of the replay, which changes on the next call, so it must be used while holding the lock
+        of the replay and must not be changed.
+        """
+        if not 0 <= index <= len(self.moves):
+            raise ReplayIndexOutOfRange(f"The replay has {len(self.moves)} moves!")
+
+        if self.game is None or index < self.position:
+            self.restore_round_start(index)
+
+        game = self.game
+        while self.position < index:
+            player_id, action = self.moves[self.position]
+            self.position += 1
+            if game.execute_action_for_player(player_id, action, validate=False):
+                if len(self.round_starts) < len(game.winners):
+                    self.round_starts.append(self.position)
+                    self.round_winners.append(list(game.winners[-1]))
+
+        return game
+
+    def restore_round_start(self, index: int) -> None:
+        """
+        Moves the cursor to the start of the round of the move at `index`, among the rounds recorded so far.
+        """
+        num_rounds = bisect_right(self.round_starts, index)
+        game = self.new_game()
+        for round_winners in self.round_winners[:num_rounds]:
+            game.winners.append(list(round_winners))
+            game.start_new_round()
+
+        self.position = self.round_starts[num_rounds - 1] if num_rounds else 0
+        game.version = self.position
+        self.game = game
+
+    def json_at(self, index: int):
+        """
+        Returns the JSON of the game after its first `index` moves. Only the requested state is serialized.
+        """
+        with self.lock:
+            return self.game_at(index).__json__()
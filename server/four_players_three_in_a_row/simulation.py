@@ -0,0 +1,321 @@
+"""
+Headless self-play engine for Four Players Three in a Row, used to tune the rules of the game.
+
+Games are played directly on `Game` objects by bot policies, without any sockets or JSON, and spread over a
+multiprocessing pool. For example, to play a million games between random bots on every core:
+
+    python -m four_players_three_in_a_row.simulation --games 1000000 --policies random random random random
+"""
+
+import argparse
+import random
+import time
+from collections import Counter
+from multiprocessing import Pool
+from typing import List
+from core.base_player import BasePlayer
+from four_players_three_in_a_row.game import Game, GameState
+from four_players_three_in_a_row.utils import (
+    GRID_DIMENSION,
+    MAX_STACK_HEIGHT,
+    WINNING_LINE_LENGTH,
+    Action,
+    PossibleActions,
+)
+
+# Actions are listed as plain tuples, which are much cheaper to build than action dicts, and only the chosen one is
+# converted with `to_action`: (PLACE, row, col, num_pieces), (MOVE, from_row, from_col, to_row, to_col) or (PASS,).
+type CompactAction = tuple
+
+
+def get_legal_action_list(game: Game, player_id: str) -> List[CompactAction]:
+    """
+    Lists every legal action of the player whose turn it is, or a single pass if there are none.
+
+    Follows the same rules as `Game.legal_actions`, but reads each cell of the board only once since this is the
+    innermost loop of the simulation.
+    """
+    player = game.players[player_id]
+    board = game.board
+    n = game.grid_dimension
+    heights = [board.height(row, col) for row in range(n) for col in range(n)]
+    max_place = min(player.num_pieces, MAX_STACK_HEIGHT)
+
+    actions: List[CompactAction] = []
+    for row in range(n):
+        for col in range(n):
+            height = heights[row * n + col]
+            for num_pieces in range(1, min(max_place, MAX_STACK_HEIGHT - height) + 1):
+                actions.append((Action.PLACE, row, col, num_pieces))
+
+            if height and board.top_color(row, col) == player.color:
+                for to_row, to_col in game.neighbors[(row, col)]:
+                    if heights[to_row * n + to_col] < MAX_STACK_HEIGHT:
+                        actions.append((Action.MOVE, row, col, to_row, to_col))
+
+    return actions or [(Action.PASS,)]
+
+
+def to_action(action: CompactAction) -> PossibleActions:
+    if action[0] == Action.PLACE:
+        _, row, col, num_pieces = action
+        return {"type": Action.PLACE, "num_pieces": num_pieces, "row": row, "col": col}
+    elif action[0] == Action.MOVE:
+        _, from_row, from_col, to_row, to_col = action
+        return {
+            "type": Action.MOVE,
+            "from_row": from_row,
+            "from_col": from_col,
+            "to_row": to_row,
+            "to_col": to_col,
+        }
+    else:
+        return {"type": Action.PASS}
+
+
+def is_winning_action(game: Game, player_id: str, action: CompactAction) -> bool:
+    """
+    Returns whether an action would complete a line of the player's color, by applying it to the board and undoing it.
+    """
+    board = game.board
+    color = game.players[player_id].color
+    if action[0] == Action.MOVE:
+        _, from_row, from_col, to_row, to_col = action
+        board.pop(from_row, from_col)
+        board.push(to_row, to_col, color)
+        changed_cells = [(from_row, from_col), (to_row, to_col)]
+    elif action[0] == Action.PLACE:
+        _, row, col, num_pieces = action
+        if num_pieces > 1:
+            # Leaves the same top color as placing a single piece, which is checked as its own action
+            return False
+        board.push(row, col, color)
+        changed_cells = [(row, col)]
+    else:
+        return False
+
+    won = any(
+        game.get_line_color(line) == color
+        for cell in changed_cells
+        for line in game.winning_lines.lines_by_cell[cell]
+    )
+
+    if action[0] == Action.MOVE:
+        board.pop(to_row, to_col)
+        board.push(from_row, from_col, color)
+    else:
+        board.pop(row, col)
+
+    return won
+
+
+class RandomPolicy:
+    """
+    Plays a uniformly random legal action.
+    """
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+
+    def choose_action(self, game: Game, player_id: str) -> PossibleActions:
+        return to_action(self.rng.choice(get_legal_action_list(game, player_id)))
+
+
+class GreedyPolicy:
+    """
+    Plays an action that wins the round immediately if there is one, and a random legal action otherwise.
+    """
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+
+    def choose_action(self, game: Game, player_id: str) -> PossibleActions:
+        actions = get_legal_action_list(game, player_id)
+        for action in actions:
+            if is_winning_action(game, player_id, action):
+                return to_action(action)
+        return to_action(self.rng.choice(actions))
+
+
+POLICIES = {
+    "random": RandomPolicy,
+    "greedy": GreedyPolicy,
+}
+
+
+class SimulationStats:
+    """
+    Aggregated results of a batch of simulated games. Batches from different processes are combined with `merge`.
+    """
+
+    def __init__(self, num_seats: int):
+        self.games = 0
+        self.rounds = 0
+        # Rounds that hit the action limit without a winner
+        self.stalled_rounds = 0
+        self.round_lengths: Counter[int] = Counter()
+        # Round wins by the position of the winner in the turn order of that round, i.e. 0 is the first player
+        self.wins_by_turn_position = [0] * num_seats
+        # Round wins by the seat of the winner at the start of the game, i.e. by policy
+        self.wins_by_seat = [0] * num_seats
+        self.draws = 0
+
+    def merge(self, other: "SimulationStats") -> None:
+        self.games += other.games
+        self.rounds += other.rounds
+        self.stalled_rounds += other.stalled_rounds
+        self.round_lengths.update(other.round_lengths)
+        self.draws += other.draws
+        for i in range(len(self.wins_by_seat)):
+            self.wins_by_turn_position[i] += other.wins_by_turn_position[i]
+            self.wins_by_seat[i] += other.wins_by_seat[i]
+
+
+def play_game(
+    policies: List,
+    stats: SimulationStats,
+    grid_dimension: int = GRID_DIMENSION,
+    line_length: int = WINNING_LINE_LENGTH,
+    max_rounds: int = 5,
+    num_pieces: int = 5,
+    max_actions_per_round: int = 200,
+) -> None:
+    """
+    Plays a single game between the given policies, one per seat, and records the results in `stats`.
+    """
+    player_ids = [str(seat) for seat in range(len(policies))]
+    game = Game(
+        [BasePlayer(id, id, 0) for id in player_ids],
+        grid_dimension=grid_dimension,
+        line_length=line_length,
+        max_rounds=max_rounds,
+        num_pieces=num_pieces,
+    )
+
+    round_length = 0
+    while game.game_state == GameState.IN_PROGRESS:
+        player_id = game.player_ids[game.current_turn]
+        action = policies[int(player_id)].choose_action(game, player_id)
+        turn_order = list(game.player_ids)
+        round_length += 1
+
+        if game.execute_action_for_player(player_id, action, validate=False):
+            stats.rounds += 1
+            stats.round_lengths[round_length] += 1
+            round_winners = game.winners[-1]
+            if len(round_winners) > 1:
+                stats.draws += 1
+            for winner_id in round_winners:
+                stats.wins_by_turn_position[turn_order.index(winner_id)] += 1
+                stats.wins_by_seat[int(winner_id)] += 1
+            round_length = 0
+
+        elif round_length >= max_actions_per_round:
+            stats.rounds += 1
+            stats.stalled_rounds += 1
+            game.start_new_round()
+            round_length = 0
+
+    stats.games += 1
+
+
+def run_batch(args: tuple) -> SimulationStats:
+    """
+    Plays a batch of games in a worker process. Takes a single tuple so that it can be used with `Pool.imap_unordered`.
+    """
+    num_games, seed, policy_names, options = args
+    rng = random.Random(seed)
+    policies = [POLICIES[name](rng) for name in policy_names]
+    stats = SimulationStats(len(policies))
+    for _ in range(num_games):
+        play_game(policies, stats, **options)
+    return stats
+
+
+def run_simulations(
+    num_games: int,
+    policy_names: List[str],
+    processes: int | None = None,
+    batch_size: int = 1000,
+    seed: int = 0,
+    **options,
+) -> SimulationStats:
+    """
+    Plays `num_games` games between the given policies, one per seat, across a multiprocessing pool.
+
+    Extra keyword arguments are passed to `play_game`, e.g. `max_rounds` or `num_pieces`.
+    """
+    batches = [
+        (min(batch_size, num_games - start), seed + i, policy_names, options)
+        for i, start in enumerate(range(0, num_games, batch_size))
+    ]
+    stats = SimulationStats(len(policy_names))
+    with Pool(processes) as pool:
+        for batch_stats in pool.imap_unordered(run_batch, batches):
+            stats.merge(batch_stats)
+    return stats
+
+
+def print_report(stats: SimulationStats, elapsed: float) -> None:
+    print(
+        f"Games: {stats.games} in {elapsed:.1f}s ({stats.games / elapsed:.0f} games/sec)"
+    )
+    print(
+        f"Rounds: {stats.rounds} ({stats.stalled_rounds} stalled, {stats.draws} draws)"
+    )
+
+    won_rounds = stats.rounds - stats.stalled_rounds
+    print("Round length percentiles (actions):")
+    lengths = sorted(stats.round_lengths.elements())
+    for percentile in (10, 50, 90, 99):
+        if lengths:
+            index = min(len(lengths) - 1, len(lengths) * percentile // 100)
+            print(f"  p{percentile}: {lengths[index]}")
+
+    print("Round win rate by turn position (0 moves first):")
+    for position, wins in enumerate(stats.wins_by_turn_position):
+        print(f"  {position}: {wins / max(won_rounds, 1):.3f}")
+
+    print("Round win rate by seat:")
+    for seat, wins in enumerate(stats.wins_by_seat):
+        print(f"  {seat}: {wins / max(won_rounds, 1):.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument(
+        "--policies",
+        nargs="+",
+        choices=POLICIES.keys(),
+        default=["random"] * 4,
+        help="Policy of each seat, which also sets the number of players",
+    )
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--grid-dimension", type=int, default=GRID_DIMENSION)
+    parser.add_argument("--line-length", type=int, default=WINNING_LINE_LENGTH)
+    parser.add_argument("--max-rounds", type=int, default=5)
+    parser.add_argument("--num-pieces", type=int, default=5)
+    parser.add_argument("--max-actions-per-round", type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = run_simulations(
+        args.games,
+        args.policies,
+        processes=args.processes,
+        batch_size=args.batch_size,
+        seed=args.seed,
+        grid_dimension=args.grid_dimension,
+        line_length=args.line_length,
+        max_rounds=args.max_rounds,
+        num_pieces=args.num_pieces,
+        max_actions_per_round=args.max_actions_per_round,
+    )
+    print_report(stats, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
 from enum import Enum
+from functools import cache
 from typing import List, TypedDict
 
-
 # Sets the grid dimensions for the 4 by 3 player game
 GRID_DIMENSION = 4
 
+# Sets the maximum number of pieces that can be stacked on one cell
+MAX_STACK_HEIGHT = 3
+
+# Sets the number of pieces of the same color in a row needed to win a round
+WINNING_LINE_LENGTH = 3
+
 
 class Color(str, Enum):
     """
@@ -28,6 +34,64 @@ def get_default_color_grid(
     return [[[] for _ in range(n)] for _ in range(n)]
 
 
+type Coordinate = tuple[int, int]
+type WinningLine = tuple[Coordinate, ...]
+
+
+class WinningLineIndex:
+    """
+    Lists every winning line (row, column, left diagonal, and right diagonal) of a given length that fits on an n by n
+    board exactly once, along with a reverse map from each cell to the lines that contain it.
+    """
+
+    def __init__(self, n: int, line_length: int):
+        self.lines: List[WinningLine] = []
+        self.lines_by_cell: dict[Coordinate, List[WinningLine]] = {
+            (row, col): [] for row in range(n) for col in range(n)
+        }
+
+        for row in range(n):
+            for col in range(n):
+                for d_row, d_col in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+                    end_row = row + (line_length - 1) * d_row
+                    end_col = col + (line_length - 1) * d_col
+                    if not (0 <= end_row < n and 0 <= end_col < n):
+                        continue
+
+                    line = tuple(
+                        (row + i * d_row, col + i * d_col) for i in range(line_length)
+                    )
+                    self.lines.append(line)
+                    for coordinate in line:
+                        self.lines_by_cell[coordinate].append(line)
+
+
+@cache
+def get_winning_line_index(n: int, line_length: int) -> WinningLineIndex:
+    """
+    Returns the module level WinningLineIndex for a board size and line length, building it on first use.
+    """
+    return WinningLineIndex(n, line_length)
+
+
+@cache
+def get_neighbor_index(n: int) -> dict[Coordinate, List[Coordinate]]:
+    """
+    Returns a map from each cell of an n by n board to the cells a piece can be moved to from it, i.e. the in bounds
+    cells one space away vertically, horizontally, or diagonally.
+    """
+    return {
+        (row, col): [
+            (row + d_row, col + d_col)
+            for d_row in (-1, 0, 1)
+            for d_col in (-1, 0, 1)
+            if (d_row or d_col) and 0 <= row + d_row < n and 0 <= col + d_col < n
+        ]
+        for row in range(n)
+        for col in range(n)
+    }
+
+
 class Action(str, Enum):
     """
     Represents the action each player can take for a particular cell
@@ -37,6 +101,7 @@ class Action(str, Enum):
     MOVE = "MOVE"
     PLACE_OR_MOVE = "PLACE_OR_MOVE"
     IMPOSSIBLE = "IMPOSSIBLE"
+    PASS = "PASS"
 
 
 type ActionGrid = List[List[Action]]
@@ -45,7 +110,7 @@ type ActionGrid = List[List[Action]]
 def get_default_action_grid(
     n: int,
 ) -> ActionGrid:
-    return [[[] for _ in range(n)] for _ in range(n)]
+    return [[Action.IMPOSSIBLE for _ in range(n)] for _ in range(n)]
 
 
 class MoveAction(TypedDict):
@@ -71,4 +136,15 @@ class PlaceAction(TypedDict):
     col: int
 
 
-type PossibleActions = MoveAction | PlaceAction
+class PassAction(TypedDict):
+    """
+    Represents a player passing their turn because there are no available moves
+    """
+
+    type: Action.PASS
+
+
+type PossibleActions = MoveAction | PlaceAction | PassAction
+
+# An action of a game along with the id of the player who took it
+type Move = tuple[str, PossibleActions]
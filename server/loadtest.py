@@ -0,0 +1,537 @@
+#! /usr/bin/env python3
+"""
+Load generator that plays full games against a running game server with simulated Socket.IO clients.
+
+Every simulated room connects `capacity` clients, which go through the same events as the web client: `join_lobby`,
+`create_room` and `join_room` until the game starts automatically, then `handle_place_action`, `handle_move_action`
+or `handle_pass_action` on their turns until the game is over. The report includes:
+- the latency of every event, from the emit to its acknowledgement, or for game actions to the reception of the
+  resulting update by the acting client,
+- the broadcast fan-out time, from the first to the last client of a room receiving the same game update,
+- the number of messages sent and received by all clients per second,
+- the memory used by the server per room, at its peak and retained once the games are over, from its resident set
+  size (Linux only).
+
+Clients all run on one event loop of this process, so measured times include its scheduling delays. Use
+`--processes` to spread them over several loops when the generator itself saturates a core.
+
+For example, to play 1000 games at once against a server started by the load generator:
+
+    python loadtest.py --spawn async --rooms 1000
+
+Or against a server that is already running:
+
+    python loadtest.py --url http://localhost:3001 --server-pid 1234 --rooms 250
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+from typing import List
+import socketio
+from four_players_three_in_a_row.utils import MAX_STACK_HEIGHT, get_neighbor_index
+
+
+class LoadStats:
+    """
+    Measurements collected by the simulated clients, which can be merged across load generator processes.
+    """
+
+    def __init__(self):
+        self.latencies: dict[str, List[float]] = defaultdict(list)
+        self.fan_out_times: List[float] = []
+        self.messages = 0
+        self.errors = 0
+        self.games_finished = 0
+        self.games_timed_out = 0
+
+    def merge(self, other: "LoadStats") -> None:
+        for event, latencies in other.latencies.items():
+            self.latencies[event].extend(latencies)
+        self.fan_out_times.extend(other.fan_out_times)
+        self.messages += other.messages
+        self.errors += other.errors
+        self.games_finished += other.games_finished
+        self.games_timed_out += other.games_timed_out
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def read_rss(pid: int) -> int:
+    """
+    Returns the resident set size of a process in bytes.
+    """
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+class MemorySampler(threading.Thread):
+    """
+    Samples the resident set size of a process in the background to find its peak during the load.
+    """
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.baseline = read_rss(pid)
+        self.peak = self.baseline
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, read_rss(self.pid))
+
+    def stop(self) -> int:
+        """
+        Stops sampling and returns the memory retained by the process since the start, once the load is over.
+        """
+        self.stopped.set()
+        self.join()
+        return read_rss(self.pid) - self.baseline
+
+
+class SimulatedRoom:
+    """
+    Tracks which clients of a room received each version of the game, to measure the fan-out of every broadcast.
+    """
+
+    def __init__(self, num_clients: int, stats: LoadStats):
+        self.num_clients = num_clients
+        self.stats = stats
+        self.room_id: str | None = None
+        self.receipts: dict[int, tuple[float, int]] = {}
+        self.started = asyncio.Event()
+
+    def record_receipt(self, version: int) -> None:
+        now = time.perf_counter()
+        first, count = self.receipts.get(version, (now, 0))
+        count += 1
+        if count == self.num_clients:
+            self.stats.fan_out_times.append(now - first)
+            del self.receipts[version]
+        else:
+            self.receipts[version] = (first, count)
+
+
+class SimulatedClient:
+    """
+    Socket.IO client that plays random legal actions on its turns, following the game through the same deltas and
+    snapshots as the web client.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        name: str,
+        room: SimulatedRoom,
+        stats: LoadStats,
+        rng: random.Random,
+    ):
+        self.url = url
+        self.name = name
+        self.room = room
+        self.stats = stats
+        self.rng = rng
+        self.id: str | None = None
+        self.game: dict | None = None
+        self.game_over = asyncio.Event()
+        # Event name, emit time and version awaited for the action in flight, if any
+        self.pending: tuple[str, float, int] | None = None
+
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on("send_game_delta", self.on_game_delta)
+        self.sio.on("send_game_data", self.on_game_data)
+        self.sio.on("room_updated", self.on_room_updated)
+        self.sio.on("invalid_request", self.on_invalid_request)
+        self.sio.on("*", self.on_any_event)
+
+    async def call(self, event: str, data=None):
+        """
+        Emits an event and waits for its acknowledgement, recording its latency.
+        """
+        start = time.perf_counter()
+        response = await self.sio.call(event, data, timeout=30)
+        self.stats.latencies[event].append(time.perf_counter() - start)
+        self.stats.messages += 1
+        return response
+
+    async def connect(self) -> None:
+        start = time.perf_counter()
+        await self.sio.connect(self.url, transports=["websocket"])
+        self.stats.latencies["connect"].append(time.perf_counter() - start)
+        response = await self.call("join_lobby", {"name": self.name})
+        self.id = response["player"]["id"]
+
+    async def on_any_event(self, event, data):
+        self.stats.messages += 1
+
+    async def on_room_updated(self, data):
+        self.stats.messages += 1
+        room = data["room"]
+        if room["id"] == self.room.room_id and room["is_game_started"]:
+            self.room.started.set()
+
+    async def on_invalid_request(self, data):
+        self.stats.messages += 1
+        self.stats.errors += 1
+        # An action was most likely based on a stale game, so start over from a snapshot
+        if self.pending:
+            self.pending = None
+            await self.fetch_game()
+
+    async def on_game_data(self, data):
+        self.stats.messages += 1
+        self.set_game(data["game"])
+
+    async def on_game_delta(self, data):
+        self.stats.messages += 1
+        delta = data["delta"]
+        game = self.game
+        if game is None or game["version"] != delta["base_version"]:
+            await self.fetch_game()
+            return
+
+        for cell in delta["cells"]:
+            game["board"][cell["row"]][cell["col"]] = cell["stack"]
+        for id, num_pieces in delta["num_pieces"].items():
+            game["players"][id]["num_pieces"] = num_pieces
+        game["current_turn"] = delta["current_turn"]
+        game["action_grid"] = delta["action_grid"]
+        self.set_game(game, delta["version"])
+
+    def set_game(self, game: dict, version: int | None = None) -> None:
+        if version is not None:
+            game["version"] = version
+        self.game = game
+        self.room.record_receipt(game["version"])
+
+        if self.pending and game["version"] >= self.pending[2]:
+            event, start, _ = self.pending
+            self.stats.latencies[event].append(time.perf_counter() - start)
+            self.pending = None
+
+        if game["game_state"] == "GAME_OVER":
+            self.game_over.set()
+        elif game["player_ids"][game["current_turn"]] == self.id and not self.pending:
+            self.sio.start_background_task(self.play_turn)
+
+    async def fetch_game(self) -> None:
+        response = await self.call("fetch_game_data", {"room_id": self.room.room_id})
+        if response and "game" in response:
+            game = response["game"]
+            self.game = game
+            if game["game_state"] == "GAME_OVER":
+                self.game_over.set()
+            elif game["player_ids"][game["current_turn"]] == self.id:
+                self.sio.start_background_task(self.play_turn)
+
+    def choose_action(self) -> tuple[str, dict]:
+        """
+        Picks a random legal action from the action grid of the game, or a pass if there are none.
+        """
+        game = self.game
+        board = game["board"]
+        n = len(board)
+        num_pieces = game["players"][self.id]["num_pieces"]
+        room_id = self.room.room_id
+
+        actions = []
+        for row in range(n):
+            for col in range(n):
+                cell_action = game["action_grid"][row][col]
+                if cell_action in ("PLACE", "PLACE_OR_MOVE"):
+                    for count in range(
+                        1, min(num_pieces, MAX_STACK_HEIGHT - len(board[row][col])) + 1
+                    ):
+                        actions.append(
+                            (
+                                "handle_place_action",
+                                {
+                                    "room_id": room_id,
+                                    "row": row,
+                                    "col": col,
+                                    "num_pieces": count,
+                                },
+                            )
+                        )
+                if cell_action in ("MOVE", "PLACE_OR_MOVE"):
+                    for to_row, to_col in get_neighbor_index(n)[(row, col)]:
+                        if len(board[to_row][to_col]) < MAX_STACK_HEIGHT:
+                            actions.append(
+                                (
+                                    "handle_move_action",
+                                    {
+                                        "room_id": room_id,
+                                        "from_row": row,
+                                        "from_col": col,
+                                        "to_row": to_row,
+                                        "to_col": to_col,
+                                    },
+                                )
+                            )
+
+        if not actions:
+            return "handle_pass_action", {"room_id": room_id}
+        return self.rng.choice(actions)
+
+    async def play_turn(self) -> None:
+        game = self.game
+        if self.pending or game["player_ids"][game["current_turn"]] != self.id:
+            return
+
+        event, data = self.choose_action()
+        self.pending = (event, time.perf_counter(), game["version"] + 1)
+        await self.sio.emit(event, data)
+        self.stats.messages += 1
+
+
+async def play_room(
+    url: str, capacity: int, stats: LoadStats, rng: random.Random, timeout: float
+) -> None:
+    """
+    Connects the clients of one room, plays its game until it is over, and disconnects them.
+    """
+    room = SimulatedRoom(capacity, stats)
+    clients = [
+        SimulatedClient(url, f"load-{rng.getrandbits(32)}", room, stats, rng)
+        for _ in range(capacity)
+    ]
+    try:
+        await asyncio.gather(*(client.connect() for client in clients))
+
+        response = await clients[0].call("create_room")
+        room.room_id = response["room_id"]
+        for client in clients[1:]:
+            await client.call("join_room", {"room_id": room.room_id})
+
+        await asyncio.wait_for(room.started.wait(), timeout)
+        await asyncio.gather(*(client.fetch_game() for client in clients))
+        await asyncio.wait_for(
+            asyncio.gather(*(client.game_over.wait() for client in clients)), timeout
+        )
+        stats.games_finished += 1
+    except asyncio.TimeoutError:
+        stats.games_timed_out += 1
+    except Exception as err:
+        print("Room failed: ", str(err), file=sys.stderr)
+        stats.errors += 1
+    finally:
+        await asyncio.gather(
+            *(client.sio.disconnect() for client in clients), return_exceptions=True
+        )
+
+
+async def run_load(
+    url: str,
+    num_rooms: int,
+    capacity: int,
+    ramp_up: float,
+    timeout: float,
+    seed: int,
+) -> LoadStats:
+    """
+    Plays `num_rooms` games at once, starting them evenly over `ramp_up` seconds.
+    """
+    stats = LoadStats()
+    rng = random.Random(seed)
+
+    async def start_room(index: int) -> None:
+        await asyncio.sleep(ramp_up * index / max(num_rooms, 1))
+        await play_room(url, capacity, stats, rng, timeout)
+
+    await asyncio.gather(*(start_room(i) for i in range(num_rooms)))
+    return stats
+
+
+def run_load_process(args: tuple) -> LoadStats:
+    return asyncio.run(run_load(*args))
+
+
+def spawn_server(kind: str, port: int) -> subprocess.Popen:
+    """
+    Starts a server in production mode on the given port, and waits for it to accept connections.
+    """
+    if kind == "async":
+        command = [
+            sys.executable,
+            "async_server.py",
+            "--production",
+            "--port",
+            str(port),
+        ]
+    else:
+        command = [
+            sys.executable,
+            "-m",
+            "flask",
+            "--app",
+            "server.py",
+            "run",
+            "--port",
+            str(port),
+        ]
+    server = subprocess.Popen(
+        command,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        # Simulated clients play as fast as the server answers, far above the rate limits of human players
+        env={**os.environ, "RATE_LIMITS": "off"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+
+    server.kill()
+    raise RuntimeError(f"The {kind} server did not start on port {port}")
+
+
+def print_report(stats: LoadStats, elapsed: float, memory: dict | None) -> None:
+    print(f"Games: {stats.games_finished} finished, {stats.games_timed_out} timed out")
+    print(f"Errors: {stats.errors}")
+    print(f"Messages: {stats.messages} ({stats.messages / elapsed:.0f}/sec)")
+    print("Latency (ms):")
+    for event, latencies in sorted(stats.latencies.items()):
+        print(
+            f"  {event:<20} n={len(latencies):<8} "
+            f"p50={percentile(latencies, 50) * 1000:8.1f} "
+            f"p99={percentile(latencies, 99) * 1000:8.1f}"
+        )
+    print(
+        f"Fan-out (ms): p50={percentile(stats.fan_out_times, 50) * 1000:.1f} "
+        f"p99={percentile(stats.fan_out_times, 99) * 1000:.1f}"
+    )
+    if memory is not None:
+        print(
+            f"Server memory per room: {memory['peak_per_room'] / 1024:.1f} KiB at peak, "
+            f"{memory['retained_per_room'] / 1024:.1f} KiB retained after the games"
+        )
+
+
+def to_json(stats: LoadStats, elapsed: float, memory: dict | None) -> dict:
+    return {
+        "games_finished": stats.games_finished,
+        "games_timed_out": stats.games_timed_out,
+        "errors": stats.errors,
+        "messages_per_second": stats.messages / elapsed,
+        "latency": {
+            event: {
+                "p50": percentile(latencies, 50),
+                "p99": percentile(latencies, 99),
+            }
+            for event, latencies in stats.latencies.items()
+        },
+        "fan_out": {
+            "p50": percentile(stats.fan_out_times, 50),
+            "p99": percentile(stats.fan_out_times, 99),
+        },
+        "memory": memory,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:3001")
+    parser.add_argument(
+        "--spawn",
+        choices=["async", "flask"],
+        help="Start a server of this kind on the port of --url instead of using a running one",
+    )
+    parser.add_argument(
+        "--server-pid", type=int, help="Pid of the server, to measure its memory"
+    )
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--capacity", type=int, default=4)
+    parser.add_argument(
+        "--ramp-up",
+        type=float,
+        default=10.0,
+        help="Number of seconds over which rooms are started",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=300.0, help="Maximum seconds per game"
+    )
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    server = None
+    server_pid = args.server_pid
+    if args.spawn:
+        server = spawn_server(args.spawn, int(args.url.rsplit(":", 1)[1]))
+        server_pid = server.pid
+
+    try:
+        sampler = MemorySampler(server_pid) if server_pid else None
+        if sampler:
+            sampler.start()
+
+        rooms_per_process = [
+            args.rooms // args.processes + (i < args.rooms % args.processes)
+            for i in range(args.processes)
+        ]
+        start = time.perf_counter()
+        stats = LoadStats()
+        with Pool(args.processes) as pool:
+            for batch_stats in pool.imap_unordered(
+                run_load_process,
+                [
+                    (
+                        args.url,
+                        rooms,
+                        args.capacity,
+                        args.ramp_up,
+                        args.timeout,
+                        args.seed + i,
+                    )
+                    for i, rooms in enumerate(rooms_per_process)
+                ],
+            ):
+                stats.merge(batch_stats)
+        elapsed = time.perf_counter() - start
+
+        memory = None
+        if sampler:
+            retained = sampler.stop()
+            # Most rooms are in progress at the same time unless the ramp up is longer than a game
+            memory = {
+                "peak_per_room": (sampler.peak - sampler.baseline) / args.rooms,
+                "retained_per_room": retained / args.rooms,
+            }
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    print_report(stats, elapsed, memory)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(to_json(stats, elapsed, memory), file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
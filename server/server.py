@@ -1,296 +1,126 @@
 #! /usr/bin/env python3.6
 
-from typing import Optional, TypedDict
-import time
+import atexit
+import logging
+import os
+from concurrent.futures import Future
 from flask import Flask, request
-from flask_socketio import (
-    SocketIO,
-    emit,
-    join_room as socket_join_room,
-    leave_room as socket_leave_room,
-)
+from flask_socketio import SocketIO
 from flask_cors import CORS
-from core.lobby import GameLobby
-from core.base_player import BasePlayer
+from werkzeug.serving import is_running_from_reloader
+from core import metrics
+from core.game_server import (
+    BackgroundTask,
+    GameServer,
+    Transport,
+    handlers,
+    install_profiling_signal_handler,
+)
+from core.profiling import profiler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder="dist", static_url_path="", template_folder="dist")
 
 # TODO(Change this to only allow certain origins depending on development/production)
 accepted_origins = "*"
 CORS(app, resources={r"/*": {"origins": accepted_origins}})
-socketio = SocketIO(app, cors_allowed_origins=accepted_origins)
 
+# Workers, persistence, timeouts, bots and rate limits are configured through environment variables, see `GameServer`
+# and the README
+socketio = SocketIO(
+    app,
+    cors_allowed_origins=accepted_origins,
+    message_queue=os.environ.get("SOCKETIO_MESSAGE_QUEUE"),
+)
 
-lobby = GameLobby("FourPlayerThreeInARow", 4)
+# Number of seconds between two checks of whether the move of a bot is ready
+BOT_POLL_INTERVAL = 0.05
 
 
-@socketio.on("connect")
-def connect():
-    pass
+class FlaskTransport(Transport):
+    """
+    Transport of the Flask server, whose handlers and background tasks run in threads and send right away.
+    """
 
+    def __init__(self, socketio: SocketIO):
+        super().__init__(socketio.server)
+        self.socketio = socketio
 
-@socketio.on("disconnect")
-def disconnect():
-    print("User disconnected: ", request.sid)
-    lobby.leave_lobby(request.sid)
+    def emit(self, event: str, data, room: str) -> None:
+        """
+        Emits an event and records its metrics. Works both within and outside of socket handlers.
+        """
+        with metrics.emit_duration.time(event):
+            self.socketio.emit(event, data, to=room)
+        metrics.record_emit(event, data, self.count_participants(room))
 
+    def enter_room(self, sid: str, room: str) -> None:
+        self.server.enter_room(sid, room, namespace="/")
 
-@socketio.on("join_lobby")
-def join_lobby(data):
-    """
-    Listens for when a player joins the multiplayer lobby and broadcasts to the other subscribers that a new player has joined the lobby.
-    """
-    try:
-        # Create the player object
-        player = BasePlayer(request.sid, data["name"], time.time())
-        lobby.join_lobby(player)
-
-        emit(
-            "joined_lobby",
-            {
-                "rooms": lobby.rooms,
-            },
-            broadcast=True,
-        )
-
-        return {
-            "player": player,
-        }
-    except Exception as err:
-        emit(
-            "invalid_request",
-            {"message": str(err)},
-            room=request.sid,  # Send only to the requesting client
-        )
-
-
-@socketio.on("leave_lobby")
-def leave_lobby():
-    """
-    Listens for when a player leaves the multiplayer lobby and broadcasts to the other subscribers that the player has left the lobby.
-    """
-    try:
-        lobby.leave_lobby(request.sid)
-
-        emit(
-            "left_lobby",
-            {
-                "rooms": lobby.rooms,
-            },
-            broadcast=True,
-        )
-    except Exception as err:
-        emit(
-            "invalid_request",
-            {"message": str(err)},
-            room=request.sid,  # Send only to the requesting client
-        )
-
-
-@socketio.on("create_room")
-def create_room():
-    """
-    Listens for when a player creates a room and broadcasts to the other subscribers that a new room is created for joining.
-    """
-    try:
-        room = lobby.create_new_room(request.sid)
-
-        socket_join_room(room.room_id)  # Socket io join_room
-
-        emit(
-            "created_room",
-            {
-                "rooms": lobby.rooms,
-                "selected_room_id": room.room_id,
-            },
-            broadcast=True,
-        )
-
-        return {"room_id": room.room_id}
-    except Exception as err:
-        emit(
-            "invalid_request",
-            {"message": str(err)},
-            room=request.sid,  # Send only to the requesting client
-        )
-
-
-@socketio.on("join_room")
-def join_room(data):
-    """
-    Listens for when a player joins a room and broadcasts to the other subscribers that a new player has joined the room.
-    """
-    try:
-        room_id = data["room_id"]
-        room = lobby.join_room(request.sid, room_id)
-
-        socket_join_room(room_id)  # Socket io join_room
-
-        emit(
-            "joined_room",
-            {
-                "rooms": lobby.rooms,
-                "selected_room_id": room_id,
-            },
-            broadcast=True,
-        )
-
-        # Automatically start game if room is at capacity
-        if room.capacity == len(room.players):
-            room.start_game()
-            emit(
-                "started_game",
-                {
-                    "rooms": lobby.rooms,
-                },
-                broadcast=True,
-            )
-
-    except Exception as err:
-        emit(
-            "invalid_request",
-            {"message": str(err)},
-            room=request.sid,  # Send only to the requesting client
-        )
-
-
-@socketio.on("leave_room")
-def leave_room(data):
-    """
-    Listens for when a player leaves a room and broadcasts to the other subscribers that a player has left the room.
-    """
-    try:
-        room_id = data["room_id"]
-        lobby.leave_room(request.sid, room_id)
-
-        socket_leave_room(room_id)  # Socket io leave_room
-
-        emit(
-            "left_room",
-            {
-                "rooms": lobby.rooms,
-            },
-            broadcast=True,
-        )
-    except Exception as err:
-        emit(
-            "invalid_request",
-            {"message": str(err)},
-            room=request.sid,  # Send only to the requesting client
-        )
-
-
-@socketio.on("start_game")
-def start_game(data):
-    """
-    Listens for when a game is started and broadcasts to the other subscribers.
-    """
-    try:
-        room_id = data["room_id"]
-        lobby.start_game_for_room(request.sid, room_id)
-
-        emit(
-            "started_game",
-            {
-                "rooms": lobby.rooms,
-            },
-            broadcast=True,
-        )
-
-    except Exception as err:
-        emit(
-            "invalid_request",
-            {"message": str(err)},
-            room=request.sid,  # Send only to the requesting client
-        )
-
-
-@socketio.on("fetch_game_data")
-def fetch_game_data(data):
-    """
-    Listens for when game data for a room is requested and returns the corresponding game data.
-    """
-    try:
-        room_id = data["room_id"]
-        room = lobby.get_room(room_id)
-        game = room.get_game(request.sid)
-        return {"game": game}
-
-    except Exception as err:
-        emit(
-            "invalid_request",
-            {"message": str(err)},
-            room=request.sid,  # Send only to the requesting client
-        )
-
-
-@socketio.on("handle_move_action")
-def handle_move_action(data):
+    def leave_room(self, sid: str, room: str) -> None:
+        self.server.leave_room(sid, room, namespace="/")
+
+    def close_room(self, room: str) -> None:
+        self.socketio.close_room(room)
+
+    def start_background_task(self, task: BackgroundTask):
+        return self.socketio.start_background_task(self.run_background_task, task)
+
+    def run_background_task(self, task: BackgroundTask) -> None:
+        """
+        Runs the steps of a background task, sleeping with `socketio.sleep` in between so that it never blocks other
+        tasks. Bot searches are polled every BOT_POLL_INTERVAL seconds.
+        """
+        for wait in task:
+            if isinstance(wait, Future):
+                while not wait.done():
+                    self.socketio.sleep(BOT_POLL_INTERVAL)
+            else:
+                self.socketio.sleep(wait)
+
+
+game_server = GameServer(FlaskTransport(socketio))
+game_server.register_metrics()
+
+
+# Profiling is toggled with the `profiling` event, authenticated by PROFILING_TOKEN, or with SIGUSR2
+install_profiling_signal_handler()
+
+
+@app.route("/metrics")
+def metrics_endpoint():
     """
-    Listens for the action when a player moves an existing piece on the board and broadcasts the updated game data to the subscribers of the room.
+    Serves the metrics of this worker in the Prometheus text format. Gauges are only computed when scraped.
     """
-    try:
-        room_id = data["room_id"]
-        room = lobby.get_room(room_id)
-        game = room.get_game(request.sid)
-
-        game.execute_action_for_player(
-            request.sid,
-            {
-                "type": "MOVE",
-                "from_row": data["from_row"],
-                "from_col": data["from_col"],
-                "to_row": data["to_row"],
-                "to_col": data["to_col"],
-            },
-        )
-        emit(
-            "send_game_data",
-            {"game": game},
-            room=room_id,  # Only broadcast to specific room
-        )
-
-    except Exception as err:
-        print(str(err))
-        emit(
-            "invalid_request",
-            {"message": str(err)},
-            room=request.sid,  # Send only to the requesting client
-        )
-
-
-@socketio.on("handle_place_action")
-def handle_place_action(data):
+    return metrics.registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+def register_handler(event: str) -> None:
     """
-    Listens for the action when a player places an unplaced piece on the board and broadcasts the updated game data to the subscribers of the room.
+    Listens for a socket event, which is handled by `GameServer.handle`.
     """
-    try:
-        room_id = data["room_id"]
-        room = lobby.get_room(room_id)
-        game = room.get_game(request.sid)
-
-        game.execute_action_for_player(
-            request.sid,
-            {
-                "type": "PLACE",
-                "num_pieces": data["num_pieces"],
-                "row": data["row"],
-                "col": data["col"],
-            },
-        )
-        emit(
-            "send_game_data",
-            {"game": game},
-            room=room_id,  # Only broadcast to specific room
-        )
-
-    except Exception as err:
-        print(str(err))
-        emit(
-            "invalid_request",
-            {"message": str(err)},
-            room=request.sid,  # Send only to the requesting client
-        )
+
+    @socketio.on(event)
+    @metrics.instrument(event)
+    @profiler.profile(event)
+    def handler(*args):
+        return game_server.handle(event, request.sid, *args)
+
+
+for event in handlers:
+    register_handler(event)
+
+
+def recover_rooms() -> None:
+    game_server.recover_rooms()
+    atexit.register(game_server.action_log.close)
+
+
+# The reloader of the development server serves the app from a child process, which must be the only one to own the log
+if game_server.action_log and (__name__ != "__main__" or is_running_from_reloader()):
+    recover_rooms()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,55 @@
+import asyncio
+import async_server
+
+
+def get(path: str) -> tuple[int, bytes]:
+    """
+    Sends a GET request to the ASGI app of the asyncio server, and returns the status and body of the response.
+    """
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": b"",
+        "headers": [],
+    }
+    asyncio.run(async_server.app(scope, receive, send))
+    return messages[0]["status"], b"".join(m.get("body", b"") for m in messages[1:])
+
+
+def read_metrics() -> dict[str, float]:
+    status, body = get("/metrics")
+    assert status == 200
+    samples = [line.rsplit(" ", 1) for line in body.decode().splitlines()]
+    return {name: float(value) for name, value in samples if not name.startswith("#")}
+
+
+def test_metrics_endpoint():
+    async def handle_events():
+        return [
+            await async_server.sio.handlers["/"][event]("sid", *args)
+            for event, args in [("fetch_rooms", ({},)), ("join_room", ({},))]
+        ]
+
+    before = read_metrics()
+    # The second event is missing its room id
+    assert asyncio.run(handle_events()) == [{"rooms": {}}, None]
+    after = read_metrics()
+
+    for name in [
+        'socket_event_duration_seconds_count{event="fetch_rooms"}',
+        'socket_event_errors_total{event="join_room",exception="KeyError"}',
+        'socket_emits_total{event="invalid_request"}',
+    ]:
+        assert after[name] == before.get(name, 0) + 1
+    assert after["lobby_rooms"] == 0
+
+    assert get("/unknown")[0] == 404
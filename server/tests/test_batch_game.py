@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+from core.base_player import BasePlayer
+from four_players_three_in_a_row.batch import (
+    EMPTY,
+    MOVE,
+    PASS,
+    PLACE,
+    BatchGame,
+    random_actions,
+)
+from four_players_three_in_a_row.game import Game, GameState
+from four_players_three_in_a_row.utils import COLORS_ARRAY, Action, PossibleActions
+
+# Number of seeded games played at once for each number of players, and number of actions played in each game
+NUM_GAMES = 50
+NUM_STEPS = 400
+
+
+def to_action(
+    batch: BatchGame, action_type: int, cell: int, target: int
+) -> PossibleActions:
+    """
+    Converts the action of one game of a batch to the action of a `Game`.
+    """
+    n = batch.grid_dimension
+    if action_type == PLACE:
+        row, col = divmod(cell, n)
+        return {"type": Action.PLACE, "num_pieces": target, "row": row, "col": col}
+    elif action_type == MOVE:
+        from_row, from_col = divmod(cell, n)
+        to_row, to_col = divmod(target, n)
+        return {
+            "type": Action.MOVE,
+            "from_row": from_row,
+            "from_col": from_col,
+            "to_row": to_row,
+            "to_col": to_col,
+        }
+    else:
+        return {"type": Action.PASS}
+
+
+def assert_same_game(batch: BatchGame, k: int, game: Game) -> None:
+    assert batch.finished[k] == (game.game_state == GameState.GAME_OVER)
+    if batch.finished[k]:
+        return
+
+    assert batch.current_round[k] == game.current_round
+    assert batch.current_turn[k] == game.current_turn
+    for color, player_id in enumerate(game.player_ids):
+        assert batch.pieces[k, color] == game.players[player_id].num_pieces
+
+    n = batch.grid_dimension
+    for cell in range(batch.num_cells):
+        stack = [
+            COLORS_ARRAY[color] for color in batch.stacks[k, cell] if color != EMPTY
+        ]
+        assert stack == game.board.value_at(*divmod(cell, n))
+        assert batch.heights[k, cell] == len(stack)
+        assert batch.tops[k, cell] == (
+            COLORS_ARRAY.index(stack[-1]) if stack else EMPTY
+        )
+
+
+def play_side_by_side(num_players: int, seed: int) -> BatchGame:
+    """
+    Plays seeded random games on a BatchGame and on one `Game` per game of the batch, with the same actions, and
+    checks after every step that every game of the batch is in the same state as its `Game`. Actions are validated by
+    the games, so every action the batch considers legal must be legal in `Game` too.
+    """
+    rng = np.random.default_rng(seed)
+    batch = BatchGame(NUM_GAMES, num_players)
+    base_players = [BasePlayer(str(seat), str(seat), 0) for seat in range(num_players)]
+    games = [Game(base_players) for _ in range(NUM_GAMES)]
+    wins_by_seat = np.zeros((NUM_GAMES, num_players), dtype=np.int32)
+    num_draws = 0
+
+    for _ in range(NUM_STEPS):
+        action_types, cells, targets = random_actions(batch, rng)
+        winners = batch.step(action_types, cells, targets)
+
+        for k, game in enumerate(games):
+            if game.game_state != GameState.IN_PROGRESS:
+                assert action_types[k] == PASS and not winners[k].any()
+                continue
+
+            turn_order = list(game.player_ids)
+            player_id = turn_order[game.current_turn]
+            action = to_action(
+                batch, int(action_types[k]), int(cells[k]), int(targets[k])
+            )
+            if game.execute_action_for_player(player_id, action):
+                round_winners = game.winners[-1]
+                num_draws += len(round_winners) > 1
+                for winner_id in round_winners:
+                    wins_by_seat[k, int(winner_id)] += 1
+                assert sorted(round_winners) == sorted(
+                    turn_order[color] for color in np.flatnonzero(winners[k])
+                )
+            else:
+                assert not winners[k].any()
+
+            assert_same_game(batch, k, game)
+
+    assert (batch.wins_by_seat == wins_by_seat).all()
+    assert batch.rounds_won == sum(len(game.winners) for game in games)
+    assert batch.draws == num_draws
+    return batch
+
+
+@pytest.mark.parametrize("num_players", [2, 3, 4])
+def test_batch_game_plays_like_game(num_players):
+    batch = play_side_by_side(num_players, seed=num_players)
+    assert batch.rounds_won > 0
+    assert batch.finished.any()
+
+
+def test_batch_game_finds_simultaneous_wins():
+    batch = play_side_by_side(4, seed=0)
+    assert batch.draws > 0
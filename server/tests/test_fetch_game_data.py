@@ -0,0 +1,41 @@
+import pytest
+import server
+
+
+@pytest.fixture
+def clients():
+    clients = [server.socketio.test_client(server.app) for _ in range(3)]
+    for i, client in enumerate(clients):
+        client.emit("join_lobby", {"name": f"Player {i}"}, callback=True)
+    yield clients
+    for client in clients:
+        client.disconnect()
+
+
+def get_invalid_requests(client):
+    return [m for m in client.get_received() if m["name"] == "invalid_request"]
+
+
+def test_fetch_game_data(clients):
+    admin, player, spectator = clients
+    room_id = admin.emit("create_room", callback=True)["room_id"]
+    player.emit("join_room", {"room_id": room_id}, callback=True)
+    spectator.emit("spectate_game", {"room_id": room_id}, callback=True)
+
+    # The game has not started, so there is no game to fetch, nor any version for the fetches to be coalesced by
+    for client in clients:
+        for _ in range(2):
+            assert client.emit(
+                "fetch_game_data", {"room_id": room_id}, callback=True
+            ) == {"game": None}
+        assert get_invalid_requests(client) == []
+
+    admin.emit("start_game", {"room_id": room_id})
+    for client in clients:
+        data = client.emit("fetch_game_data", {"room_id": room_id}, callback=True)
+        assert data["game"]["version"] == 0
+        # Repeating the call for the same version only returns the version
+        assert client.emit("fetch_game_data", {"room_id": room_id}, callback=True) == {
+            "version": 0
+        }
+        assert get_invalid_requests(client) == []
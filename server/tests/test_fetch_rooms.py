@@ -0,0 +1,51 @@
+import time
+import pytest
+import server
+from core.base_player import BasePlayer
+from core.game_server import MAX_ROOMS_PAGE_SIZE, ROOMS_PAGE_SIZE
+
+NUM_ROOMS = MAX_ROOMS_PAGE_SIZE + 10
+
+
+@pytest.fixture
+def client():
+    lobby = server.game_server.lobby
+    user_ids = [f"fetch-rooms-{i}" for i in range(NUM_ROOMS)]
+    for user_id in user_ids:
+        lobby.join_lobby(BasePlayer(user_id, user_id, time.time()))
+        lobby.create_new_room(user_id)
+
+    client = server.socketio.test_client(server.app)
+    client.emit("join_lobby", {"name": "Player"}, callback=True)
+    yield client
+    client.disconnect()
+    for user_id in user_ids:
+        lobby.leave_lobby(user_id)
+
+
+def fetch_rooms(client, **data):
+    return client.emit("fetch_rooms", data, callback=True)
+
+
+def test_fetch_rooms_pages(client):
+    # Pages hold ROOMS_PAGE_SIZE rooms by default, and never more than MAX_ROOMS_PAGE_SIZE rooms
+    assert len(fetch_rooms(client)["rooms"]) == ROOMS_PAGE_SIZE
+    assert len(fetch_rooms(client, limit=10**6)["rooms"]) == MAX_ROOMS_PAGE_SIZE
+
+    first = fetch_rooms(client, limit=100)["rooms"]
+    second = fetch_rooms(client, offset=100, limit=100)["rooms"]
+    assert len(first) == len(second) == 100
+    assert not first.keys() & second.keys()
+    assert all(
+        room["id"] in first for room in fetch_rooms(client, limit=10)["rooms"].values()
+    )
+
+
+@pytest.mark.parametrize(
+    "data", [{"limit": 0}, {"limit": "10"}, {"offset": -1}, {"offset": None}]
+)
+def test_fetch_rooms_rejects_invalid_pages(client, data):
+    client.get_received()
+    assert not fetch_rooms(client, **data)
+    messages = [m for m in client.get_received() if m["name"] == "invalid_request"]
+    assert len(messages) == 1
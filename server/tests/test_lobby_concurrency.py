@@ -0,0 +1,145 @@
+import random
+import sys
+import threading
+import time
+import pytest
+from core.base_player import BasePlayer
+from core.lobby import GameLobby
+from four_players_three_in_a_row.game import GameState
+from four_players_three_in_a_row.simulation import get_legal_action_list, to_action
+from four_players_three_in_a_row.utils import Action
+
+NUM_ROOMS = 40
+ROOM_CAPACITY = 4
+NUM_ACTION_THREADS = 8
+NUM_LEAVE_THREADS = 2
+# Number of seconds the threads executing actions keep running after every player left
+RUN_AFTER_LEAVES = 0.2
+
+
+@pytest.fixture
+def fast_thread_switches():
+    # Switch threads as often as possible, so that the threads interleave within lobby and room methods
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def create_lobby() -> GameLobby:
+    lobby = GameLobby("test", ROOM_CAPACITY)
+    for r in range(NUM_ROOMS):
+        user_ids = [f"{r}-{i}" for i in range(ROOM_CAPACITY)]
+        for user_id in user_ids:
+            lobby.join_lobby(BasePlayer(user_id, user_id, time.time()))
+
+        room = lobby.create_new_room(user_ids[0])
+        for user_id in user_ids[1:]:
+            lobby.join_room(user_id, room.room_id)
+        lobby.start_game(room)
+        lobby.update_room_indexes(room)
+    return lobby
+
+
+def execute_actions(lobby, rooms, versions, done, seed):
+    """
+    Plays random actions in random rooms until `done` is set, passing the turns of the players who left like the reaper.
+    """
+    rng = random.Random(seed)
+    while not done.is_set():
+        room = rng.choice(rooms)
+        with room.lock:
+            game = room.game
+            if not room.has_human_players() or game.game_state != GameState.IN_PROGRESS:
+                continue
+
+            player_id = game.player_ids[game.current_turn]
+            if player_id in room.players:
+                action = to_action(rng.choice(get_legal_action_list(game, player_id)))
+                lobby.execute_action(room, player_id, action)
+            else:
+                lobby.execute_action(room, player_id, {"type": Action.PASS}, False)
+            versions[room.room_id].append(game.version)
+
+
+def leave(lobby, user_ids, seed):
+    """
+    Makes every player leave their room, or the lobby altogether, in a random order.
+    """
+    rng = random.Random(seed)
+    rng.shuffle(user_ids)
+    for user_id in user_ids:
+        if rng.random() < 0.5:
+            lobby.leave_lobby(user_id)
+        else:
+            lobby.leave_room(user_id, lobby.all_players[user_id].room_id)
+
+
+def test_concurrent_actions_and_leaves(fast_thread_switches):
+    lobby = create_lobby()
+    rooms = list(lobby.rooms.values())
+    versions = {room.room_id: [room.game.version] for room in rooms}
+    errors = []
+    done = threading.Event()
+
+    def run(target, *args):
+        try:
+            target(*args)
+        except Exception as err:
+            errors.append(err)
+            done.set()
+
+    # All players leave a quarter of the rooms, which are deleted, and some players leave half of the others, which
+    # hands some rooms over to another admin
+    leaving_ids = [
+        f"{r}-{i}"
+        for r in range(NUM_ROOMS)
+        for i in [range(ROOM_CAPACITY), [0, 2], [1], []][r % 4]
+    ]
+
+    action_threads = [
+        threading.Thread(
+            target=run, args=(execute_actions, lobby, rooms, versions, done, i)
+        )
+        for i in range(NUM_ACTION_THREADS)
+    ]
+    leave_threads = [
+        threading.Thread(
+            target=run, args=(leave, lobby, leaving_ids[i::NUM_LEAVE_THREADS], i)
+        )
+        for i in range(NUM_LEAVE_THREADS)
+    ]
+    for thread in action_threads + leave_threads:
+        thread.start()
+    for thread in leave_threads:
+        thread.join()
+    time.sleep(RUN_AFTER_LEAVES)
+    done.set()
+    for thread in action_threads:
+        thread.join()
+
+    assert errors == []
+
+    # Players who left are gone from their rooms, and the rooms and players that remain reference each other
+    for user_id in leaving_ids:
+        player = lobby.all_players.get(user_id)
+        assert player is None or player.room_id is None
+        assert all(user_id not in room.players for room in rooms)
+    for user_id, player in lobby.all_players.items():
+        if player.room_id is not None:
+            assert lobby.rooms[player.room_id].players[user_id] is player
+    for room_id, room in lobby.rooms.items():
+        assert room.has_human_players()
+        assert (room_id in lobby.open_rooms) == room.is_open()
+        for user_id, player in room.players.items():
+            assert lobby.all_players[user_id] is player
+            assert player.room_id == room_id
+    for room in rooms:
+        if room.room_id not in lobby.rooms:
+            assert room.players == {}
+            assert room.room_id not in lobby.open_rooms
+
+    # Every room saw its versions in order, and at least one action beyond the start of the game
+    for room_versions in versions.values():
+        assert all(a < b for a, b in zip(room_versions, room_versions[1:]))
+    assert sum(len(room_versions) > 1 for room_versions in versions.values()) > 0
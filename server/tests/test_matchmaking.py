@@ -0,0 +1,42 @@
+import time
+from core.base_player import BasePlayer
+from core.lobby import GameLobby
+
+ROOM_CAPACITY = 4
+MAX_WAIT = 30.0
+
+
+def create_lobby(num_players: int) -> GameLobby:
+    """
+    Returns a lobby whose players all joined the matchmaking queue at time 0.
+    """
+    lobby = GameLobby("test", ROOM_CAPACITY, matchmaking_max_wait=MAX_WAIT)
+    for i in range(num_players):
+        lobby.join_lobby(BasePlayer(str(i), str(i), time.time()))
+        lobby.matchmaking.enqueue(str(i), 0.0)
+    return lobby
+
+
+def test_full_rooms_are_matched_right_away():
+    lobby = create_lobby(ROOM_CAPACITY + 2)
+    rooms = lobby.run_matchmaking(now=0.0)
+    assert [list(room.players) for room in rooms] == [["0", "1", "2", "3"]]
+    assert rooms[0].game is not None
+    assert list(lobby.matchmaking.waiting) == ["4", "5"]
+
+
+def test_remaining_players_are_matched_after_max_wait():
+    lobby = create_lobby(2)
+    # A time of 0 is a time like any other, and not the current time
+    assert lobby.run_matchmaking(now=0.0) == []
+    assert lobby.run_matchmaking(now=MAX_WAIT - 1) == []
+
+    rooms = lobby.run_matchmaking(now=MAX_WAIT)
+    assert [list(room.players) for room in rooms] == [["0", "1"]]
+    assert len(lobby.matchmaking) == 0
+
+
+def test_single_player_is_never_matched_alone():
+    lobby = create_lobby(1)
+    assert lobby.run_matchmaking(now=MAX_WAIT * 10) == []
+    assert len(lobby.matchmaking) == 1
@@ -0,0 +1,91 @@
+import random
+import pytest
+from core.base_player import BasePlayer
+from four_players_three_in_a_row.board import Board, PackedBoard
+from four_players_three_in_a_row.game import Game, GameState
+from four_players_three_in_a_row.simulation import RandomPolicy
+from four_players_three_in_a_row.utils import COLORS_ARRAY
+
+# Number of seeded games played for each number of players, and number of actions after which a round is restarted
+NUM_GAMES = 50
+MAX_ACTIONS_PER_ROUND = 200
+
+
+def assert_same_board(board: Board, packed_board: PackedBoard) -> None:
+    n = board.grid_dimension
+    for row in range(n):
+        for col in range(n):
+            assert packed_board.value_at(row, col) == board.value_at(row, col)
+            assert packed_board.height(row, col) == board.height(row, col)
+            assert packed_board.top_color(row, col) == board.top_color(row, col)
+    assert packed_board.to_json() == board.to_json()
+
+
+def play_side_by_side(num_players: int, seed: int) -> tuple[int, int]:
+    """
+    Plays random games on a Board and a PackedBoard side by side, with the same actions, and checks after every action
+    that both games are in the same state. Returns the number of rounds won and of rounds won by several players.
+    """
+    rng = random.Random(seed)
+    policy = RandomPolicy(rng)
+    num_wins = num_draws = 0
+    for _ in range(NUM_GAMES):
+        base_players = [BasePlayer(str(i), str(i), 0) for i in range(num_players)]
+        game = Game(base_players, board_class=Board)
+        packed_game = Game(base_players, board_class=PackedBoard)
+
+        round_length = 0
+        while game.game_state == GameState.IN_PROGRESS:
+            player_id = game.player_ids[game.current_turn]
+            action = policy.choose_action(game, player_id)
+            won = game.execute_action_for_player(player_id, action)
+            assert packed_game.execute_action_for_player(player_id, action) == won
+
+            round_length += 1
+            if won:
+                num_wins += 1
+                num_draws += len(game.winners[-1]) > 1
+                round_length = 0
+            elif round_length >= MAX_ACTIONS_PER_ROUND:
+                game.start_new_round()
+                packed_game.start_new_round()
+                round_length = 0
+
+            assert packed_game.winners == game.winners
+            assert packed_game.game_state == game.game_state
+            assert packed_game.player_ids == game.player_ids
+            assert packed_game.current_turn == game.current_turn
+            assert_same_board(game.board, packed_game.board)
+
+        assert packed_game.__json__() == game.__json__()
+
+    return num_wins, num_draws
+
+
+@pytest.mark.parametrize("num_players", [2, 3, 4])
+def test_packed_board_plays_like_board(num_players):
+    num_wins, _ = play_side_by_side(num_players, seed=num_players)
+    assert num_wins > 0
+
+
+def test_packed_board_finds_simultaneous_wins():
+    # Moving a piece uncovers the piece below it, which is read from the packed bits of the cell
+    _, num_draws = play_side_by_side(4, seed=0)
+    assert num_draws > 0
+
+
+def test_packed_board_stacks():
+    board, packed_board = Board(), PackedBoard()
+    red, green, blue, yellow = COLORS_ARRAY
+    for color in [red, green, blue]:
+        board.push(0, 0, color)
+        packed_board.push(0, 0, color)
+        assert_same_board(board, packed_board)
+
+    with pytest.raises(IndexError):
+        packed_board.push(0, 0, yellow)
+    for color in [blue, green, red]:
+        assert packed_board.pop(0, 0) == board.pop(0, 0) == color
+        assert_same_board(board, packed_board)
+    with pytest.raises(IndexError):
+        packed_board.pop(0, 0)
@@ -0,0 +1,96 @@
+import json
+import os
+import random
+from core.base_player import BasePlayer
+from core.lobby import GameLobby
+from core.persistence import SNAPSHOT_FILE, ActionLog, segment_name
+from core.room import Room
+from four_players_three_in_a_row.game import GameState
+from four_players_three_in_a_row.simulation import RandomPolicy
+
+NUM_PLAYERS = 6
+
+
+def play(lobby: GameLobby, room: Room, policy: RandomPolicy, num_actions: int) -> None:
+    """
+    Plays random legal actions in the game of a room, as long as it is in progress.
+    """
+    for _ in range(num_actions):
+        game = room.game
+        if game.game_state != GameState.IN_PROGRESS:
+            return
+        player_id = game.player_ids[game.current_turn]
+        lobby.execute_action(room, player_id, policy.choose_action(game, player_id))
+
+
+def start_room(lobby: GameLobby, admin_id: str, player_id: str) -> Room:
+    room = lobby.create_new_room(admin_id)
+    lobby.join_room(player_id, room.room_id)
+    lobby.start_game_for_room(admin_id, room.room_id)
+    return room
+
+
+def room_snapshots(lobby: GameLobby) -> dict[str, dict]:
+    return {room_id: room.to_snapshot() for room_id, room in lobby.rooms.items()}
+
+
+def test_recover_from_snapshot_and_log_tail(tmp_path):
+    directory = str(tmp_path)
+    log = ActionLog(directory, flush_interval=0)
+    lobby = GameLobby("test", 4, action_log=log)
+    log.recover(lobby)
+    log.start(lobby)
+
+    policy = RandomPolicy(random.Random(0))
+    for i in range(NUM_PLAYERS):
+        lobby.join_lobby(BasePlayer(str(i), str(i), 0, token=f"token-{i}"))
+    first = start_room(lobby, "0", "1")
+    play(lobby, first, policy, 20)
+    log.snapshot(lobby)
+
+    second = start_room(lobby, "2", "3")
+    play(lobby, first, policy, 10)
+    play(lobby, second, policy, 10)
+    # Snapshots include the records appended to the new segment while they were taken, which recovery must skip
+    snapshots = [room.to_snapshot() for room in lobby.rooms.values()]
+
+    play(lobby, first, policy, 10)
+    play(lobby, second, policy, 10)
+    lobby.rejoin_lobby("token-0", "new-0", lambda user_id: False)
+    play(lobby, first, policy, 10)
+    # A room created and deleted after the snapshot
+    lobby.create_new_room("4")
+    lobby.leave_lobby("4")
+    log.close()
+
+    with open(os.path.join(directory, SNAPSHOT_FILE), "w") as file:
+        json.dump({"segment": log.segment, "rooms": snapshots}, file)
+    # A crash cut off the last record
+    with open(os.path.join(directory, segment_name(log.segment)), "a") as file:
+        file.write('{"seq": ')
+
+    recovered = GameLobby("test", 4)
+    num_records = ActionLog(directory).recover(recovered)
+    assert num_records > 0
+    assert room_snapshots(recovered) == room_snapshots(lobby)
+    assert set(recovered.all_players) == {"new-0", "1", "2", "3"}
+    assert recovered.player_tokens == {
+        f"token-{i}": user_id for i, user_id in enumerate(["new-0", "1", "2", "3"])
+    }
+
+
+def test_recover_without_snapshot(tmp_path):
+    directory = str(tmp_path)
+    log = ActionLog(directory, flush_interval=0)
+    lobby = GameLobby("test", 4, action_log=log)
+    log.start(lobby)
+
+    lobby.join_lobby(BasePlayer("0", "0", 0))
+    lobby.join_lobby(BasePlayer("1", "1", 0))
+    room = start_room(lobby, "0", "1")
+    play(lobby, room, RandomPolicy(random.Random(1)), 30)
+    log.close()
+
+    recovered = GameLobby("test", 4)
+    assert ActionLog(directory).recover(recovered) == room.log_seq
+    assert room_snapshots(recovered) == room_snapshots(lobby)
@@ -0,0 +1,103 @@
+import pytest
+from core.rate_limit import FetchCoalescer, RateLimited, RateLimiter, SlowConsumers
+
+# Rate, in events per second, and burst of the limited event of the tests
+RATE = 2.0
+BURST = 4
+LIMITS = {"limited": (RATE, BURST)}
+
+MAX_QUEUED = 10
+
+
+def allowed(limiter: RateLimiter, sid: str, num_events: int, now: float) -> int:
+    """
+    Sends events of a client at the same time, and returns how many of them were allowed.
+    """
+    return sum(limiter.allow(sid, "limited", now=now) for _ in range(num_events))
+
+
+def test_rate_limiter_allows_bursts():
+    limiter = RateLimiter(LIMITS)
+    assert allowed(limiter, "a", BURST + 5, now=0.0) == BURST
+    # Clients and events have their own buckets
+    assert allowed(limiter, "b", BURST + 5, now=0.0) == BURST
+    assert allowed(limiter, "a", 100, now=0.0) == 0
+    assert all(limiter.allow("a", "other", now=0.0) for _ in range(100))
+
+
+def test_rate_limiter_refills():
+    limiter = RateLimiter(LIMITS)
+    allowed(limiter, "a", BURST, now=0.0)
+    assert allowed(limiter, "a", 1, now=0.25) == 0
+    assert allowed(limiter, "a", 1, now=0.5) == 1
+    assert allowed(limiter, "a", 10, now=2.0) == 3
+
+    # Buckets never refill beyond the burst
+    assert allowed(limiter, "a", 10, now=1000.0) == BURST
+
+
+def test_rate_limiter_forgets_clients():
+    # `check` reads the current time, so the bucket must not refill during the test
+    limiter = RateLimiter({"limited": (1e-6, BURST)})
+    for _ in range(BURST):
+        limiter.check("a", "limited")
+    with pytest.raises(RateLimited):
+        limiter.check("a", "limited")
+
+    limiter.forget("a")
+    assert "a" not in limiter.buckets
+    limiter.check("a", "limited")
+
+
+def test_fetch_coalescer_sends_once_per_interval():
+    coalescer = FetchCoalescer(interval=1.0)
+    assert coalescer.should_send("a", "room", 1, now=0.0)
+    assert not coalescer.should_send("a", "room", 1, now=0.5)
+    # Other clients are not coalesced with the first one
+    assert coalescer.should_send("b", "room", 1, now=0.5)
+    assert not coalescer.should_send("a", "room", 1, now=0.99)
+    assert coalescer.should_send("a", "room", 1, now=1.0)
+
+
+def test_fetch_coalescer_sends_new_versions_and_rooms():
+    coalescer = FetchCoalescer(interval=1.0)
+    assert coalescer.should_send("a", "room", 1, now=0.0)
+    assert coalescer.should_send("a", "room", 2, now=0.1)
+    assert not coalescer.should_send("a", "room", 2, now=0.2)
+    assert coalescer.should_send("a", "other", 2, now=0.3)
+    assert coalescer.should_send("a", "room", 2, now=0.4)
+
+    coalescer.forget("a")
+    assert coalescer.should_send("a", "room", 2, now=0.5)
+
+
+def test_slow_consumers_catch_up():
+    slow_consumers = SlowConsumers(MAX_QUEUED)
+    assert not slow_consumers.is_slow(None)
+    assert not slow_consumers.is_slow(MAX_QUEUED)
+    assert slow_consumers.is_slow(MAX_QUEUED + 1)
+
+    queued = {"a": MAX_QUEUED + 1, "b": MAX_QUEUED + 1}
+    slow_consumers.detach("a", "room")
+    slow_consumers.detach("a", "lobby")
+    slow_consumers.detach("b", "room")
+    assert slow_consumers.take_caught_up(queued.get) == []
+
+    # Clients catch up once their queue drained to half of the maximum
+    queued["a"] = MAX_QUEUED // 2 + 1
+    assert slow_consumers.take_caught_up(queued.get) == []
+    queued["a"] = MAX_QUEUED // 2
+    assert slow_consumers.take_caught_up(queued.get) == [("a", {"room", "lobby"})]
+    assert slow_consumers.take_caught_up(queued.get) == []
+
+    # Disconnected clients are dropped without catching up
+    del queued["b"]
+    assert slow_consumers.take_caught_up(queued.get) == []
+    assert not slow_consumers.detached
+
+
+def test_slow_consumers_forget_clients():
+    slow_consumers = SlowConsumers(MAX_QUEUED)
+    slow_consumers.detach("a", "room")
+    slow_consumers.forget("a")
+    assert slow_consumers.take_caught_up(lambda sid: 0) == []
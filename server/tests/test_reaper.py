@@ -0,0 +1,171 @@
+import time
+import pytest
+from core.base_player import BasePlayer
+from core.lobby import GameLobby
+from core.reaper import Reaper
+from core.timer_wheel import TimerWheel
+from four_players_three_in_a_row.game import GameState
+from four_players_three_in_a_row.utils import Action
+
+TURN_TIMEOUT = 60.0
+MAX_MISSED_TURNS = 2
+IDLE_ROOM_TIMEOUT = 600.0
+FINISHED_ROOM_TIMEOUT = 120.0
+PLAYER_SWEEP_INTERVAL = 30.0
+NUM_PLAYERS = 3
+
+
+class Reaped:
+    """
+    Lobby watched by a reaper, whose runs record the rooms whose game or players changed.
+    """
+
+    def __init__(self):
+        self.reaper = Reaper(
+            turn_timeout=TURN_TIMEOUT,
+            max_missed_turns=MAX_MISSED_TURNS,
+            idle_room_timeout=IDLE_ROOM_TIMEOUT,
+            finished_room_timeout=FINISHED_ROOM_TIMEOUT,
+            player_sweep_interval=PLAYER_SWEEP_INTERVAL,
+            wheel=TimerWheel(tick=1.0),
+        )
+        self.lobby = GameLobby("test", 4, reaper=self.reaper)
+        self.connected = {str(i) for i in range(NUM_PLAYERS)}
+        self.actions = []
+        self.changes = []
+        # Timeouts are scheduled at the current monotonic time, from which the tests count time
+        self.start = time.monotonic()
+
+        for user_id in sorted(self.connected):
+            self.lobby.join_lobby(BasePlayer(user_id, user_id, 0))
+        self.room = self.lobby.create_new_room("0")
+        for user_id in sorted(self.connected - {"0"}):
+            self.lobby.join_room(user_id, self.room.room_id)
+
+    def run(self, seconds: float) -> None:
+        self.reaper.run(
+            self.lobby,
+            lambda room: self.actions.append(room.room_id),
+            lambda room_id, user_ids: self.changes.append((room_id, user_ids)),
+            lambda user_id: user_id in self.connected,
+            now=self.start + seconds,
+        )
+
+
+@pytest.fixture
+def reaped():
+    return Reaped()
+
+
+def current_player(reaped: Reaped) -> str:
+    game = reaped.room.game
+    return game.player_ids[game.current_turn]
+
+
+def test_absent_players_pass_then_forfeit(reaped):
+    reaped.lobby.start_game_for_room("0", reaped.room.room_id)
+    game = reaped.room.game
+    absent_player = current_player(reaped)
+
+    reaped.run(TURN_TIMEOUT - 1)
+    assert game.version == 0 and not reaped.actions
+
+    # Every player misses their turn once, and the first one a second time
+    for turn in range(NUM_PLAYERS + 1):
+        reaped.run(TURN_TIMEOUT + 2 * turn + 2)
+        assert game.version == turn + 1
+        assert game.history[-1][1] == {"type": Action.PASS}
+    assert reaped.actions == [reaped.room.room_id] * (NUM_PLAYERS + 1)
+    assert reaped.changes == [(reaped.room.room_id, [absent_player])]
+    assert absent_player not in reaped.room.players
+    assert game.game_state == GameState.IN_PROGRESS
+
+
+def test_taking_a_turn_resets_missed_turns(reaped):
+    reaped.lobby.start_game_for_room("0", reaped.room.room_id)
+    game = reaped.room.game
+    for turn in range(NUM_PLAYERS):
+        reaped.run(TURN_TIMEOUT + 2 * turn + 2)
+
+    player_id = current_player(reaped)
+    action = {"type": Action.PLACE, "num_pieces": 1, "row": 0, "col": 0}
+    reaped.lobby.execute_action(reaped.room, player_id, action)
+    for turn in range(NUM_PLAYERS):
+        reaped.run(TURN_TIMEOUT + 2 * (NUM_PLAYERS + turn) + 2)
+
+    # Only the other players missed two turns in a row
+    assert game.version == 2 * NUM_PLAYERS + 1
+    assert list(reaped.room.players) == [player_id]
+    forfeited = sorted(
+        user_id for _, user_ids in reaped.changes for user_id in user_ids
+    )
+    assert forfeited == sorted({"0", "1", "2"} - {player_id})
+
+
+def test_idle_rooms_expire(reaped):
+    room_id = reaped.room.room_id
+    reaped.run(IDLE_ROOM_TIMEOUT - 1)
+    assert room_id in reaped.lobby.rooms
+
+    reaped.run(IDLE_ROOM_TIMEOUT + 2)
+    assert room_id not in reaped.lobby.rooms
+    assert reaped.changes == [(room_id, ["0", "1", "2"])]
+    assert room_id not in reaped.reaper.timers
+
+
+def test_finished_rooms_expire(reaped):
+    room_id = reaped.room.room_id
+    reaped.lobby.start_game_for_room("0", room_id)
+    reaped.room.game.game_state = GameState.GAME_OVER
+    reaped.reaper.watch(reaped.room)
+
+    # Neither the idle nor the turn timeout applies to a game that is over
+    reaped.run(FINISHED_ROOM_TIMEOUT - 1)
+    assert room_id in reaped.lobby.rooms and not reaped.actions
+
+    reaped.run(FINISHED_ROOM_TIMEOUT + 2)
+    assert room_id not in reaped.lobby.rooms
+    assert reaped.changes == [(room_id, ["0", "1", "2"])]
+
+
+def test_sweep_removes_disconnected_players(reaped):
+    reaped.run(PLAYER_SWEEP_INTERVAL + 2)
+    assert len(reaped.lobby.all_players) == NUM_PLAYERS
+
+    reaped.connected = {"0"}
+    reaped.run(2 * PLAYER_SWEEP_INTERVAL + 2)
+    assert list(reaped.lobby.all_players) == ["0"]
+    assert list(reaped.room.players) == ["0"]
+
+
+def test_sweep_skips_players_who_already_left(reaped):
+    reaped.connected = set()
+
+    # The first player leaving makes the second one leave too, before the sweep gets to it
+    def leave_with_second_player(room_id, user_ids):
+        if "1" in reaped.lobby.all_players:
+            reaped.lobby.leave_lobby("1")
+
+    reaped.reaper.run(
+        reaped.lobby,
+        reaped.actions.append,
+        leave_with_second_player,
+        lambda user_id: user_id in reaped.connected,
+        now=reaped.start + PLAYER_SWEEP_INTERVAL + 2,
+    )
+    assert not reaped.lobby.all_players
+    assert reaped.room.room_id not in reaped.lobby.rooms
+
+
+def test_restored_players_have_time_to_rejoin(reaped):
+    reaped.connected = set()
+    reaped.reaper.expect_rejoin(["0", "1"], now=reaped.start)
+
+    reaped.run(PLAYER_SWEEP_INTERVAL + 2)
+    assert list(reaped.lobby.all_players) == ["0", "1"]
+
+    # Players whose client did not rejoin in time are swept
+    rejoin_timeout = reaped.reaper.rejoin_timeout
+    reaped.run(rejoin_timeout + PLAYER_SWEEP_INTERVAL + 2)
+    assert not reaped.lobby.all_players
+    assert not reaped.reaper.rejoin_deadlines
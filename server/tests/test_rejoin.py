@@ -0,0 +1,124 @@
+import time
+import pytest
+import server
+from core.base_player import BasePlayer
+from core.lobby import GameLobby, PlayerAlreadyInLobby, PlayerNotFound
+from four_players_three_in_a_row.utils import Action
+
+
+def never_connected(user_id: str) -> bool:
+    return False
+
+
+@pytest.fixture
+def lobby():
+    """
+    Lobby with a started game between two players, as restored after a restart, in which the first player placed a
+    piece.
+    """
+    lobby = GameLobby("test", 4)
+    lobby.join_lobby(BasePlayer("old-0", "Player 0", 0, token="token-0"))
+    lobby.join_lobby(BasePlayer("old-1", "Player 1", 0, token="token-1"))
+    room = lobby.create_new_room("old-0")
+    lobby.join_room("old-1", room.room_id)
+    lobby.start_game_for_room("old-0", room.room_id)
+    game = room.game
+    player_id = game.player_ids[game.current_turn]
+    action = {"type": Action.PLACE, "num_pieces": 1, "row": 0, "col": 0}
+    lobby.execute_action(room, player_id, action)
+    return lobby
+
+
+def test_rejoin_renames_player(lobby):
+    room = next(iter(lobby.rooms.values()))
+    game = room.game
+    version = game.version
+    lobby.get_replay(room.room_id, "old-0")
+
+    player = lobby.rejoin_lobby("token-0", "new-0", never_connected)
+    assert player.id == "new-0" and player.room_id == room.room_id
+    assert set(lobby.all_players) == {"new-0", "old-1"}
+    assert lobby.player_tokens == {"token-0": "new-0", "token-1": "old-1"}
+
+    assert list(room.players) == ["new-0", "old-1"]
+    assert room.admin is player
+    assert sorted(game.player_ids) == sorted(game.players) == ["new-0", "old-1"]
+    assert game.players["new-0"].id == "new-0"
+    assert {player_id for player_id, _ in game.history} <= {"new-0", "old-1"}
+    assert "old-0" not in str(room.__json__()) + str(game.__json__())
+    # Every id changed, so clients need a full snapshot of the new version
+    assert game.version == version + 1 and game.get_delta() is None
+    assert "new-0" in lobby.get_replay(room.room_id, "new-0").player_ids()
+
+
+def test_rejoin_requires_known_token(lobby):
+    with pytest.raises(PlayerNotFound):
+        lobby.rejoin_lobby("unknown", "new-0", never_connected)
+
+    lobby.leave_lobby("old-1")
+    with pytest.raises(PlayerNotFound):
+        lobby.rejoin_lobby("token-1", "new-1", never_connected)
+
+
+def test_rejoin_keeps_connected_players(lobby):
+    # A token cannot take a player away from a client that is still connected
+    with pytest.raises(PlayerNotFound):
+        lobby.rejoin_lobby("token-0", "new-0", lambda user_id: user_id == "old-0")
+
+    lobby.join_lobby(BasePlayer("new-0", "Player 0", 0))
+    with pytest.raises(PlayerAlreadyInLobby):
+        lobby.rejoin_lobby("token-0", "new-0", never_connected)
+    assert "old-0" in lobby.all_players
+
+
+@pytest.fixture
+def restored_player():
+    """
+    Player of the lobby of the server, as restored after a restart, whose client is no longer connected.
+    """
+    lobby = server.game_server.lobby
+    player = BasePlayer("restored", "Restored", time.time(), token="restored-token")
+    lobby.join_lobby(player)
+    lobby.create_new_room(player.id)
+    yield player
+    if player.id in lobby.all_players:
+        lobby.leave_lobby(player.id)
+
+
+def test_join_lobby_returns_token():
+    clients = [server.socketio.test_client(server.app) for _ in range(2)]
+    tokens = [
+        client.emit("join_lobby", {"name": "Player"}, callback=True)["token"]
+        for client in clients
+    ]
+    assert len(set(tokens)) == 2 and all(tokens)
+    # Tokens are never sent to other clients
+    for client in clients:
+        assert not any(token in str(client.get_received()) for token in tokens)
+        client.disconnect()
+
+
+def test_rejoin_binds_player_to_connection(restored_player):
+    client = server.socketio.test_client(server.app)
+    client.get_received()
+    data = client.emit("rejoin", {"token": "restored-token"}, callback=True)
+    room_id = data["player"]["room_id"]
+    assert data["player"]["id"] == restored_player.id != "restored"
+    assert data["token"] == "restored-token"
+    assert room_id in data["rooms"]
+
+    # The client plays as the player, e.g. leaving their room
+    client.emit("leave_room", {"room_id": room_id}, callback=True)
+    assert room_id not in server.game_server.lobby.rooms
+    assert not [m for m in client.get_received() if m["name"] == "invalid_request"]
+    client.disconnect()
+    assert restored_player.id not in server.game_server.lobby.all_players
+
+
+def test_rejoin_rejects_unknown_token():
+    client = server.socketio.test_client(server.app)
+    for data in [{"token": "unknown"}, {"token": None}]:
+        assert not client.emit("rejoin", data, callback=True)
+    messages = [m for m in client.get_received() if m["name"] == "invalid_request"]
+    assert len(messages) == 2
+    client.disconnect()
@@ -0,0 +1,71 @@
+import json
+import pytest
+from core.state_store import InMemoryStateStore, SQLiteStateStore
+
+# Number of rooms saved to the store, every third of which can still be joined
+NUM_ROOMS = 30
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryStateStore()
+    return SQLiteStateStore(str(tmp_path / "rooms.db"))
+
+
+def save_rooms(store, shard: int, room_ids) -> None:
+    for room_id in room_ids:
+        i = int(room_id.split("-")[1])
+        data = json.dumps({"id": room_id}).encode()
+        store.save_room(room_id, shard, float(i), i % 3 == 0, data)
+
+
+def listed_ids(store, **kwargs):
+    return [room["id"] for room in store.list_rooms(**kwargs)]
+
+
+def test_list_rooms_pages(store):
+    room_ids = [f"room-{i}" for i in range(NUM_ROOMS)]
+    save_rooms(store, 0, room_ids)
+    open_ids = room_ids[::3]
+
+    assert listed_ids(store) == room_ids
+    assert listed_ids(store, offset=5, limit=10) == room_ids[5:15]
+    assert listed_ids(store, offset=NUM_ROOMS) == []
+    assert listed_ids(store, only_open=True) == open_ids
+    assert listed_ids(store, only_open=True, offset=2, limit=3) == open_ids[2:5]
+
+    # Saving a room again updates it in place
+    store.save_room("room-1", 0, 1.0, True, json.dumps({"id": "room-1"}).encode())
+    assert listed_ids(store, only_open=True, limit=3) == ["room-0", "room-1", "room-3"]
+    assert listed_ids(store) == room_ids
+
+
+def test_room_shards(store):
+    for i in range(4):
+        save_rooms(store, i % 2, [f"room-{i}"])
+    assert store.get_room_shard("room-0") == 0
+    assert store.get_room_shard("room-3") == 1
+    assert store.get_room_shard("room-4") is None
+
+    store.delete_room("room-0")
+    store.delete_room("room-4")
+    assert store.get_room_shard("room-0") is None
+    assert listed_ids(store) == ["room-1", "room-2", "room-3"]
+
+    store.delete_shard(1)
+    assert listed_ids(store) == ["room-2"]
+    assert store.get_room_shard("room-1") is None
+
+
+def test_sqlite_store_is_shared(tmp_path):
+    # Every worker opens the same file, and a restarted worker clears the rooms it left behind
+    path = str(tmp_path / "rooms.db")
+    first, second = SQLiteStateStore(path), SQLiteStateStore(path)
+    save_rooms(first, 0, ["room-0", "room-2"])
+    save_rooms(second, 1, ["room-1"])
+    assert listed_ids(first) == listed_ids(second) == ["room-0", "room-1", "room-2"]
+    assert second.get_room_shard("room-2") == 0
+
+    SQLiteStateStore(path).delete_shard(0)
+    assert listed_ids(second) == ["room-1"]
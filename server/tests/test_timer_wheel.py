@@ -0,0 +1,74 @@
+import pytest
+from core.timer_wheel import TimerWheel
+
+# Number of buckets of the wheels under test, small enough that timers are often due in later rotations
+NUM_SLOTS = 8
+
+
+@pytest.fixture
+def wheel():
+    return TimerWheel(tick=1.0, num_slots=NUM_SLOTS)
+
+
+def start(wheel: TimerWheel) -> float:
+    """
+    Returns the time of the last tick of a new wheel, from which the tests count time.
+    """
+    return wheel.current * wheel.tick
+
+
+def test_timers_expire_after_their_delay(wheel):
+    now = start(wheel)
+    wheel.schedule(3, "a", now=now)
+    wheel.schedule(1, "b", now=now)
+    wheel.schedule(1.5, "c", now=now)
+    assert len(wheel) == 3
+
+    assert wheel.advance(now + 0.5) == []
+    assert wheel.advance(now + 1) == ["b"]
+    # Timers expire on the first tick at or after their deadline
+    assert wheel.advance(now + 2.9) == ["c"]
+    assert wheel.advance(now + 3) == ["a"]
+    assert wheel.advance(now + 100) == []
+    assert len(wheel) == 0
+
+
+def test_cancelled_timers_never_expire(wheel):
+    now = start(wheel)
+    timer = wheel.schedule(2, "a", now=now)
+    wheel.schedule(2, "b", now=now)
+    wheel.cancel(timer)
+    wheel.cancel(timer)
+    assert wheel.advance(now + 5) == ["b"]
+
+
+def test_timers_due_in_later_rotations(wheel):
+    now = start(wheel)
+    # Every timer lands in the same bucket, one rotation apart
+    for rotation in range(4):
+        wheel.schedule(rotation * NUM_SLOTS + 2, rotation, now=now)
+
+    for rotation in range(4):
+        deadline = now + rotation * NUM_SLOTS + 2
+        assert wheel.advance(deadline - 1) == []
+        assert wheel.advance(deadline) == [rotation]
+
+
+def test_advancing_past_several_rotations(wheel):
+    now = start(wheel)
+    delays = [1, 5, NUM_SLOTS + 3, 3 * NUM_SLOTS]
+    for delay in delays:
+        wheel.schedule(delay, delay, now=now)
+    wheel.schedule(10 * NUM_SLOTS, "later", now=now)
+
+    # A jump of several rotations visits every bucket once, expiring every timer that is due
+    assert sorted(wheel.advance(now + 5 * NUM_SLOTS)) == delays
+    assert wheel.advance(now + 10 * NUM_SLOTS) == ["later"]
+
+
+def test_timers_in_the_past_expire_on_the_next_tick(wheel):
+    now = start(wheel)
+    wheel.advance(now + 10)
+    wheel.schedule(0, "a", now=now)
+    assert wheel.advance(now + 10) == []
+    assert wheel.advance(now + 11) == ["a"]
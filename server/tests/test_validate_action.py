@@ -0,0 +1,173 @@
+import random
+import pytest
+from core.base_player import BasePlayer
+from core.lobby import GameLobby
+from four_players_three_in_a_row.game import (
+    Game,
+    GameNotInProgress,
+    GameState,
+    InvalidAction,
+    NotPlayersTurn,
+)
+from four_players_three_in_a_row.utils import GRID_DIMENSION, Action
+
+# Number of seeded random states in which legal_actions is compared to validate_action
+NUM_STATES = 200
+
+
+def place(row: int, col: int, num_pieces: int = 1) -> dict:
+    return {"type": Action.PLACE, "num_pieces": num_pieces, "row": row, "col": col}
+
+
+def move(from_row: int, from_col: int, to_row: int, to_col: int) -> dict:
+    return {
+        "type": Action.MOVE,
+        "from_row": from_row,
+        "from_col": from_col,
+        "to_row": to_row,
+        "to_col": to_col,
+    }
+
+
+def current_player(game: Game) -> str:
+    return game.player_ids[game.current_turn]
+
+
+def is_legal(game: Game, player_id: str, action: dict) -> bool:
+    try:
+        game.validate_action(player_id, action)
+        return True
+    except (InvalidAction, NotPlayersTurn, GameNotInProgress):
+        return False
+
+
+@pytest.fixture
+def game():
+    """
+    Two player game in which the first player placed a piece on (0, 0) and the second player placed three pieces on
+    (1, 1), so that it is the turn of the first player again.
+    """
+    game = Game([BasePlayer(str(i), str(i), 0) for i in range(2)])
+    game.execute_action_for_player(current_player(game), place(0, 0))
+    game.execute_action_for_player(current_player(game), place(1, 1, 3))
+    return game
+
+
+def test_wrong_turn(game):
+    other_player = game.player_ids[1 - game.current_turn]
+    with pytest.raises(NotPlayersTurn):
+        game.validate_action(other_player, place(2, 2))
+    assert all(
+        action == Action.IMPOSSIBLE
+        for row in game.legal_actions(other_player)
+        for action in row
+    )
+
+
+def test_opponents_stack(game):
+    game.execute_action_for_player(current_player(game), place(3, 3))
+    # The first player's piece on (0, 0) is not the second player's to move
+    with pytest.raises(InvalidAction):
+        game.validate_action(current_player(game), move(0, 0, 0, 1))
+    assert game.legal_actions(current_player(game))[0][0] == Action.PLACE
+
+
+@pytest.mark.parametrize(
+    "action",
+    [
+        place(GRID_DIMENSION, 0),
+        place(0, -1),
+        place(True, 0),
+        move(0, 0, -1, 0),
+        move(0, 0, 0, GRID_DIMENSION),
+        move(GRID_DIMENSION, 0, 0, 0),
+    ],
+)
+def test_out_of_bounds(game, action):
+    with pytest.raises(InvalidAction):
+        game.validate_action(current_player(game), action)
+
+
+@pytest.mark.parametrize("action", [place(1, 1), move(0, 0, 1, 1), place(0, 0, 3)])
+def test_full_cell(game, action):
+    with pytest.raises(InvalidAction):
+        game.validate_action(current_player(game), action)
+    assert game.legal_actions(current_player(game))[1][1] == Action.IMPOSSIBLE
+
+
+@pytest.mark.parametrize("num_pieces", [0, -1, 5, "1", 1.0, True, None])
+def test_bad_num_pieces(game, num_pieces):
+    # The first player has 4 pieces left
+    with pytest.raises(InvalidAction):
+        game.validate_action(current_player(game), place(2, 2, num_pieces))
+
+
+@pytest.mark.parametrize(
+    "action",
+    [
+        place(1, 1),
+        place(2, 2, 0),
+        move(0, 0, 2, 2),
+        {"type": Action.PASS},
+        {"type": "JUMP"},
+    ],
+)
+def test_rejected_actions_leave_game_unchanged(game, action):
+    player_id = current_player(game)
+    before = game.to_snapshot()
+    version = game.version
+    with pytest.raises(InvalidAction):
+        game.execute_action_for_player(player_id, action)
+    assert game.to_snapshot() == before
+    assert game.version == version
+    assert current_player(game) == player_id
+
+
+def test_game_over():
+    game = Game([BasePlayer(str(i), str(i), 0) for i in range(2)])
+    game.game_state = GameState.GAME_OVER
+    with pytest.raises(GameNotInProgress):
+        game.validate_action(current_player(game), place(0, 0))
+
+
+def test_lobby_rejects_actions_before_game_starts():
+    lobby = GameLobby("test", 4)
+    lobby.join_lobby(BasePlayer("admin", "admin", 0))
+    room = lobby.create_new_room("admin")
+    with pytest.raises(GameNotInProgress):
+        lobby.execute_action(room, "admin", place(0, 0))
+
+
+def test_legal_actions_match_validate_action():
+    rng = random.Random(0)
+    game = Game([BasePlayer(str(i), str(i), 0) for i in range(3)])
+    cells = [
+        (row, col) for row in range(GRID_DIMENSION) for col in range(GRID_DIMENSION)
+    ]
+    for _ in range(NUM_STATES):
+        player_id = current_player(game)
+        legal_actions = game.legal_actions(player_id)
+        legal = []
+        for row, col in cells:
+            can_place = is_legal(game, player_id, place(row, col))
+            moves = [
+                move(row, col, to_row, to_col)
+                for to_row, to_col in cells
+                if is_legal(game, player_id, move(row, col, to_row, to_col))
+            ]
+            expected = {
+                (True, True): Action.PLACE_OR_MOVE,
+                (True, False): Action.PLACE,
+                (False, True): Action.MOVE,
+                (False, False): Action.IMPOSSIBLE,
+            }[(can_place, bool(moves))]
+            assert legal_actions[row][col] == expected
+            legal += [place(row, col)] if can_place else []
+            legal += moves
+
+        assert is_legal(game, player_id, {"type": Action.PASS}) == (not legal)
+        game.execute_action_for_player(
+            player_id, rng.choice(legal) if legal else {"type": Action.PASS}
+        )
+        if game.game_state == GameState.GAME_OVER:
+            game = Game([BasePlayer(str(i), str(i), 0) for i in range(3)])
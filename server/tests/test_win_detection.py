@@ -0,0 +1,93 @@
+import random
+import pytest
+from core.base_player import BasePlayer
+from four_players_three_in_a_row.game import Game, GameState
+from four_players_three_in_a_row.utils import GRID_DIMENSION, Action, PossibleActions
+
+# Number of seeded games played for each number of players, and number of actions after which a round is restarted
+NUM_GAMES = 100
+MAX_ACTIONS_PER_ROUND = 200
+
+
+def get_random_action(
+    rng: random.Random, game: Game, player_id: str
+) -> PossibleActions | None:
+    """
+    Returns a random action of a player, i.e. placing some of their pieces on a cell that is not full or moving their
+    piece on top of a cell to a neighboring cell that is not full, or None if the player cannot act.
+    """
+    player = game.players[player_id]
+    cells = [
+        (row, col) for row in range(GRID_DIMENSION) for col in range(GRID_DIMENSION)
+    ]
+    actions: list[PossibleActions] = []
+    for row, col in cells:
+        cell = game.board.value_at(row, col)
+        for num_pieces in range(1, min(player.num_pieces, 3 - len(cell)) + 1):
+            actions.append(
+                {"type": Action.PLACE, "num_pieces": num_pieces, "row": row, "col": col}
+            )
+
+        if cell and cell[-1] == player.color:
+            for to_row, to_col in cells:
+                if (
+                    max(abs(to_row - row), abs(to_col - col)) == 1
+                    and len(game.board.value_at(to_row, to_col)) < 3
+                ):
+                    actions.append(
+                        {
+                            "type": Action.MOVE,
+                            "from_row": row,
+                            "from_col": col,
+                            "to_row": to_row,
+                            "to_col": to_col,
+                        }
+                    )
+
+    return rng.choice(actions) if actions else None
+
+
+def play_checked_games(num_players: int, seed: int) -> tuple[int, int]:
+    """
+    Plays random games in which every incremental win check, i.e. with the changed cells of an action, is compared to
+    a scan of the whole board, and returns the number of checks and of rounds won by several players at once.
+    """
+    rng = random.Random(seed)
+    num_checks = num_draws = 0
+    for _ in range(NUM_GAMES):
+        game = Game([BasePlayer(str(i), str(i), 0) for i in range(num_players)])
+
+        def maybe_players_won(changed_coordinates=None):
+            nonlocal num_checks
+            winners = Game.maybe_players_won(game, changed_coordinates)
+            if changed_coordinates is not None:
+                assert winners == Game.maybe_players_won(game), game.board.grid
+                num_checks += 1
+            return winners
+
+        game.maybe_players_won = maybe_players_won
+        round_length = 0
+        while game.game_state == GameState.IN_PROGRESS:
+            player_id = game.player_ids[game.current_turn]
+            action = get_random_action(rng, game, player_id)
+            round_length += 1
+            if action is not None and game.execute_action_for_player(player_id, action):
+                num_draws += len(game.winners[-1]) > 1
+                round_length = 0
+            elif action is None or round_length >= MAX_ACTIONS_PER_ROUND:
+                game.start_new_round()
+                round_length = 0
+
+    return num_checks, num_draws
+
+
+@pytest.mark.parametrize("num_players", [2, 3, 4])
+def test_incremental_win_check_matches_full_scan(num_players):
+    num_checks, _ = play_checked_games(num_players, seed=num_players)
+    assert num_checks > 0
+
+
+def test_incremental_win_check_finds_simultaneous_wins():
+    # A move uncovers the piece below it, which may complete a line of another player in the same action
+    _, num_draws = play_checked_games(4, seed=0)
+    assert num_draws > 0
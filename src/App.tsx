@@ -26,16 +26,23 @@ import { LoadingOverlay, PageCentered } from './Shared';
  */
 
 type ListenEvents = {
-  join_lobby: (data: { rooms: any; players: Array<any> }) => void;
+  room_added: (data: { room: Room }) => void;
+  room_updated: (data: { room: Room }) => void;
+  room_removed: (data: { room_id: string }) => void;
+  rooms_updated: (data: { rooms: Room[] }) => void;
+  rooms_snapshot: (data: { rooms: Record<string, Room> }) => void;
+  matched: (data: { room_id: string }) => void;
 };
 
 type EmitEvents = {
   join_lobby: string;
+  rejoin: string;
 };
 
 export type BasePlayer = {
   id: string;
   name: string;
+  is_bot: boolean;
 };
 export type Room = {
   id: string;
@@ -51,6 +58,13 @@ type UserInfo = {
   name: string;
 };
 
+type JoinResponse = {
+  player: BasePlayer & { room_id: string | null };
+  rooms: Record<string, Room>;
+  // Secret with which the client rejoins as the same player from a new connection
+  token: string;
+};
+
 enum NavigationState {
   INACTIVE = 1,
   LOBBY = 2,
@@ -104,9 +118,14 @@ const LobbyAndGameWrapper = ({
     handleNavigationState(NavigationState.GAME);
   };
 
+  const handleAddBot = (roomId: string) => {
+    socketInstance.emit('add_bot', { room_id: roomId });
+  };
+
   const handleLeaveLobby = () => {
     handleNavigationState(NavigationState.INACTIVE);
     handleSelectRoomId(null);
+    sessionStorage.removeItem('player_token');
     socketInstance.emit('leave_lobby');
     socketInstance.disconnect();
   };
@@ -121,6 +140,7 @@ const LobbyAndGameWrapper = ({
         handleJoinRoom={handleJoinRoom}
         handleLeaveRoom={handleLeaveRoom}
         handleStartGame={handleStartGame}
+        handleAddBot={handleAddBot}
         handleLeaveLobby={handleLeaveLobby}
       />
     );
@@ -156,6 +176,62 @@ function App() {
   const [loading, setLoading] = React.useState(false);
   const [rooms, setRooms] = React.useState<Record<string, Room>>({});
 
+  const handleJoined = (resp: JoinResponse) => {
+    setLoading(false);
+    // Kept per tab, so that every tab plays its own player
+    sessionStorage.setItem('player_token', resp.token);
+    setRooms(resp.rooms);
+    setUserInfo({
+      name: resp.player.name,
+      id: resp.player.id,
+    });
+    setSelectedRoomId(resp.player.room_id);
+    setNavigationState(
+      resp.player.room_id && resp.rooms[resp.player.room_id]?.is_game_started
+        ? NavigationState.GAME
+        : NavigationState.LOBBY
+    );
+  };
+
+  const joinLobby = (
+    socket: Socket<
+      DefaultEventsMap & ListenEvents,
+      DefaultEventsMap & EmitEvents
+    >
+  ) =>
+    socket
+      .timeout(5000)
+      .emitWithAck('join_lobby', {
+        name: username,
+      })
+      .then(handleJoined);
+
+  // Every reconnection is a new connection, e.g. to a server that restarted and restored its rooms. The client
+  // rejoins as the same player, keeping its room and game, or joins as a new player if the server no longer knows
+  // the player.
+  const rejoinLobby = async (
+    socket: Socket<
+      DefaultEventsMap & ListenEvents,
+      DefaultEventsMap & EmitEvents
+    >
+  ) => {
+    const token = sessionStorage.getItem('player_token');
+    const resp = token
+      ? await socket
+          .timeout(5000)
+          .emitWithAck('rejoin', { token })
+          .catch(() => null)
+      : null;
+
+    if (resp) {
+      handleJoined(resp);
+    } else {
+      sessionStorage.removeItem('player_token');
+      setSelectedRoomId(null);
+      await joinLobby(socket);
+    }
+  };
+
   const handleJoinLobby = async () => {
     if ((!socketInstance || !socketInstance.connected) && !!username?.trim()) {
       setLoading(true);
@@ -175,57 +251,60 @@ function App() {
         setSocketInstance(socket);
       }
 
-      if (!socket.hasListeners('joined_lobby')) {
-        socket.on('joined_lobby', (data) => {
-          setRooms(data.rooms);
+      if (!socket.hasListeners('room_added')) {
+        socket.on('room_added', (data: { room: Room }) => {
+          setRooms((prev) => ({ ...prev, [data.room.id]: data.room }));
         });
       }
 
-      if (!socket.hasListeners('joined_room')) {
-        socket.on('joined_room', (data) => {
-          setRooms(data.rooms);
+      if (!socket.hasListeners('room_updated')) {
+        socket.on('room_updated', (data: { room: Room }) => {
+          setRooms((prev) => ({ ...prev, [data.room.id]: data.room }));
         });
       }
 
-      if (!socket.hasListeners('left_room')) {
-        socket.on('left_room', (data) => {
-          setRooms(data.rooms);
+      if (!socket.hasListeners('rooms_updated')) {
+        socket.on('rooms_updated', (data: { rooms: Room[] }) => {
+          setRooms((prev) => {
+            const next = { ...prev };
+            for (const room of data.rooms) {
+              next[room.id] = room;
+            }
+            return next;
+          });
         });
       }
 
-      if (!socket.hasListeners('created_room')) {
-        socket.on('created_room', (data) => {
+      // Sent instead of the updates missed while the connection was too slow to receive them
+      if (!socket.hasListeners('rooms_snapshot')) {
+        socket.on('rooms_snapshot', (data: { rooms: Record<string, Room> }) => {
           setRooms(data.rooms);
         });
       }
 
-      if (!socket.hasListeners('left_lobby')) {
-        socket.on('left_lobby', (data) => {
-          setRooms(data.rooms);
+      if (!socket.hasListeners('matched')) {
+        socket.on('matched', (data: { room_id: string }) => {
+          setSelectedRoomId(data.room_id);
         });
       }
 
-      if (!socket.hasListeners('started_game')) {
-        socket.on('started_game', (data) => {
-          setRooms(data.rooms);
+      if (!socket.hasListeners('room_removed')) {
+        socket.on('room_removed', (data: { room_id: string }) => {
+          setRooms((prev) => {
+            const { [data.room_id]: _, ...rest } = prev;
+            return rest;
+          });
         });
       }
 
+      if (!socket.io.hasListeners('reconnect')) {
+        const reconnectingSocket = socket;
+        socket.io.on('reconnect', () => rejoinLobby(reconnectingSocket));
+      }
+
       socket.connect();
 
-      socket
-        .timeout(5000)
-        .emitWithAck('join_lobby', {
-          name: username,
-        })
-        .then((resp) => {
-          setLoading(false);
-          setUserInfo({
-            name: resp.player.name,
-            id: resp.player.id,
-          });
-          setNavigationState(NavigationState.LOBBY);
-        });
+      joinLobby(socket);
     }
   };
 
@@ -1,9 +1,17 @@
 import React from 'react';
-import { Flex, Text } from '@mantine/core';
+import { Button, Flex, Text } from '@mantine/core';
 import type { Socket } from 'socket.io-client';
 import type { DefaultEventsMap } from 'socket.io/dist/typed-events';
-import { getAvailableActionsForPlayer } from '../utils/actions';
-import { SelectedPiece, IGame } from '../utils/game';
+import {
+  getAvailableActionsForPlayer,
+  hasAvailableActions,
+} from '../utils/actions';
+import {
+  SelectedPiece,
+  IGame,
+  GameDelta,
+  applyGameDelta,
+} from '../utils/game';
 import { LoadingState } from '../Shared';
 import { UnplacedPiece } from '../Piece/UnplacedPiece';
 import { Scoreboard } from './Scoreboard';
@@ -35,6 +43,7 @@ const Game = ({ game, playerOrder, socket, roomId, userId }: GameProps) => {
     players,
     current_turn: currentTurn,
     winners,
+    action_grid: actionGrid,
   } = game;
 
   const currentPlayerId = playerIds[currentTurn];
@@ -45,11 +54,12 @@ const Game = ({ game, playerOrder, socket, roomId, userId }: GameProps) => {
     () =>
       getAvailableActionsForPlayer(
         board,
+        actionGrid,
         selectedPiece,
         isUsersTurn,
         usersPlayer
       ),
-    [board, usersPlayer, isUsersTurn, selectedPiece]
+    [board, actionGrid, usersPlayer, isUsersTurn, selectedPiece]
   );
 
   const handleAction = (row: number, col: number) => {
@@ -77,6 +87,14 @@ const Game = ({ game, playerOrder, socket, roomId, userId }: GameProps) => {
     }
   };
 
+  const handlePass = () => {
+    socket.emit('handle_pass_action', {
+      user_id: userId,
+      room_id: roomId,
+    });
+    setSelectedPiece(null);
+  };
+
   const renderRemainingPieces = () => {
     return (
       <Flex gap="sm" direction="column">
@@ -129,6 +147,9 @@ const Game = ({ game, playerOrder, socket, roomId, userId }: GameProps) => {
           handleSelectedPiece={(p) => setSelectedPiece(p)}
         />
         {renderRemainingPieces()}
+        {isUsersTurn && !hasAvailableActions(actionGrid) && (
+          <Button onClick={handlePass}>No available moves, pass turn</Button>
+        )}
       </Flex>
 
       <Scoreboard
@@ -147,7 +168,9 @@ export const GameWrapper = ({
   userId,
 }: GameWrapperProps) => {
   const [game, setGame] = React.useState<IGame | null>(null);
+  const gameRef = React.useRef<IGame | null>(null); // Latest game, read by the socket listeners
   const initialPlayerOrder = React.useRef<string[]>([]); // Keeps track of the original player IDs around the board
+  const isFetching = React.useRef(false); // Whether a snapshot was requested and not received yet
 
   React.useEffect(() => {
     // Fetch game data on mount
@@ -158,6 +181,12 @@ export const GameWrapper = ({
           room_id: roomId,
         });
 
+      // Repeated requests only return the version of the snapshot already received
+      if (!response.game) {
+        return;
+      }
+
+      gameRef.current = response.game;
       setGame(response.game);
 
       // Order the player order such that the current user is always the "first" player
@@ -173,9 +202,37 @@ export const GameWrapper = ({
   React.useEffect(() => {
     if (!socket.hasListeners('send_game_data')) {
       socket.on('send_game_data', (data) => {
+        gameRef.current = data.game;
         setGame(data.game);
       });
     }
+
+    if (!socket.hasListeners('send_game_delta')) {
+      socket.on('send_game_delta', (data: { delta: GameDelta }) => {
+        const nextGame = gameRef.current
+          ? applyGameDelta(gameRef.current, data.delta)
+          : null;
+
+        if (nextGame) {
+          gameRef.current = nextGame;
+          setGame(nextGame);
+        } else if (!isFetching.current) {
+          // Out of sync with the server, so request a full snapshot, once until it is received
+          isFetching.current = true;
+          socket.emit(
+            'fetch_game_data',
+            { room_id: roomId },
+            (response: { game?: IGame }) => {
+              isFetching.current = false;
+              if (response?.game) {
+                gameRef.current = response.game;
+                setGame(response.game);
+              }
+            }
+          );
+        }
+      });
+    }
   }, [socket, userId]);
 
   if (!game) {
@@ -11,6 +11,7 @@ type Props = {
   handleJoinRoom: (roomId: string) => void;
   handleLeaveRoom: (roomId: string) => void;
   handleStartGame: (roomId: string) => void;
+  handleAddBot: (roomId: string) => void;
   handleLeaveLobby: () => void;
 };
 
@@ -22,6 +23,7 @@ export const Lobby = ({
   handleJoinRoom,
   handleLeaveRoom,
   handleStartGame,
+  handleAddBot,
   handleLeaveLobby,
 }: Props) => {
   const renderActionButtons = () => {
@@ -54,12 +56,20 @@ export const Lobby = ({
     }
 
     return (
-      <Button
-        disabled={!selectedRoom.can_start_game}
-        onClick={() => handleStartGame(selectedRoom.id)}
-      >
-        Start game
-      </Button>
+      <Flex gap="sm">
+        <Button
+          disabled={selectedRoom.is_full_capacity}
+          onClick={() => handleAddBot(selectedRoom.id)}
+        >
+          Add bot
+        </Button>
+        <Button
+          disabled={!selectedRoom.can_start_game}
+          onClick={() => handleStartGame(selectedRoom.id)}
+        >
+          Start game
+        </Button>
+      </Flex>
     );
   };
 
@@ -1,5 +1,11 @@
 import { CoordinateSet } from '../Shared';
-import { Board, GRID_DIMENSION, Player, SelectedPiece } from '../utils/game';
+import {
+  ActionGrid,
+  Board,
+  GRID_DIMENSION,
+  Player,
+  SelectedPiece,
+} from '../utils/game';
 
 const isInBounds = (row: number, col: number): boolean => {
   return 0 <= row && row < GRID_DIMENSION && 0 <= col && col < GRID_DIMENSION;
@@ -34,8 +40,12 @@ const getAvailableMovesForPiece = (
   return coordinates;
 };
 
+export const hasAvailableActions = (actionGrid: ActionGrid): boolean =>
+  actionGrid.some((row) => row.some((action) => action !== 'IMPOSSIBLE'));
+
 export const getAvailableActionsForPlayer = (
   board: Board,
+  actionGrid: ActionGrid,
   selectedPiece: SelectedPiece | null,
   isUsersTurn: boolean,
   usersPlayer: Player
@@ -45,13 +55,13 @@ export const getAvailableActionsForPlayer = (
   }
 
   if (!selectedPiece) {
-    // Find the initial pieces that we can select
+    // Find the initial pieces that we can select, as computed by the server
     const res = new CoordinateSet();
     for (let i = 0; i < GRID_DIMENSION; i++) {
       for (let j = 0; j < GRID_DIMENSION; j++) {
-        const cell = board[i][j];
+        const action = actionGrid[i][j];
 
-        if (cell.length > 0 && cell[cell.length - 1] === usersPlayer.color) {
+        if (action === 'MOVE' || action === 'PLACE_OR_MOVE') {
           res.add(i, j);
         }
       }
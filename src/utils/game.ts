@@ -4,11 +4,17 @@ export const GRID_DIMENSION = 4;
 
 export type Board = Color[][][];
 
+export type CellAction = 'PLACE' | 'MOVE' | 'PLACE_OR_MOVE' | 'IMPOSSIBLE';
+
+// Actions available on each cell to the player whose turn it is, computed by the server
+export type ActionGrid = CellAction[][];
+
 export type Player = {
   id: string;
   name: string;
   color: Color;
   created_at: number;
+  is_bot: boolean;
   num_pieces: number;
 };
 
@@ -31,4 +37,47 @@ export type IGame = {
   players: Record<string, Player>;
   current_turn: number;
   current_round: number;
+  version: number;
+  action_grid: ActionGrid;
+};
+
+export type GameDelta = {
+  base_version: number;
+  version: number;
+  cells: { row: number; col: number; stack: Color[] }[];
+  current_turn: number;
+  num_pieces: Record<string, number>;
+  action_grid: ActionGrid;
+};
+
+/**
+ * Applies a delta sent by the server to a game, or returns null if the game is not at the delta's base version and a
+ * full snapshot must be fetched instead.
+ */
+export const applyGameDelta = (
+  game: IGame,
+  delta: GameDelta
+): IGame | null => {
+  if (game.version !== delta.base_version) {
+    return null;
+  }
+
+  const board = game.board.map((row) => row.slice());
+  for (const { row, col, stack } of delta.cells) {
+    board[row][col] = stack;
+  }
+
+  const players = { ...game.players };
+  for (const [id, numPieces] of Object.entries(delta.num_pieces)) {
+    players[id] = { ...players[id], num_pieces: numPieces };
+  }
+
+  return {
+    ...game,
+    board,
+    players,
+    current_turn: delta.current_turn,
+    version: delta.version,
+    action_grid: delta.action_grid,
+  };
 };